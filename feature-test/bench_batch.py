@@ -0,0 +1,51 @@
+"""Throughput of convert_many() and parallel single-document convert().
+
+Converts the bundled long documents many times over, serially and on a
+ConversionPool (pool start-up and warm-up excluded), then converts all of them
+joined into one multi-megabyte document.
+Run from the repository root: ``python feature-test/bench_batch.py [workers]``
+"""
+
+import os
+import pathlib
+import sys
+import time
+
+from telegramify_markdown import ConversionPool, convert
+
+ROOT = pathlib.Path(__file__).parent.parent
+SAMPLES = [ROOT / "tests" / "exp1.md", ROOT / "tests" / "exp2.md", ROOT / "playground" / "t_longtext.md"]
+COPIES = 200
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    documents = [path.read_text(encoding="utf-8") for path in SAMPLES] * COPIES
+
+    start = time.perf_counter()
+    expected = [convert(md) for md in documents]
+    serial = time.perf_counter() - start
+
+    with ConversionPool(workers) as pool:
+        pool.convert_many(documents[: workers * 64])  # start and warm every worker
+        start = time.perf_counter()
+        results = pool.convert_many(documents)
+        parallel = time.perf_counter() - start
+        assert results == expected
+        print(f"{len(documents)} documents: serial {serial:.2f}s, {workers} workers {parallel:.2f}s "
+              f"({serial / parallel:.1f}x)")
+
+        large = "\n\n".join(documents)
+        start = time.perf_counter()
+        expected = convert(large)
+        serial = time.perf_counter() - start
+        start = time.perf_counter()
+        result = pool.convert(large)
+        parallel = time.perf_counter() - start
+        assert result == expected
+        print(f"one {len(large.encode()) / 1e6:.1f} MB document: serial {serial:.2f}s, "
+              f"{workers} workers {parallel:.2f}s ({serial / parallel:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Rendering time of quote-heavy documents with entities_to_markdownv2().
+
+Quoted-reply threads put a blockquote line prefix after almost every newline,
+so every line asks which blockquote it is in. Time per line should stay flat
+as the number of quotes grows. Run from the repository root:
+``python feature-test/bench_blockquotes.py``
+"""
+
+import time
+
+from telegramify_markdown import convert, entities_to_markdownv2, markdownv2_length
+
+REPLY = "> **Alice** wrote:\n> quoted line one\n> quoted line two\n\nReply with `code`.\n\n"
+ROUNDS = 5
+
+
+def bench(func, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(*args)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    for quotes in (100, 1000, 10000):
+        text, entities = convert(REPLY * quotes)
+        lines = text.count("\n") + 1
+        render = bench(entities_to_markdownv2, text, entities)
+        length = bench(markdownv2_length, text, entities)
+        print(
+            f"{quotes:>6} quotes, {lines:>6} lines: render {render / lines * 1e6:6.2f} us/line"
+            f"  length {length / lines * 1e6:6.2f} us/line"
+        )
+
+
+if __name__ == "__main__":
+    main()
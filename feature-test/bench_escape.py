@@ -0,0 +1,59 @@
+"""MarkdownV2 escaping and markdownify() throughput on plain prose.
+
+Compares the str.replace based escaping in mdv2 with the per-character loop
+it replaced, then times the whole markdownify() call.
+Run from the repository root: ``python feature-test/bench_escape.py``
+"""
+
+import pathlib
+import time
+
+from telegramify_markdown import convert, entities_to_markdownv2, markdownify
+from telegramify_markdown.mdv2 import _MDV2_ESCAPE_CHARS, _escape_markdownv2
+
+ROOT = pathlib.Path(__file__).parent.parent
+PARAGRAPH = (
+    "The quick brown fox jumps over the lazy dog. It was fine (mostly)! "
+    "Prices rose 3.5% in Q1, see e.g. the annual report."
+)
+DOCUMENTS = {
+    "prose": "\n\n".join([PARAGRAPH] * 35),
+    "cjk": "\n\n".join(["敏捷的棕色狐狸跳过了懒狗。价格在第一季度上涨了百分之三。"] * 60),
+    "exp2": (ROOT / "tests" / "exp2.md").read_text(encoding="utf-8"),
+}
+ROUNDS = 300
+
+
+def escape_per_char(text):
+    result = []
+    for ch in text:
+        if ch in _MDV2_ESCAPE_CHARS:
+            result.append("\\")
+        result.append(ch)
+    return "".join(result)
+
+
+def bench(func, *args):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(*args)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def main():
+    for name, md in DOCUMENTS.items():
+        text, entities = convert(md)
+        assert _escape_markdownv2(text) == escape_per_char(text)
+        loop = bench(escape_per_char, text)
+        escape = bench(_escape_markdownv2, text)
+        render = bench(entities_to_markdownv2, text, entities)
+        total = bench(markdownify, md)
+        print(
+            f"{name:>6} ({len(text)} chars): escape {loop * 1e6:7.1f} -> {escape * 1e6:6.1f} us"
+            f" ({loop / escape:4.1f}x)  render {render * 1e6:7.1f} us"
+            f"  markdownify {len(md) / total / 1e6:5.2f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Per-event cost of EventWalker's dispatch table against the old if/elif chain.
+
+Parsing is done once up front and both walkers get the same event stream, so
+the timings cover only the walker. ``ChainWalker`` routes events with the
+isinstance/if/elif chain the walker used before the table and calls the same
+handlers. The "routing only" figures replace every handler with a no-op in
+both walkers, which isolates the cost of classifying and routing an event.
+Run from the repository root: ``python feature-test/bench_event_dispatch.py``
+"""
+
+import pathlib
+import timeit
+
+import pyromark
+
+from telegramify_markdown.config import get_runtime_config
+from telegramify_markdown.converter import STANDARD_OPTIONS, EventWalker, _preprocess
+
+ROOT = pathlib.Path(__file__).parent.parent
+DOCUMENTS = [ROOT / "tests" / "exp2.md", ROOT / "playground" / "t_longtext.md"]
+
+
+class ChainWalker(EventWalker):
+    """EventWalker routing events through the previous if/elif chain."""
+
+    def _handle_event(self, event) -> None:
+        source_range = None
+        if isinstance(event, tuple) and len(event) == 2 and isinstance(event[1], dict):
+            event, source_range = event
+
+        if isinstance(event, str):
+            if event == "SoftBreak":
+                self._on_soft_break(None, source_range)
+            elif event == "HardBreak":
+                self._on_hard_break(None, source_range)
+            elif event == "Rule":
+                self._on_rule(None, source_range)
+            return
+
+        if not isinstance(event, dict):
+            return
+
+        if "Start" in event:
+            self._on_start(event["Start"], source_range)
+        elif "End" in event:
+            self._on_end(event["End"], source_range)
+        elif "Text" in event:
+            self._on_text(event["Text"], source_range)
+        elif "Code" in event:
+            self._on_inline_code(event["Code"], source_range)
+        elif "InlineMath" in event:
+            self._on_inline_math(event["InlineMath"], source_range)
+        elif "DisplayMath" in event:
+            self._on_display_math(event["DisplayMath"], source_range)
+        elif "InlineHtml" in event:
+            self._on_inline_html(event["InlineHtml"], source_range)
+        elif "Html" in event:
+            pass
+        elif "TaskListMarker" in event:
+            self._on_task_list_marker(event["TaskListMarker"], source_range)
+        elif "FootnoteReference" in event:
+            self._on_footnote_reference(event["FootnoteReference"], source_range)
+
+    def _on_start(self, tag, source_range) -> None:
+        if tag == "Strong":
+            self._on_start_format(None, source_range, entity_type="bold")
+        elif tag == "Emphasis":
+            self._on_start_format(None, source_range, entity_type="italic")
+        elif tag == "Strikethrough":
+            self._on_start_format(None, source_range, entity_type="strikethrough")
+        elif tag == "Paragraph":
+            self._on_start_paragraph(None, source_range)
+        elif tag == "Item":
+            self._on_start_item(None, source_range)
+        elif tag in ("TableHead", "TableRow"):
+            self._on_start_table_row(None, source_range)
+        elif tag == "TableCell":
+            self._on_start_table_cell(None, source_range)
+        elif isinstance(tag, dict):
+            if "Heading" in tag:
+                self._on_start_heading(tag["Heading"], source_range)
+            elif "CodeBlock" in tag:
+                self._on_start_code_block(tag["CodeBlock"], source_range)
+            elif "BlockQuote" in tag:
+                self._on_start_blockquote(None, source_range)
+            elif "Link" in tag:
+                self._on_start_link(tag["Link"], source_range)
+            elif "Image" in tag:
+                self._on_start_image(tag["Image"], source_range)
+            elif "List" in tag:
+                self._on_start_list(tag["List"], source_range)
+            elif "Table" in tag:
+                self._on_start_table(tag["Table"], source_range)
+            elif "FootnoteDefinition" in tag:
+                self._on_start_footnote_definition(None, source_range)
+
+    def _on_end(self, tag, source_range) -> None:
+        if tag == "Strong":
+            self._on_end_format(None, source_range, entity_type="bold")
+        elif tag == "Emphasis":
+            self._on_end_format(None, source_range, entity_type="italic")
+        elif tag == "Strikethrough":
+            self._on_end_format(None, source_range, entity_type="strikethrough")
+        elif tag == "Paragraph":
+            self._on_end_paragraph(None, source_range)
+        elif tag == "Item":
+            self._on_end_item(None, source_range)
+        elif tag == "CodeBlock":
+            self._on_end_code_block(None, source_range)
+        elif tag == "Table":
+            self._on_end_table(None, source_range)
+        elif tag == "TableCell":
+            self._on_end_table_cell(None, source_range)
+        elif tag in ("TableRow", "TableHead"):
+            self._on_end_table_row(None, source_range)
+        elif tag == "Link":
+            self._on_end_format(None, source_range, entity_type="text_link")
+        elif tag == "Image":
+            self._on_end_image(None, source_range)
+        elif isinstance(tag, dict):
+            if "Heading" in tag:
+                self._on_end_heading(None, source_range)
+            elif "BlockQuote" in tag:
+                self._on_end_blockquote(None, source_range)
+            elif "List" in tag:
+                self._on_end_list(None, source_range)
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+class RoutingOnlyWalker(EventWalker):
+    pass
+
+
+class ChainRoutingOnlyWalker(ChainWalker):
+    pass
+
+
+for _kind, _handler in EventWalker._dispatch.items():
+    if isinstance(_handler, dict):
+        for _tag in _handler:
+            RoutingOnlyWalker.register_handler(_kind, _noop, tag=_tag)
+    else:
+        RoutingOnlyWalker.register_handler(_kind, _noop)
+
+for _name in dir(EventWalker):
+    if _name.startswith("_on_"):
+        setattr(ChainRoutingOnlyWalker, _name, _noop)
+ChainRoutingOnlyWalker._on_start = ChainWalker._on_start
+ChainRoutingOnlyWalker._on_end = ChainWalker._on_end
+
+
+def _ns_per_event(walker_classes, config, source, events) -> list[float]:
+    """Best time per event of each walker, measured in interleaved rounds."""
+    runs = 50
+    best = [float("inf")] * len(walker_classes)
+    for _ in range(15):
+        for i, walker_cls in enumerate(walker_classes):
+            seconds = timeit.timeit(lambda: walker_cls(config, source).walk(events), number=runs)
+            best[i] = min(best[i], seconds / runs / len(events) * 1e9)
+    return best
+
+
+def main():
+    config = get_runtime_config()
+    for path in DOCUMENTS:
+        source = _preprocess(path.read_text(encoding="utf-8"))
+        events = tuple(pyromark.events_with_range(source, options=STANDARD_OPTIONS))
+        assert ChainWalker(config, source).walk(events) == EventWalker(config, source).walk(events)
+        chain, table, chain_routing, table_routing = _ns_per_event(
+            [ChainWalker, EventWalker, ChainRoutingOnlyWalker, RoutingOnlyWalker],
+            config, source, events,
+        )
+        print(
+            f"{path.name}: {len(events)} events\n"
+            f"  full walk:    if/elif chain {chain:5.0f} ns/event, table {table:5.0f} ns/event"
+            f" ({chain - table:+.0f} ns)\n"
+            f"  routing only: if/elif chain {chain_routing:5.0f} ns/event,"
+            f" table {table_routing:5.0f} ns/event ({chain_routing - table_routing:+.0f} ns)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Scaling of split_entities() from 10 KB to 10 MB of converted text.
+
+Converts a repeated sample document once per size and times only the split
+into 4096-unit messages. Time per MB should stay flat as the input grows.
+Run from the repository root: ``python feature-test/bench_split_scaling.py``
+"""
+
+import pathlib
+import time
+
+from telegramify_markdown import convert, split_entities
+
+ROOT = pathlib.Path(__file__).parent.parent
+SAMPLE = (ROOT / "tests" / "exp2.md").read_text(encoding="utf-8")
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+
+
+def main():
+    for size in SIZES:
+        text, entities = convert(SAMPLE * max(1, round(size / len(SAMPLE.encode("utf-8")))))
+        start = time.perf_counter()
+        chunks = split_entities(text, entities, 4096)
+        elapsed = time.perf_counter() - start
+        mb = len(text.encode("utf-8")) / 1e6
+        print(f"{mb:8.2f} MB  {len(chunks):5d} chunks  {len(entities):7d} entities  "
+              f"{elapsed * 1000:9.1f} ms  {elapsed / mb * 1000:7.1f} ms/MB")
+
+
+if __name__ == "__main__":
+    main()
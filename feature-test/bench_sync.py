@@ -0,0 +1,43 @@
+"""Per-message overhead of telegramify_sync() against asyncio.run(telegramify()).
+
+Sync bot frameworks call the pipeline once per reply. Short replies without
+Mermaid diagrams are where the event loop set-up per call shows most.
+Run from the repository root: ``python feature-test/bench_sync.py``
+"""
+
+import asyncio
+import pathlib
+import time
+
+from telegramify_markdown import telegramify, telegramify_sync
+
+ROOT = pathlib.Path(__file__).parent.parent
+MESSAGES = {
+    "short": "Hello **world**, see `code` and [a link](https://example.com).",
+    "reply": "## Answer\n\n- one\n- two\n\n```python\nprint('hi')\n```\n\nDone.\n",
+    "long": (ROOT / "tests" / "exp2.md").read_text(encoding="utf-8"),
+}
+ROUNDS = 2000
+
+
+def bench(func, md, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(md)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    for name, md in MESSAGES.items():
+        rounds = ROUNDS if name != "long" else ROUNDS // 20
+        assert telegramify_sync(md) == asyncio.run(telegramify(md))
+        via_loop = bench(lambda text: asyncio.run(telegramify(text)), md, rounds)
+        sync = bench(telegramify_sync, md, rounds)
+        print(
+            f"{name:>6}: asyncio.run(telegramify) {via_loop * 1e6:8.1f} us"
+            f"  telegramify_sync {sync * 1e6:8.1f} us  ({via_loop / sync:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
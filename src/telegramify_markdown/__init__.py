@@ -3,28 +3,66 @@
 from __future__ import annotations
 
 import warnings
-from typing import Union
+from contextlib import aclosing
+from typing import AsyncIterator, Sequence, Union
 
 from telegramify_markdown import config
-from telegramify_markdown.converter import convert as convert
-from telegramify_markdown.entity import MessageEntity, split_entities, utf16_len
-from telegramify_markdown.content import ContentType, ContentTypes, ContentTrace, File, Photo, Text
-from telegramify_markdown.mdv2 import entities_to_markdownv2, split_markdownv2
+from telegramify_markdown.config import RenderConfig, RenderProfile
+from telegramify_markdown.batch import ConversionPool, convert_many, telegramify_many
+from telegramify_markdown.cache import CacheStats, ConversionCache
+from telegramify_markdown.converter import StreamingConverter, convert as convert
+from telegramify_markdown.edits import EditOperation, diff_items, plan_edits
+from telegramify_markdown.entity import (
+    EntityArray,
+    EntityIndex,
+    MessageEntity,
+    split_entities,
+    split_entity_array,
+)
+from telegramify_markdown.content import (
+    ContentType,
+    ContentTypes,
+    ContentTrace,
+    File,
+    MediaGroup,
+    Photo,
+    Text,
+)
+from telegramify_markdown.mdv2 import entities_to_markdownv2, markdownv2_length, split_markdownv2
+from telegramify_markdown.pipeline import telegramify_sync
+from telegramify_markdown.utf16 import utf16_len
 
 __all__ = [
     "convert",
+    "StreamingConverter",
+    "convert_many",
+    "telegramify_many",
+    "ConversionPool",
+    "ConversionCache",
+    "CacheStats",
     "telegramify",
+    "telegramify_iter",
+    "telegramify_sync",
+    "plan_edits",
+    "diff_items",
+    "EditOperation",
     "entities_to_markdownv2",
     "split_markdownv2",
+    "markdownv2_length",
     "markdownify",
     "standardize",
     "config",
+    "RenderProfile",
     "MessageEntity",
+    "EntityArray",
+    "EntityIndex",
     "utf16_len",
     "split_entities",
+    "split_entity_array",
     "Text",
     "File",
     "Photo",
+    "MediaGroup",
     "ContentType",
     "ContentTypes",
     "ContentTrace",
@@ -89,7 +127,15 @@ async def telegramify(
     latex_escape: bool = True,
     render_mermaid: bool = True,
     min_file_lines: int = 1,
-) -> list[Union[Text, File, Photo]]:
+    config: RenderConfig | RenderProfile | None = None,
+    packing: str = "greedy",
+    max_entities_per_message: int | None = 100,
+    mermaid_concurrency: int = 4,
+    mermaid_timeout: float | None = 30.0,
+    pack_captions: bool = False,
+    media_groups: bool = False,
+    committed: Sequence[int] = (),
+) -> list[Union[Text, File, Photo, MediaGroup]]:
     """Convert markdown to Telegram-ready content segments.
 
     :param content: Raw markdown text.
@@ -104,7 +150,22 @@ async def telegramify(
     :param min_file_lines: Minimum line count for a code block to be extracted
         as a separate file.  Set to ``0`` to disable file extraction entirely
         (all code blocks stay inline as ``pre`` entities).
-    :return: Ordered list of Text, File, or Photo objects ready for the Telegram Bot API.
+    :param config: Render configuration or a :class:`RenderProfile`. Uses global config if None.
+    :param packing: ``"greedy"`` fills each message as far as it can; ``"optimal"``
+        uses the fewest messages and prefers paragraph and sentence breaks.
+    :param max_entities_per_message: Most entities per text message (Telegram rejects
+        more than 100). ``None`` disables the limit.
+    :param mermaid_concurrency: Most Mermaid diagrams rendered at the same time.
+    :param mermaid_timeout: Seconds all Mermaid renders may take together; diagrams
+        not rendered by then are sent as files. ``None`` waits for all of them.
+    :param pack_captions: Send a text that directly follows a file or photo as its
+        caption when it fits in 1024 UTF-16 code units, saving one message.
+    :param media_groups: Batch up to 10 consecutive files (or consecutive photos)
+        into one :class:`MediaGroup` for ``sendMediaGroup``.
+    :param committed: The ``content_trace.extra["utf16_end"]`` of text messages
+        already sent while streaming. Those messages keep their boundaries and
+        only the text after the last one is repacked.
+    :return: Ordered list of Text, File, Photo, or MediaGroup objects ready for the Telegram Bot API.
     """
     if max_word_count is not None:
         warnings.warn(
@@ -137,4 +198,63 @@ async def telegramify(
         latex_escape=latex_escape,
         render_mermaid=render_mermaid,
         min_file_lines=min_file_lines,
+        config=config,
+        packing=packing,
+        max_entities_per_message=max_entities_per_message,
+        mermaid_concurrency=mermaid_concurrency,
+        mermaid_timeout=mermaid_timeout,
+        pack_captions=pack_captions,
+        media_groups=media_groups,
+        committed=committed,
     )
+
+
+async def telegramify_iter(
+    content: str,
+    *,
+    max_message_length: int = 4096,
+    latex_escape: bool = True,
+    render_mermaid: bool = True,
+    min_file_lines: int = 1,
+    config: RenderConfig | RenderProfile | None = None,
+    packing: str = "greedy",
+    max_entities_per_message: int | None = 100,
+    mermaid_concurrency: int = 4,
+    mermaid_timeout: float | None = 30.0,
+    pack_captions: bool = False,
+    media_groups: bool = False,
+    committed: Sequence[int] = (),
+) -> AsyncIterator[Union[Text, File, Photo, MediaGroup]]:
+    """Like :func:`telegramify`, but yield each item as soon as it is ready.
+
+    Text before the first Mermaid diagram is yielded right away while the
+    diagrams keep rendering in the background, so the first message can be
+    sent without waiting for the network::
+
+        async for item in telegramify_iter(answer):
+            await send(item)
+
+    Takes the same options as :func:`telegramify` and yields the same items
+    in the same order.
+    """
+    from telegramify_markdown.pipeline import iter_markdown
+
+    items = iter_markdown(
+        content,
+        max_message_length=max_message_length,
+        latex_escape=latex_escape,
+        render_mermaid=render_mermaid,
+        min_file_lines=min_file_lines,
+        config=config,
+        packing=packing,
+        max_entities_per_message=max_entities_per_message,
+        mermaid_concurrency=mermaid_concurrency,
+        mermaid_timeout=mermaid_timeout,
+        pack_captions=pack_captions,
+        media_groups=media_groups,
+        committed=committed,
+    )
+    # Close the pipeline with us, so an early break cancels pending renders
+    async with aclosing(items):
+        async for item in items:
+            yield item
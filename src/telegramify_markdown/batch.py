@@ -0,0 +1,254 @@
+"""Batch conversion on a process pool.
+
+convert() is pure Python CPU work and holds the GIL, so converting many
+documents in threads uses a single core. ConversionPool spreads them over
+pre-warmed worker processes instead. Documents are submitted in chunks to keep
+pickling overhead down, and results always come back in input order.
+A single very large document can also be cut at top-level block boundaries and
+its pieces converted in parallel.
+
+Worker processes have their own RenderConfig, so every chunk carries the
+caller's settings as a :class:`RenderProfile`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, Union
+
+from telegramify_markdown.config import RenderConfig, RenderProfile
+from telegramify_markdown.content import File, MediaGroup, Photo, Text
+from telegramify_markdown.converter import (
+    Segment,
+    _convert_piece,
+    _join_pieces,
+    _preprocess,
+    _split_source,
+    convert,
+)
+from telegramify_markdown.entity import MessageEntity
+
+_WARMUP_DOCUMENT = "# Warm **up**\n\n- [x] `code` \\(\\alpha \\to \\beta\\)\n\n> quote\n"
+
+
+def _warm_worker() -> None:
+    """Pool initializer: import pyromark and build the LaTeX tables up front."""
+    convert(_WARMUP_DOCUMENT)
+
+
+def _convert_chunk(
+    profile: RenderProfile, latex_escape: bool, chunk: list[str]
+) -> list[tuple[str, list[MessageEntity]]]:
+    return [convert(markdown, latex_escape=latex_escape, config=profile) for markdown in chunk]
+
+
+def _convert_piece_task(
+    profile: RenderProfile, piece: str, first: bool
+) -> tuple[str, list[MessageEntity], list[Segment], int]:
+    return _convert_piece(piece, profile, first=first)
+
+
+def _telegramify_chunk(
+    options: dict, chunk: list[str]
+) -> list[list[Union[Text, File, Photo, MediaGroup]]]:
+    from telegramify_markdown.pipeline import process_markdown
+
+    async def run() -> list[list[Union[Text, File, Photo, MediaGroup]]]:
+        return [await process_markdown(content, **options) for content in chunk]
+
+    return asyncio.run(run())
+
+
+def _chunked(items: Iterable[str], size: int) -> Iterator[list[str]]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class ConversionPool:
+    """Process pool of pre-warmed converter workers.
+
+    Reuse one pool across batches: starting and warming the workers is the
+    expensive part. Use as a context manager or call :meth:`close`.
+
+    :param workers: Number of worker processes. Defaults to ``os.cpu_count()``.
+    :param chunksize: Documents sent to a worker per task.
+    """
+
+    def __init__(self, workers: int | None = None, *, chunksize: int = 64) -> None:
+        if chunksize <= 0:
+            raise ValueError("chunksize must be greater than 0")
+        self._workers = workers or os.cpu_count() or 1
+        self._chunksize = chunksize
+        self._executor = ProcessPoolExecutor(
+            max_workers=self._workers,
+            initializer=_warm_worker,
+        )
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    def convert_many(
+        self,
+        markdowns: Iterable[str],
+        *,
+        latex_escape: bool = True,
+        config: RenderConfig | RenderProfile | None = None,
+    ) -> list[tuple[str, list[MessageEntity]]]:
+        """Convert every document, like ``[convert(md) for md in markdowns]``."""
+        profile = RenderProfile.from_config(config)
+        futures = [
+            self._executor.submit(_convert_chunk, profile, latex_escape, chunk)
+            for chunk in _chunked(markdowns, self._chunksize)
+        ]
+        return [result for future in futures for result in future.result()]
+
+    def convert(
+        self,
+        markdown: str,
+        *,
+        latex_escape: bool = True,
+        config: RenderConfig | RenderProfile | None = None,
+        piece_size: int = 64 * 1024,
+    ) -> tuple[str, list[MessageEntity]]:
+        """:func:`convert` for one large document, converting its blocks in parallel."""
+        text, entities, _ = self.convert_with_segments(
+            markdown, latex_escape=latex_escape, config=config, piece_size=piece_size
+        )
+        return text, entities
+
+    def convert_with_segments(
+        self,
+        markdown: str,
+        *,
+        latex_escape: bool = True,
+        config: RenderConfig | RenderProfile | None = None,
+        piece_size: int = 64 * 1024,
+    ) -> tuple[str, list[MessageEntity], list[Segment]]:
+        """Parallel :func:`convert_with_segments`, byte-identical to the serial result.
+
+        The source is cut after top-level blocks into pieces of at least
+        *piece_size* UTF-8 bytes, with at most about one piece per worker.
+        Documents that yield a single piece are converted in this process.
+        """
+        profile = RenderProfile.from_config(config)
+        source = _preprocess(markdown, latex_escape=latex_escape)
+        pieces = _split_source(
+            source, max(piece_size, len(source.encode("utf-8")) // self._workers)
+        )
+        if len(pieces) == 1:
+            return _join_pieces([_convert_piece(source, profile, first=True)])
+        futures = [
+            self._executor.submit(_convert_piece_task, profile, piece, index == 0)
+            for index, piece in enumerate(pieces)
+        ]
+        return _join_pieces([future.result() for future in futures])
+
+    async def telegramify_many(
+        self,
+        contents: Iterable[str],
+        *,
+        max_message_length: int = 4096,
+        latex_escape: bool = True,
+        render_mermaid: bool = True,
+        min_file_lines: int = 1,
+        config: RenderConfig | RenderProfile | None = None,
+        packing: str = "greedy",
+        max_entities_per_message: int | None = 100,
+        mermaid_concurrency: int = 4,
+        mermaid_timeout: float | None = 30.0,
+        pack_captions: bool = False,
+        media_groups: bool = False,
+    ) -> list[list[Union[Text, File, Photo, MediaGroup]]]:
+        """Run :func:`telegramify` on every document without blocking the event loop."""
+        options = dict(
+            max_message_length=max_message_length,
+            latex_escape=latex_escape,
+            render_mermaid=render_mermaid,
+            min_file_lines=min_file_lines,
+            config=RenderProfile.from_config(config),
+            packing=packing,
+            max_entities_per_message=max_entities_per_message,
+            mermaid_concurrency=mermaid_concurrency,
+            mermaid_timeout=mermaid_timeout,
+            pack_captions=pack_captions,
+            media_groups=media_groups,
+        )
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, _telegramify_chunk, options, chunk)
+                for chunk in _chunked(contents, self._chunksize)
+            )
+        )
+        return [result for chunk in chunks for result in chunk]
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def __enter__(self) -> ConversionPool:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def convert_many(
+    markdowns: Iterable[str],
+    *,
+    workers: int | None = None,
+    chunksize: int = 64,
+    latex_escape: bool = True,
+    config: RenderConfig | RenderProfile | None = None,
+) -> list[tuple[str, list[MessageEntity]]]:
+    """Convert many documents in parallel on a temporary :class:`ConversionPool`.
+
+    ``workers=1`` converts in the calling process without starting a pool.
+    """
+    if workers == 1:
+        return _convert_chunk(RenderProfile.from_config(config), latex_escape, list(markdowns))
+    with ConversionPool(workers, chunksize=chunksize) as pool:
+        return pool.convert_many(markdowns, latex_escape=latex_escape, config=config)
+
+
+async def telegramify_many(
+    contents: Iterable[str],
+    *,
+    workers: int | None = None,
+    chunksize: int = 64,
+    max_message_length: int = 4096,
+    latex_escape: bool = True,
+    render_mermaid: bool = True,
+    min_file_lines: int = 1,
+    config: RenderConfig | RenderProfile | None = None,
+    packing: str = "greedy",
+    max_entities_per_message: int | None = 100,
+    mermaid_concurrency: int = 4,
+    mermaid_timeout: float | None = 30.0,
+    pack_captions: bool = False,
+    media_groups: bool = False,
+) -> list[list[Union[Text, File, Photo, MediaGroup]]]:
+    """Async :func:`telegramify` over many documents on a temporary :class:`ConversionPool`."""
+    pool = ConversionPool(workers, chunksize=chunksize)
+    try:
+        return await pool.telegramify_many(
+            contents,
+            max_message_length=max_message_length,
+            latex_escape=latex_escape,
+            render_mermaid=render_mermaid,
+            min_file_lines=min_file_lines,
+            config=config,
+            packing=packing,
+            max_entities_per_message=max_entities_per_message,
+            mermaid_concurrency=mermaid_concurrency,
+            mermaid_timeout=mermaid_timeout,
+            pack_captions=pack_captions,
+            media_groups=media_groups,
+        )
+    finally:
+        # Shutting the pool down waits for the workers; keep that off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, pool.close)
@@ -0,0 +1,170 @@
+"""Content-addressed LRU cache for convert() and telegramify() results.
+
+Entries are keyed by a digest of the markdown, the :class:`RenderProfile`
+snapshot of the render settings and the call options, so changing ``get_runtime_config()`` simply stops
+matching the old entries, which then age out of the LRU.
+"""
+
+from __future__ import annotations
+
+import copy
+import dataclasses
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Hashable, Union
+
+from telegramify_markdown.config import RenderConfig, RenderProfile
+from telegramify_markdown.content import File, MediaGroup, Photo, Text
+from telegramify_markdown.entity import MessageEntity
+
+
+@dataclasses.dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+
+
+def _digest(markdown: str) -> bytes:
+    return hashlib.blake2b(markdown.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def _is_failed_mermaid(item: Union[Text, File, Photo, MediaGroup]) -> bool:
+    if isinstance(item, MediaGroup):
+        return any(_is_failed_mermaid(member) for member in item.items)
+    return isinstance(item, File) and item.content_trace.source_type == "mermaid"
+
+
+def _copy_entities(entities: tuple[MessageEntity, ...]) -> tuple[MessageEntity, ...]:
+    # MessageEntity fields are all immutable, so a shallow copy is independent
+    return tuple(copy.copy(entity) for entity in entities)
+
+
+class ConversionCache:
+    """LRU cache in front of :func:`convert` and :func:`telegramify`.
+
+    The cache keeps its own copy of every result and each call returns a
+    fresh copy, so callers may modify the returned entities and content
+    objects without affecting later hits. Safe to share between threads.
+
+    :param maxsize: Maximum number of cached results (convert and telegramify combined).
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        if maxsize <= 0:
+            raise ValueError("maxsize must be greater than 0")
+        self._maxsize = maxsize
+        self._entries: OrderedDict[Hashable, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                size=len(self._entries),
+                maxsize=self._maxsize,
+            )
+
+    def clear(self) -> None:
+        """Drop all entries. Counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def convert(
+        self,
+        markdown: str,
+        *,
+        latex_escape: bool = True,
+        config: RenderConfig | RenderProfile | None = None,
+    ) -> tuple[str, tuple[MessageEntity, ...]]:
+        """Cached :func:`telegramify_markdown.convert`."""
+        from telegramify_markdown.converter import convert
+
+        profile = RenderProfile.from_config(config)
+        key = ("convert", _digest(markdown), profile, latex_escape)
+        cached = self._get(key)
+        if cached is not None:
+            return cached[0], _copy_entities(cached[1])
+        text, entities = convert(markdown, latex_escape=latex_escape, config=profile)
+        result = (text, tuple(entities))
+        self._put(key, (text, _copy_entities(result[1])))
+        return result
+
+    async def telegramify(
+        self,
+        content: str,
+        *,
+        max_message_length: int = 4096,
+        latex_escape: bool = True,
+        render_mermaid: bool = True,
+        min_file_lines: int = 1,
+        config: RenderConfig | RenderProfile | None = None,
+        packing: str = "greedy",
+        max_entities_per_message: int | None = 100,
+        mermaid_concurrency: int = 4,
+        mermaid_timeout: float | None = 30.0,
+        pack_captions: bool = False,
+        media_groups: bool = False,
+    ) -> tuple[Union[Text, File, Photo, MediaGroup], ...]:
+        """Cached :func:`telegramify_markdown.telegramify`.
+
+        Results where a Mermaid diagram fell back to a file (e.g. a network
+        error) are returned but not cached, so the next call retries the render.
+        """
+        from telegramify_markdown.pipeline import process_markdown
+
+        options = (
+            max_message_length, latex_escape, render_mermaid, min_file_lines,
+            packing, max_entities_per_message, pack_captions, media_groups,
+        )
+        profile = RenderProfile.from_config(config)
+        key = ("telegramify", _digest(content), profile, options)
+        cached = self._get(key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        result = tuple(
+            await process_markdown(
+                content,
+                max_message_length=max_message_length,
+                latex_escape=latex_escape,
+                render_mermaid=render_mermaid,
+                min_file_lines=min_file_lines,
+                config=profile,
+                packing=packing,
+                max_entities_per_message=max_entities_per_message,
+                mermaid_concurrency=mermaid_concurrency,
+                mermaid_timeout=mermaid_timeout,
+                pack_captions=pack_captions,
+                media_groups=media_groups,
+            )
+        )
+        if not (render_mermaid and any(_is_failed_mermaid(item) for item in result)):
+            self._put(key, copy.deepcopy(result))
+        return result
+
+    def _get(self, key: Hashable) -> tuple | None:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return result
+
+    def _put(self, key: Hashable, result: tuple) -> None:
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
@@ -1,3 +1,11 @@
+from __future__ import annotations
+
+import dataclasses
+import functools
+import types
+from typing import Mapping
+
+
 def singleton(cls):
     """Singleton pattern decorator"""
     instances = {}
@@ -59,3 +67,120 @@ class RenderConfig:
 # Global accessor function for accessing the RenderConfig singleton
 def get_runtime_config() -> RenderConfig:
     return RenderConfig()
+
+
+_HEADING_LEVELS = ("H1", "H2", "H3", "H4", "H5", "H6")
+
+
+@dataclasses.dataclass(frozen=True)
+class RenderProfile:
+    """Immutable, hashable snapshot of the render settings for one call.
+
+    Pass one to ``convert(config=...)`` or ``telegramify(config=...)`` to render
+    with settings of your own instead of the process-wide :class:`RenderConfig`,
+    e.g. one profile per chat in a multi-tenant bot. Defaults match a fresh
+    ``RenderConfig``; ``RenderProfile.from_config()`` snapshots the current one.
+    """
+
+    heading_symbols: tuple[str, str, str, str, str, str] = (
+        "\N{PUSHPIN}", "\N{PENCIL}", "\N{BOOKS}", "\N{BOOKMARK}", "", "",
+    )
+    image: str = "\N{FRAME WITH PICTURE}"
+    link: str = "\N{LINK SYMBOL}"
+    task_completed: str = "\N{WHITE HEAVY CHECK MARK}"
+    task_uncompleted: str = "\N{BALLOT BOX WITH CHECK}"
+    cite_expandable: bool = True
+    # Blockquotes longer than this (UTF-16 units) become expandable
+    expandable_length: int = 200
+    mermaid_theme: str = "default"
+    mermaid_width: int = 1000
+    mermaid_scale: int = 2
+    mermaid_image_type: str = "webp"
+
+    # Resolved once for the converter
+    heading_prefixes: Mapping[str, str] = dataclasses.field(init=False, repr=False, compare=False)
+    task_markers: tuple[str, str] = dataclasses.field(init=False, repr=False, compare=False)
+    expandable_threshold: int | None = dataclasses.field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if len(self.heading_symbols) != len(_HEADING_LEVELS):
+            raise ValueError("heading_symbols must have one entry per heading level (6)")
+        object.__setattr__(self, "heading_symbols", tuple(self.heading_symbols))
+        object.__setattr__(
+            self,
+            "heading_prefixes",
+            types.MappingProxyType({
+                level: f"{symbol} " if symbol else ""
+                for level, symbol in zip(_HEADING_LEVELS, self.heading_symbols)
+            }),
+        )
+        # Indexed by the task's checked flag
+        object.__setattr__(self, "task_markers", (self.task_uncompleted, self.task_completed))
+        object.__setattr__(
+            self, "expandable_threshold", self.expandable_length if self.cite_expandable else None
+        )
+
+    def __reduce__(self):
+        # Pickle the settings only; the derived fields are rebuilt by __post_init__
+        return type(self), tuple(
+            getattr(self, field.name) for field in dataclasses.fields(self) if field.init
+        )
+
+    @classmethod
+    def from_config(cls, config: RenderConfig | RenderProfile | None = None) -> RenderProfile:
+        """Snapshot *config* (the runtime config if None); a profile is returned as is."""
+        if isinstance(config, RenderProfile):
+            return config
+        if config is None:
+            config = get_runtime_config()
+        symbol = config.markdown_symbol
+        mermaid = config.mermaid
+        # Unchanged settings map to the same (cached) profile
+        return _profile_snapshot(
+            cls,
+            (
+                symbol.heading_level_1,
+                symbol.heading_level_2,
+                symbol.heading_level_3,
+                symbol.heading_level_4,
+                symbol.heading_level_5,
+                symbol.heading_level_6,
+            ),
+            symbol.image,
+            symbol.link,
+            symbol.task_completed,
+            symbol.task_uncompleted,
+            config.cite_expandable,
+            mermaid.theme,
+            mermaid.width,
+            mermaid.scale,
+            mermaid.image_type,
+        )
+
+
+@functools.lru_cache(maxsize=32)
+def _profile_snapshot(
+    cls: type[RenderProfile],
+    heading_symbols: tuple[str, ...],
+    image: str,
+    link: str,
+    task_completed: str,
+    task_uncompleted: str,
+    cite_expandable: bool,
+    mermaid_theme: str,
+    mermaid_width: int,
+    mermaid_scale: int,
+    mermaid_image_type: str,
+) -> RenderProfile:
+    return cls(
+        heading_symbols=heading_symbols,
+        image=image,
+        link=link,
+        task_completed=task_completed,
+        task_uncompleted=task_uncompleted,
+        cite_expandable=cite_expandable,
+        mermaid_theme=mermaid_theme,
+        mermaid_width=mermaid_width,
+        mermaid_scale=mermaid_scale,
+        mermaid_image_type=mermaid_image_type,
+    )
@@ -11,6 +11,7 @@ class ContentType(Enum):
     TEXT = "text"
     FILE = "file"
     PHOTO = "photo"
+    MEDIA_GROUP = "media_group"
 
 
 # 0.x compat alias
@@ -82,3 +83,15 @@ class Photo:
 
     # 0.x compat: .caption → MarkdownV2 string
     caption = _deprecated_property("caption", "caption_text", is_mdv2=True)
+
+
+@dataclasses.dataclass
+class MediaGroup:
+    """2–10 consecutive Files or Photos (never mixed) to send with ``sendMediaGroup``.
+
+    Each item keeps its own caption.
+    """
+
+    items: list[File] | list[Photo]
+    content_trace: ContentTrace
+    content_type: ContentType = ContentType.MEDIA_GROUP
@@ -3,15 +3,17 @@
 from __future__ import annotations
 
 import dataclasses
+import functools
 import re
-from typing import Optional
+from typing import Any, Callable, Optional
 
 import pyromark
 
-from .config import RenderConfig, get_runtime_config
-from .entity import MessageEntity, utf16_len
+from .config import RenderConfig, RenderProfile
+from .entity import MessageEntity
 from .latex_escape.const import LATEX_SYMBOLS, NOT_MAP, LATEX_STYLES
 from .latex_escape.helper import LatexToUnicodeHelper
+from .utf16 import Utf16Index, astral_positions
 
 _latex_helper = LatexToUnicodeHelper()
 
@@ -25,24 +27,6 @@ STANDARD_OPTIONS = (
 
 # --- Preprocessing -----------------------------------------------------------
 
-_SPOILER_RE = re.compile(r"(?<![\\])\|\|(.+?)\|\|", re.DOTALL)
-_CODE_REGION_RE = re.compile(r"(```[\s\S]*?```|`[^`\n]+`)")
-
-
-def _preprocess_spoilers(text: str) -> str:
-    """Replace ||spoiler|| with <tg-spoiler>spoiler</tg-spoiler>.
-
-    Skips content inside code fences and inline code spans.
-    """
-    parts = _CODE_REGION_RE.split(text)
-    result: list[str] = []
-    for i, part in enumerate(parts):
-        if i % 2 == 0:  # Not inside code
-            part = _SPOILER_RE.sub(r"<tg-spoiler>\1</tg-spoiler>", part)
-        result.append(part)
-    return "".join(result)
-
-
 def _validate_telegram_emoji(url: str) -> Optional[str]:
     """If url is tg://emoji?id=<19-digit-id>, return the id. Otherwise None."""
     if not url.startswith("tg://emoji?id="):
@@ -53,42 +37,363 @@ def _validate_telegram_emoji(url: str) -> Optional[str]:
     return None
 
 
-_LATEX_MATH_P = re.compile(r"\\\[(.*?)\\\]", re.DOTALL)
-_LATEX_INLINE_P = re.compile(r"\\\((.*?)\\\)", re.DOTALL)
+def _trie_pattern(words: list[str]) -> str:
+    """Compile *words* into a prefix-factored regex alternation.
 
-
-def _contains_latex_symbols(content: str) -> bool:
-    if len(content) < 5:
-        return False
-    latex_symbols = (
+    Assumes no word is a prefix of another, so matching can stop at the
+    first word end.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+
+    def _emit(node: dict) -> str:
+        leaves = sorted(ch for ch, child in node.items() if not child)
+        branches = [re.escape(ch) + _emit(child) for ch, child in sorted(node.items()) if child]
+        alternatives = branches
+        if len(leaves) == 1:
+            alternatives = [re.escape(leaves[0])] + branches
+        elif leaves:
+            alternatives = ["[" + "".join(re.escape(ch) for ch in leaves) + "]"] + branches
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return "(?:" + "|".join(alternatives) + ")"
+
+    return _emit(trie)
+
+
+@functools.cache
+def _latex_symbol_re() -> re.Pattern:
+    """One regex that matches wherever any known LaTeX symbol occurs.
+
+    Keys that contain a shorter key are redundant for a presence test
+    (e.g. ``---`` once ``-`` is a key), which keeps the automaton small.
+    """
+    keys = set(
         (r"\frac", r"\sqrt", r"\begin")
         + tuple(LATEX_SYMBOLS.keys())
         + tuple(NOT_MAP.keys())
         + tuple(LATEX_STYLES.keys())
     )
-    return any(symbol in content for symbol in latex_symbols)
+    keys.discard("")
+    minimal: list[str] = []
+    for key in sorted(keys, key=len):
+        if not any(shorter in key for shorter in minimal):
+            minimal.append(key)
+    return re.compile(_trie_pattern(minimal))
 
 
-def _escape_latex(text: str) -> str:
-    """Pre-process LaTeX \\[...\\] and \\(...\\) blocks into Unicode."""
+def _contains_latex_symbols(content: str) -> bool:
+    if len(content) < 5:
+        return False
+    return _latex_symbol_re().search(content) is not None
+
+
+def _rewrite_latex(content: str, is_block: bool) -> str | None:
+    """Unicode form of a LaTeX ``\\[...\\]``/``\\(...\\)`` body, or None to keep it."""
+    if not _contains_latex_symbols(content):
+        return None
+    converted = _latex_helper.convert(content)
+    if is_block:
+        return f"$${converted.strip()}$$"
+    return f"${converted.strip().strip(chr(10))}$"
+
+
+# Code blocks are fenced (``` or ~~~, closed by a run of the same character
+# at least as long, or by the end of the document) or indented.  Only lines
+# that could start one are visited: the regex skips everything else.
+# Blockquote markers are skipped; inside a list item, code is indented four
+# columns past the item's content.
+_BLOCKQUOTE_PREFIX = r"(?: {0,3}> ?)*"
+_BLOCKQUOTE_PREFIX_RE = re.compile(_BLOCKQUOTE_PREFIX)
+# Line patterns start at the newline before the line: a literal first
+# character lets the regex engine skip ahead quickly
+_CODE_LINE = (
+    _BLOCKQUOTE_PREFIX
+    + r"(?:[ \t]*(?P<fence>`{3,}(?=[^`\n]*(?:\n|\Z))|~{3,})|(?P<indent>[ \t]+)\S)"
+)
+_CODE_LINE_RE = re.compile(_CODE_LINE)
+_CODE_START_RE = re.compile(r"\n(?:" + _CODE_LINE + ")")
+_LIST_ITEM_RE = re.compile(r"([-+*]|\d{1,9}[.)])([ \t]+|$)")
+
+
+@functools.cache
+def _fence_close_re(fence: str) -> re.Pattern:
+    return re.compile(
+        r"\n" + _BLOCKQUOTE_PREFIX + r"[ \t]*"
+        + re.escape(fence) + re.escape(fence[0]) + r"*[ \t]*(?:\n|\Z)"
+    )
+
+
+def _line_body(markdown: str, start: int, end: int) -> tuple[str, int]:
+    """The line ``markdown[start:end]`` without blockquote markers, and its indent."""
+    line = markdown[start:end]
+    body = line[_BLOCKQUOTE_PREFIX_RE.match(line).end():]
+    lead = len(body) - len(body.lstrip(" \t"))
+    return body, len(body[:lead].expandtabs(4))
+
+
+def _follows_blank_line(markdown: str, line_start: int) -> bool:
+    """Whether the line before the one at *line_start* is blank, or there is none."""
+    if line_start == 0:
+        return True
+    start = markdown.rfind("\n", 0, line_start - 1) + 1
+    return not _line_body(markdown, start, line_start - 1)[0].strip()
+
+
+def _content_indent(markdown: str, line_start: int, indent: int) -> int:
+    """Content column of the list item that the line at *line_start* belongs to.
+
+    Walks back to the nearest list item the line is indented into; a block
+    starting in column 0 after a blank line ends the lists.  0 outside lists.
+    """
+    end = line_start - 1
+    while end >= 0:
+        start = markdown.rfind("\n", 0, end) + 1
+        body, line_indent = _line_body(markdown, start, end)
+        if body.strip():
+            match = _LIST_ITEM_RE.match(body, len(body) - len(body.lstrip(" \t")))
+            if match:
+                spaces = len(match.group(2))
+                content = line_indent + len(match.group(1)) + (spaces if 0 < spaces <= 4 else 1)
+                if content <= indent:
+                    return content
+            elif line_indent == 0 and _follows_blank_line(markdown, start):
+                return 0
+        end = start - 1
+    return 0
+
+
+# Between code blocks one regex finds every token: code spans, LaTeX bodies
+# (which never cross a blank line), spoilers and, where none of them closes,
+# the lone opener.  A backtick run inside a LaTeX body or spoiler is fine
+# unless it opens a code span, which takes precedence.
+_CODE_SPAN_REST = r"(?:(?!\n[ \t]*\n)[\s\S])+?(?<!`)(?P={ticks})(?!`)"
+
+
+def _token_body(name: str, char: str, repeat: str = "*?") -> str:
+    """A lazy token body of *char* pieces and backticks that open no code span."""
+    ticks = f"{name}_ticks"
+    return (
+        rf"(?P<{name}>(?:{char}|(?P<{ticks}>`+)(?!`)(?!"
+        + _CODE_SPAN_REST.format(ticks=ticks)
+        + r"))" + repeat + ")"
+    )
+
+
+def _latex_tokens() -> str:
+    body = r"(?:(?!\n\n)[^`])"
+    return (
+        r"\\\[" + _token_body("block", body) + r"\\\]"
+        r"|\\\(" + _token_body("inline", body) + r"\\\)"
+    )
+
+
+def _token_re(latex: bool) -> re.Pattern:
+    # Every branch starts with one of _token_openers(); a lookbehind on the
+    # character before it rules out escaped openers
+    return re.compile(
+        r"(?P<code>(?P<ticks>`(?<![`\\]`)`*)(?!`)" + _CODE_SPAN_REST.format(ticks="ticks") + ")"
+        + ("|" + _latex_tokens() if latex else "")
+        + r"|\|(?<!\\\|)\|" + _token_body("spoiler", "[^`]", "+?") + r"\|\|"
+        + r"|(?P<open>`(?<![`\\]`)`*|\|(?<!\\\|)\|"
+        + (r"|\\[\[(]" if latex else "")
+        + ")"
+    )
+
+
+_TOKEN_RE = _token_re(latex=True)
+_TOKEN_NO_LATEX_RE = _token_re(latex=False)
+# Strings a token starts with
+_TOKEN_OPENERS = ("`", "||", "\\(", "\\[")
+_TOKEN_NO_LATEX_OPENERS = ("`", "||")
+_LATEX_RE = re.compile(_latex_tokens())
+
+
+def _rewrite_latex_match(match: re.Match) -> str:
+    block = match.group("block")
+    if block is not None:
+        converted = _rewrite_latex(block, is_block=True)
+    else:
+        converted = _rewrite_latex(match.group("inline"), is_block=False)
+    return match.group(0) if converted is None else converted
 
-    def _convert(match: re.Match, is_block: bool) -> str:
-        content = match.group(1)
-        if not _contains_latex_symbols(content):
-            return match.group(0)
-        converted = _latex_helper.convert(content)
-        if is_block:
-            return f"$${converted.strip()}$$"
-        else:
-            return f"${converted.strip().strip(chr(10))}$"
 
-    lines = text.split("\n\n")
-    processed = []
-    for line in lines:
-        line = _LATEX_MATH_P.sub(lambda m: _convert(m, is_block=True), line)
-        line = _LATEX_INLINE_P.sub(lambda m: _convert(m, is_block=False), line)
-        processed.append(line)
-    return "\n\n".join(processed)
+# (source_start, source_end, text_start, text_end) of one rewritten token
+_Change = tuple[int, int, int, int]
+
+
+@dataclasses.dataclass(slots=True)
+class _ScanState:
+    """A line start where a preprocessing scan can resume.
+
+    It lies outside code blocks and no token is open across it, so text
+    appended after it cannot change how anything before it was rewritten.
+    """
+
+    source_pos: int = 0
+    text_pos: int = 0
+
+
+class _SourceScanner:
+    """One pass over markdown that rewrites LaTeX and spoilers outside code."""
+
+    def __init__(self, markdown: str, latex_escape: bool, resume: _ScanState) -> None:
+        self._markdown = markdown
+        self._latex_escape = latex_escape
+        self._token_re = _TOKEN_RE if latex_escape else _TOKEN_NO_LATEX_RE
+        self._openers = _TOKEN_OPENERS if latex_escape else _TOKEN_NO_LATEX_OPENERS
+        self._parts: list[str] = []
+        self._changes: list[_Change] = []
+        # Source before _copied is in _parts; it starts at _text_pos in the output
+        self._copied = resume.source_pos
+        self._text_pos = resume.text_pos
+        # Source position and text offset minus source position of the last
+        # line start where a later scan may resume
+        self._resume_at = (resume.source_pos, resume.text_pos - resume.source_pos)
+        # Set once an opener does not close: nothing after it is final
+        self._blocked = False
+
+    def scan(self) -> tuple[str, list[_Change], _ScanState]:
+        markdown = self._markdown
+        end = len(markdown)
+        pos = gap_start = self._resume_at[0]
+        while True:
+            line_start, match = self._next_code_line(pos)
+            if match is None:
+                break
+            line_end = markdown.find("\n", line_start)
+            next_line = end if line_end < 0 else line_end + 1
+            fence = match.group("fence")
+            if fence:
+                close = _fence_close_re(fence).search(markdown, line_end) if line_end >= 0 else None
+                code_end = end if close is None else close.end()
+            else:
+                indent = len(match.group("indent").expandtabs(4))
+                code_end = None
+                if _follows_blank_line(markdown, line_start):
+                    threshold = _content_indent(markdown, line_start, indent) + 4
+                    if indent >= threshold:
+                        code_end = self._indented_code_end(next_line, threshold)
+                if code_end is None:
+                    pos = next_line
+                    continue
+            self._flush_gap(gap_start, line_start)
+            if code_end >= end:
+                gap_start = end
+                break
+            pos = gap_start = code_end
+        if gap_start < end:
+            self._flush_gap(gap_start, end)
+        self._parts.append(markdown[self._copied:])
+        pos, delta = self._resume_at
+        return "".join(self._parts), self._changes, _ScanState(pos, pos + delta)
+
+    def _next_code_line(self, pos: int) -> tuple[int, re.Match | None]:
+        """Start and match of the first line from *pos* on that may open a code block."""
+        if pos == 0:
+            match = _CODE_LINE_RE.match(self._markdown)
+            if match is not None:
+                return 0, match
+        match = _CODE_START_RE.search(self._markdown, max(pos - 1, 0))
+        if match is None:
+            return -1, None
+        return match.start() + 1, match
+
+    def _indented_code_end(self, pos: int, threshold: int) -> int:
+        """Start of the first line from *pos* on that is not blank or indented code."""
+        markdown = self._markdown
+        while pos < len(markdown):
+            line_end = markdown.find("\n", pos)
+            if line_end < 0:
+                line_end = len(markdown)
+            body, indent = _line_body(markdown, pos, line_end)
+            if body.strip() and indent < threshold:
+                return pos
+            pos = line_end + 1
+        return len(markdown)
+
+    def _flush_gap(self, start: int, end: int) -> None:
+        """Rewrite the tokens of the text between code blocks.
+
+        Tokens are tried only where an opener occurs: ``str.find`` gets there
+        far faster than the regex engine's own scan for a first character.
+        """
+        markdown = self._markdown
+        match_at = self._token_re.match
+        openers = self._openers
+        # Next position of each opener; *end* once there is none left
+        found = [markdown.find(opener, start, end) % (end + 1) for opener in openers]
+        safe_from = start
+        while True:
+            pos = min(found)
+            if pos >= end:
+                break
+            match = match_at(markdown, pos, end)
+            if match is None:
+                pos += 1
+            else:
+                if not self._blocked:
+                    self._note_resume(markdown.rfind("\n", max(safe_from - 1, 0), pos))
+                kind = match.lastgroup
+                if kind == "open" or (kind != "code" and "`" in match.group(0)):
+                    # A backtick run in a token body may still open a code span
+                    self._blocked = True
+                if kind == "spoiler":
+                    content = match.group("spoiler")
+                    if self._latex_escape and "\\" in content:
+                        content = _LATEX_RE.sub(_rewrite_latex_match, content)
+                    self._replace(match, f"<tg-spoiler>{content}</tg-spoiler>")
+                elif kind == "block" or kind == "inline":
+                    self._replace(match, _rewrite_latex_match(match))
+                pos = safe_from = match.end()
+            for i, next_pos in enumerate(found):
+                if next_pos < pos:
+                    found[i] = markdown.find(openers[i], pos, end) % (end + 1)
+        if not self._blocked and end > 0:
+            self._note_resume(markdown.rfind("\n", max(safe_from - 1, 0), end))
+
+    def _note_resume(self, newline: int) -> None:
+        """Resume after *newline* (if found), a line start clear of tokens."""
+        if newline >= 0:
+            self._resume_at = (newline + 1, self._text_pos - self._copied)
+
+    def _replace(self, match: re.Match, replacement: str) -> None:
+        if replacement == match.group(0):
+            return
+        start, end = match.span()
+        self._parts.append(self._markdown[self._copied:start])
+        self._text_pos += start - self._copied
+        self._changes.append((start, end, self._text_pos, self._text_pos + len(replacement)))
+        self._parts.append(replacement)
+        self._text_pos += len(replacement)
+        self._copied = end
+
+
+def _scan_source(
+    markdown: str, *, latex_escape: bool = True, resume: _ScanState | None = None
+) -> tuple[str, list[_Change], _ScanState]:
+    """Apply the source rewrites of :func:`_preprocess` to *markdown* from *resume* on.
+
+    Returns the rewritten ``markdown[resume.source_pos:]``, the changed
+    ranges and the last point where a scan of *markdown* with more text
+    appended may resume.  Text offsets continue from ``resume.text_pos``.
+    """
+    return _SourceScanner(markdown, latex_escape, resume or _ScanState()).scan()
+
+
+def _preprocess(markdown: str, *, latex_escape: bool = True) -> str:
+    """Apply the source-level rewrites that run before pyromark parsing.
+
+    One scan finds code blocks and code spans and, only outside them,
+    rewrites LaTeX ``\\(...\\)``/``\\[...\\]`` to Unicode and ``||spoiler||``
+    to ``<tg-spoiler>``.
+    """
+    if "||" not in markdown and not (latex_escape and "\\" in markdown):
+        return markdown
+    return _scan_source(markdown, latex_escape=latex_escape)[0]
 
 
 # --- Segment tracking --------------------------------------------------------
@@ -110,18 +415,51 @@ class Segment:
 # --- Text buffer & entity scope ---------------------------------------------
 
 
-class _TextBuffer:
-    """Accumulates plain text and tracks the current UTF-16 offset."""
+class _TextBuilder:
+    """Accumulates plain text with O(1) offset and trailing-newline queries.
 
-    __slots__ = ("_parts", "_utf16_offset")
+    Keeps running Python-index and UTF-16 totals, and records the Python index
+    of every astral character written so the finished text gets a
+    :class:`Utf16Index` without another scan.
+    """
 
-    def __init__(self) -> None:
-        self._parts: list[str] = []
-        self._utf16_offset: int = 0
+    __slots__ = ("_parts", "_py_offset", "_utf16_offset", "_trailing_newlines", "_astral")
+
+    def __init__(
+        self,
+        initial: str = "",
+        *,
+        utf16_offset: int = 0,
+        astral: list[int] | None = None,
+        trailing_newlines: int = 0,
+    ) -> None:
+        """Start empty, or continue after *initial* whose state the caller already knows."""
+        self._parts: list[str] = [initial] if initial else []
+        self._py_offset: int = len(initial)
+        self._utf16_offset: int = utf16_offset
+        self._trailing_newlines: int = trailing_newlines
+        self._astral: list[int] = list(astral) if astral else []
 
     def write(self, text: str) -> None:
+        if not text:
+            return
         self._parts.append(text)
-        self._utf16_offset += utf16_len(text)
+        if text.isascii():
+            self._utf16_offset += len(text)
+        else:
+            base = self._py_offset
+            astral = astral_positions(text)
+            self._astral.extend(base + pos for pos in astral)
+            self._utf16_offset += len(text) + len(astral)
+        self._py_offset += len(text)
+        if text[-1] != "\n":
+            self._trailing_newlines = 0
+        else:
+            body = len(text.rstrip("\n"))
+            if body:
+                self._trailing_newlines = len(text) - body
+            else:
+                self._trailing_newlines += len(text)
 
     @property
     def utf16_offset(self) -> int:
@@ -129,26 +467,43 @@ class _TextBuffer:
 
     @property
     def py_offset(self) -> int:
-        return sum(len(p) for p in self._parts)
+        return self._py_offset
+
+    @property
+    def astral_count(self) -> int:
+        return len(self._astral)
 
     def trailing_newline_count(self) -> int:
         """Count trailing newline characters in the buffer."""
-        count = 0
-        for part in reversed(self._parts):
-            for ch in reversed(part):
-                if ch == "\n":
-                    count += 1
-                else:
-                    return count
-        return count
+        return self._trailing_newlines
 
     def pop_last(self) -> str:
         """移除并返回最后写入的部分。用于替换刚写入的 bullet 前缀。"""
-        if self._parts:
-            part = self._parts.pop()
-            self._utf16_offset -= utf16_len(part)
-            return part
-        return ""
+        if not self._parts:
+            return ""
+        part = self._parts.pop()
+        self._py_offset -= len(part)
+        while self._astral and self._astral[-1] >= self._py_offset:
+            self._astral.pop()
+            self._utf16_offset -= 1
+        self._utf16_offset -= len(part)
+        # Rare path (task list markers): recount from the remaining parts
+        count = 0
+        for rest in reversed(self._parts):
+            body = len(rest.rstrip("\n"))
+            count += len(rest) - body
+            if body:
+                break
+        self._trailing_newlines = count
+        return part
+
+    def astral_prefix(self, count: int) -> list[int]:
+        """The first *count* recorded astral positions."""
+        return self._astral[:count]
+
+    def utf16_index(self) -> Utf16Index:
+        """Python index ↔ UTF-16 offset index of the text written so far."""
+        return Utf16Index.from_astral(list(self._astral), self._py_offset)
 
     def get_text(self) -> str:
         return "".join(self._parts)
@@ -165,18 +520,35 @@ class _EntityScope:
     custom_emoji_id: Optional[str] = None
 
 
+@dataclasses.dataclass(slots=True)
+class _WalkerCheckpoint:
+    """Output of an EventWalker up to a closed top-level block."""
+
+    text: str = ""
+    utf16_offset: int = 0
+    astral: list[int] = dataclasses.field(default_factory=list)
+    trailing_newlines: int = 0
+    entities: list[MessageEntity] = dataclasses.field(default_factory=list)
+    segments: list[Segment] = dataclasses.field(default_factory=list)
+    block_count: int = 0
+
+
+# handler(walker, payload, source_range) for one kind of pyromark event
+EventHandler = Callable[["EventWalker", Any, Optional[dict]], None]
+
+
 # --- EventWalker state machine -----------------------------------------------
 
 
 class EventWalker:
     """Walks pyromark events and produces (text, entities, segments)."""
 
-    def __init__(self, config: RenderConfig, source_markdown: str) -> None:
-        self._buf = _TextBuffer()
+    def __init__(self, config: RenderConfig | RenderProfile, source_markdown: str) -> None:
+        self._buf = _TextBuilder()
         self._entity_stack: list[_EntityScope] = []
         self._entities: list[MessageEntity] = []
         self._segments: list[Segment] = []
-        self._config = config
+        self._profile = RenderProfile.from_config(config)
         self._source_bytes = source_markdown.encode("utf-8")
 
         # Block-level state
@@ -210,140 +582,146 @@ class EventWalker:
     def walk(self, events: tuple) -> tuple[str, list[MessageEntity], list[Segment]]:
         for event in events:
             self._handle_event(event)
+        return self._finish()
+
+    def _resume(self, checkpoint: _WalkerCheckpoint) -> None:
+        """Continue after a closed top-level block of a previous walk.
+
+        The source handed to ``__init__`` must start exactly where the
+        checkpointed block ended, so the block gap is measured from offset 0.
+        """
+        self._buf = _TextBuilder(
+            checkpoint.text,
+            utf16_offset=checkpoint.utf16_offset,
+            astral=checkpoint.astral,
+            trailing_newlines=checkpoint.trailing_newlines,
+        )
+        self._entities = list(checkpoint.entities)
+        self._segments = list(checkpoint.segments)
+        self._block_count = checkpoint.block_count
+        if checkpoint.block_count > 0:
+            self._last_block_end_source = 0
+
+    def _is_idle(self) -> bool:
+        """Whether no block or entity is open, i.e. the walk can be cut here."""
+        return not (
+            self._entity_stack
+            or self._list_stack
+            or self._blockquote_scopes
+            or self._in_table
+            or self._in_code_block
+            or self._in_heading
+        )
+
+    def utf16_index(self) -> Utf16Index:
+        """UTF-16 index of the text produced so far, recorded while writing."""
+        return self._buf.utf16_index()
+
+    def _finish(self) -> tuple[str, list[MessageEntity], list[Segment]]:
         text = self._buf.get_text()
-        # Post-process: upgrade long blockquotes to expandable
-        if self._config.cite_expandable:
-            for ent in self._entities:
-                if ent.type == "blockquote" and ent.length > 200:
-                    ent.type = "expandable_blockquote"
-        return text, self._entities, self._segments
+        entities = self._entities
+        # Post-process: upgrade long blockquotes to expandable. New entities,
+        # since streaming checkpoints share these with earlier results
+        threshold = self._profile.expandable_threshold
+        if threshold is not None:
+            entities = [
+                dataclasses.replace(ent, type="expandable_blockquote")
+                if ent.type == "blockquote" and ent.length > threshold
+                else ent
+                for ent in entities
+            ]
+        return text, entities, self._segments
 
     # -- Dispatch --------------------------------------------------------------
 
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._bind_handlers()
+
+    @classmethod
+    def _bind_handlers(cls) -> None:
+        """Resolve ``cls._handlers`` into ``cls._dispatch``.
+
+        Handler names are looked up on *cls*, so ``_on_*`` overrides in a
+        subclass are dispatched to without registering them.
+        """
+
+        def bind(spec):
+            if isinstance(spec, str):
+                return getattr(cls, spec)
+            if isinstance(spec, tuple):
+                name, entity_type = spec
+                return functools.partial(getattr(cls, name), entity_type=entity_type)
+            return spec
+
+        cls._dispatch = {
+            kind: {tag: bind(spec) for tag, spec in spec.items()}
+            if isinstance(spec, dict) else bind(spec)
+            for kind, spec in cls._handlers.items()
+        }
+
+    @classmethod
+    def register_handler(
+        cls,
+        kind: str,
+        handler: EventHandler | None,
+        *,
+        tag: str | None = None,
+    ) -> None:
+        """Install (or with ``None``, remove) the handler for an event kind.
+
+        Leaf events are addressed by *kind* alone (``"Text"``, ``"Rule"``);
+        container events by ``kind="Start"``/``"End"`` plus the *tag* name
+        (``"Heading"``). The handler is called as
+        ``handler(walker, payload, source_range)``. Registering on a subclass
+        leaves the parent class table untouched and is inherited by further
+        subclasses.
+        """
+        if "_handlers" not in cls.__dict__:
+            cls._handlers = {
+                k: dict(v) if isinstance(v, dict) else v for k, v in cls._handlers.items()
+            }
+        table = cls._handlers
+        if tag is not None:
+            table = table.setdefault(kind, {})
+            kind = tag
+        if handler is None:
+            table.pop(kind, None)
+        else:
+            table[kind] = handler
+        cls._bind_handlers()
+
     def _handle_event(self, event) -> None:
         source_range = None
-        if (
-            isinstance(event, tuple)
-            and len(event) == 2
-            and isinstance(event[1], dict)
-        ):
+        if event.__class__ is tuple:
             event, source_range = event
 
-        if isinstance(event, str):
-            if event == "SoftBreak":
-                self._on_soft_break()
-            elif event == "HardBreak":
-                self._on_hard_break()
-            elif event == "Rule":
-                self._on_rule(source_range)
-            return
-
-        if not isinstance(event, dict):
+        if event.__class__ is str:
+            handler = self._dispatch.get(event)
+            payload = None
+        elif event.__class__ is dict:
+            # pyromark events are single-key dicts
+            for kind in event:
+                payload = event[kind]
+            handler = self._dispatch.get(kind)
+            if handler.__class__ is dict:
+                # Start/End: the tag is a bare name or a single-key {name: data}
+                if payload.__class__ is dict:
+                    for name in payload:
+                        payload = payload[name]
+                    handler = handler.get(name)
+                else:
+                    handler = handler.get(payload)
+                    payload = None
+        else:
             return
 
-        if "Start" in event:
-            self._on_start(event["Start"], source_range)
-        elif "End" in event:
-            self._on_end(event["End"], source_range)
-        elif "Text" in event:
-            self._on_text(event["Text"])
-        elif "Code" in event:
-            self._on_inline_code(event["Code"])
-        elif "InlineMath" in event:
-            self._on_inline_math(event["InlineMath"])
-        elif "DisplayMath" in event:
-            self._on_display_math(event["DisplayMath"], source_range)
-        elif "InlineHtml" in event:
-            self._on_inline_html(event["InlineHtml"])
-        elif "Html" in event:
-            pass  # Block HTML ignored
-        elif "TaskListMarker" in event:
-            self._on_task_list_marker(event["TaskListMarker"])
-        elif "FootnoteReference" in event:
-            self._on_text(f"[{event['FootnoteReference']}]")
-
-    # -- Start events ----------------------------------------------------------
-
-    def _on_start(self, tag, source_range: dict[str, int] | None = None) -> None:
-        source_start = self._source_start(source_range)
-        if tag == "Strong":
-            self._push_entity("bold")
-        elif tag == "Emphasis":
-            self._push_entity("italic")
-        elif tag == "Strikethrough":
-            self._push_entity("strikethrough")
-        elif tag == "Paragraph":
-            self._on_start_paragraph(source_start)
-        elif tag == "Item":
-            self._on_start_item()
-        elif tag == "TableHead":
-            self._current_row = []
-        elif tag == "TableRow":
-            self._current_row = []
-        elif tag == "TableCell":
-            self._cell_parts = []
-            self._in_table_cell = True
-        elif tag == "HtmlBlock":
-            pass
-        elif isinstance(tag, dict):
-            if "Heading" in tag:
-                self._on_start_heading(tag["Heading"], source_start)
-            elif "CodeBlock" in tag:
-                self._on_start_code_block(tag["CodeBlock"], source_start)
-            elif "BlockQuote" in tag:
-                self._on_start_blockquote(source_start)
-            elif "Link" in tag:
-                self._on_start_link(tag["Link"])
-            elif "Image" in tag:
-                self._on_start_image(tag["Image"])
-            elif "List" in tag:
-                self._on_start_list(tag["List"], source_start)
-            elif "Table" in tag:
-                self._on_start_table(tag["Table"], source_start)
-            elif "FootnoteDefinition" in tag:
-                self._ensure_block_spacing(source_start)
-
-    # -- End events ------------------------------------------------------------
-
-    def _on_end(self, tag, source_range: dict[str, int] | None = None) -> None:
-        source_end = self._source_end(source_range)
-        if tag == "Strong":
-            self._pop_entity("bold")
-        elif tag == "Emphasis":
-            self._pop_entity("italic")
-        elif tag == "Strikethrough":
-            self._pop_entity("strikethrough")
-        elif tag == "Paragraph":
-            self._on_end_paragraph(source_end)
-        elif tag == "Item":
-            self._on_end_item()
-        elif tag == "CodeBlock":
-            self._on_end_code_block(source_end)
-        elif tag == "Table":
-            self._on_end_table(source_end)
-        elif tag == "TableCell":
-            self._on_end_table_cell()
-        elif tag == "TableRow":
-            self._on_end_table_row()
-        elif tag == "TableHead":
-            self._on_end_table_row()  # Header cells are directly inside TableHead
-        elif tag == "Link":
-            self._pop_entity("text_link")
-        elif tag == "Image":
-            self._pop_entity_any()
-        elif tag == "FootnoteDefinition":
-            pass
-        elif isinstance(tag, dict):
-            if "Heading" in tag:
-                self._on_end_heading(source_end)
-            elif "BlockQuote" in tag:
-                self._on_end_blockquote(source_end)
-            elif "List" in tag:
-                self._on_end_list(source_end)
+        if handler is not None:
+            handler(self, payload, source_range)
 
     # -- Inline events ---------------------------------------------------------
 
-    def _on_text(self, text: str) -> None:
+    def _on_text(self, text: str, source_range: dict[str, int] | None = None) -> None:
         if self._in_code_block:
             self._code_block_parts.append(text)
             return
@@ -352,7 +730,7 @@ class EventWalker:
             return
         self._buf.write(text)
 
-    def _on_soft_break(self) -> None:
+    def _on_soft_break(self, payload: None, source_range: dict[str, int] | None) -> None:
         if self._in_code_block:
             self._code_block_parts.append("\n")
             return
@@ -361,18 +739,18 @@ class EventWalker:
             return
         self._buf.write("\n")
 
-    def _on_hard_break(self) -> None:
+    def _on_hard_break(self, payload: None, source_range: dict[str, int] | None) -> None:
         if self._in_code_block:
             self._code_block_parts.append("\n")
             return
         self._buf.write("\n")
 
-    def _on_rule(self, source_range: dict[str, int] | None = None) -> None:
+    def _on_rule(self, payload: None, source_range: dict[str, int] | None) -> None:
         self._ensure_block_spacing(self._source_start(source_range))
         self._buf.write("————————")
         self._mark_block_end(self._source_end(source_range))
 
-    def _on_inline_code(self, code: str) -> None:
+    def _on_inline_code(self, code: str, source_range: dict[str, int] | None) -> None:
         if self._in_table_cell:
             self._cell_parts.append(code)
             return
@@ -382,7 +760,7 @@ class EventWalker:
         if length > 0:
             self._entities.append(MessageEntity(type="code", offset=start, length=length))
 
-    def _on_inline_math(self, math: str) -> None:
+    def _on_inline_math(self, math: str, source_range: dict[str, int] | None) -> None:
         converted = math
         if _contains_latex_symbols(math):
             converted = _latex_helper.convert(math).strip().strip("\n")
@@ -392,7 +770,7 @@ class EventWalker:
         if length > 0:
             self._entities.append(MessageEntity(type="code", offset=start, length=length))
 
-    def _on_display_math(self, math: str, source_range: dict[str, int] | None = None) -> None:
+    def _on_display_math(self, math: str, source_range: dict[str, int] | None) -> None:
         converted = math
         if _contains_latex_symbols(math):
             converted = _latex_helper.convert(math).strip()
@@ -404,7 +782,7 @@ class EventWalker:
             self._entities.append(MessageEntity(type="pre", offset=start, length=length))
         self._mark_block_end(self._source_end(source_range))
 
-    def _on_inline_html(self, html: str) -> None:
+    def _on_inline_html(self, html: str, source_range: dict[str, int] | None) -> None:
         tag = html.strip().lower()
         if tag == "<tg-spoiler>":
             self._push_entity("spoiler")
@@ -412,12 +790,11 @@ class EventWalker:
             self._pop_entity("spoiler")
         # Other inline HTML is ignored
 
-    def _on_task_list_marker(self, checked: bool) -> None:
-        symbol = (
-            self._config.markdown_symbol.task_completed
-            if checked
-            else self._config.markdown_symbol.task_uncompleted
-        )
+    def _on_footnote_reference(self, label: str, source_range: dict[str, int] | None) -> None:
+        self._on_text(f"[{label}]")
+
+    def _on_task_list_marker(self, checked: bool, source_range: dict[str, int] | None) -> None:
+        symbol = self._profile.task_markers[checked]
         # 移除 _on_start_item 刚写入的 bullet 前缀（"⦁ " 或 "N. "），替换为 task marker
         self._buf.pop_last()
         self._buf.write(f"{self._item_indent}{symbol} ")
@@ -434,59 +811,49 @@ class EventWalker:
         "H6": ["italic"],
     }
 
-    def _on_start_heading(
-        self, heading_data: dict, source_start: int | None = None
-    ) -> None:
-        self._ensure_block_spacing(source_start)
+    def _on_start_heading(self, heading_data: dict, source_range: dict[str, int] | None) -> None:
+        self._ensure_block_spacing(self._source_start(source_range))
         level = heading_data["level"]
-        symbol_map = {
-            "H1": self._config.markdown_symbol.heading_level_1,
-            "H2": self._config.markdown_symbol.heading_level_2,
-            "H3": self._config.markdown_symbol.heading_level_3,
-            "H4": self._config.markdown_symbol.heading_level_4,
-            "H5": self._config.markdown_symbol.heading_level_5,
-            "H6": self._config.markdown_symbol.heading_level_6,
-        }
-        prefix = symbol_map.get(level, "")
+        prefix = self._profile.heading_prefixes.get(level, "")
         if prefix:
-            self._buf.write(prefix + " ")
+            self._buf.write(prefix)
         self._heading_entities = self._HEADING_ENTITIES.get(level, ["bold"])
         for etype in self._heading_entities:
             self._push_entity(etype)
         self._in_heading = True
 
-    def _on_end_heading(self, source_end: int | None = None) -> None:
+    def _on_end_heading(self, payload: None, source_range: dict[str, int] | None) -> None:
         for etype in reversed(self._heading_entities):
             self._pop_entity(etype)
         self._heading_entities = []
         self._in_heading = False
-        self._mark_block_end(source_end)
+        self._mark_block_end(self._source_end(source_range))
 
     # -- Paragraph -------------------------------------------------------------
 
-    def _on_start_paragraph(self, source_start: int | None = None) -> None:
+    def _on_start_paragraph(self, payload: None, source_range: dict[str, int] | None) -> None:
         if not self._list_stack:
-            self._ensure_block_spacing(source_start)
+            self._ensure_block_spacing(self._source_start(source_range))
 
-    def _on_end_paragraph(self, source_end: int | None = None) -> None:
+    def _on_end_paragraph(self, payload: None, source_range: dict[str, int] | None) -> None:
         if not self._list_stack:
-            self._mark_block_end(source_end)
+            self._mark_block_end(self._source_end(source_range))
         elif self._buf.trailing_newline_count() == 0:
             # loose list 中段落结束时写入换行，避免多段落粘连
             self._buf.write("\n")
 
     # -- Code block ------------------------------------------------------------
 
-    def _on_start_code_block(self, kind, source_start: int | None = None) -> None:
+    def _on_start_code_block(self, kind, source_range: dict[str, int] | None) -> None:
         self._in_code_block = True
         self._code_block_parts = []
-        self._code_block_start_source = source_start
+        self._code_block_start_source = self._source_start(source_range)
         if isinstance(kind, dict) and "Fenced" in kind:
             self._code_block_lang = kind["Fenced"]
         else:
             self._code_block_lang = ""
 
-    def _on_end_code_block(self, source_end: int | None = None) -> None:
+    def _on_end_code_block(self, payload: None, source_range: dict[str, int] | None) -> None:
         self._in_code_block = False
         raw_code = "".join(self._code_block_parts)
         # Strip single trailing newline (pulldown-cmark adds one)
@@ -528,19 +895,19 @@ class EventWalker:
             )
         )
 
-        self._mark_block_end(source_end)
+        self._mark_block_end(self._source_end(source_range))
         self._code_block_lang = ""
         self._code_block_parts = []
         self._code_block_start_source = None
 
     # -- Blockquote ------------------------------------------------------------
 
-    def _on_start_blockquote(self, source_start: int | None = None) -> None:
-        self._ensure_block_spacing(source_start)
+    def _on_start_blockquote(self, payload: None, source_range: dict[str, int] | None) -> None:
+        self._ensure_block_spacing(self._source_start(source_range))
         scope = _EntityScope("blockquote", self._buf.utf16_offset)
         self._blockquote_scopes.append(scope)
 
-    def _on_end_blockquote(self, source_end: int | None = None) -> None:
+    def _on_end_blockquote(self, payload: None, source_range: dict[str, int] | None) -> None:
         if self._blockquote_scopes:
             scope = self._blockquote_scopes.pop()
             length = self._buf.utf16_offset - scope.start_offset
@@ -552,11 +919,11 @@ class EventWalker:
                         length=length,
                     )
                 )
-        self._mark_block_end(source_end)
+        self._mark_block_end(self._source_end(source_range))
 
     # -- Links -----------------------------------------------------------------
 
-    def _on_start_link(self, link_data: dict) -> None:
+    def _on_start_link(self, link_data: dict, source_range: dict[str, int] | None) -> None:
         dest_url = link_data.get("dest_url", "")
         emoji_id = _validate_telegram_emoji(dest_url)
         if emoji_id:
@@ -567,25 +934,25 @@ class EventWalker:
 
     # -- Images ----------------------------------------------------------------
 
-    def _on_start_image(self, image_data: dict) -> None:
+    def _on_start_image(self, image_data: dict, source_range: dict[str, int] | None) -> None:
         dest_url = image_data.get("dest_url", "")
         emoji_id = _validate_telegram_emoji(dest_url)
         if emoji_id:
             self._push_entity("custom_emoji", custom_emoji_id=emoji_id)
         else:
-            self._buf.write(self._config.markdown_symbol.image)
+            self._buf.write(self._profile.image)
             self._push_entity("text_link", url=dest_url)
 
     # -- Lists -----------------------------------------------------------------
 
     def _on_start_list(
-        self, start_number: int | None, source_start: int | None = None
+        self, start_number: int | None, source_range: dict[str, int] | None
     ) -> None:
         if not self._list_stack:
-            self._ensure_block_spacing(source_start)
+            self._ensure_block_spacing(self._source_start(source_range))
         self._list_stack.append(start_number)
 
-    def _on_start_item(self) -> None:
+    def _on_start_item(self, payload: None, source_range: dict[str, int] | None) -> None:
         depth = len(self._list_stack)
         indent = "  " * (depth - 1) if depth > 1 else ""
         current_list = self._list_stack[-1] if self._list_stack else None
@@ -604,35 +971,42 @@ class EventWalker:
             self._buf.write(f"{indent}⦁ ")
         self._item_started = True
 
-    def _on_end_item(self) -> None:
+    def _on_end_item(self, payload: None, source_range: dict[str, int] | None) -> None:
         if self._buf.trailing_newline_count() == 0:
             self._buf.write("\n")
         self._item_started = False
 
-    def _on_end_list(self, source_end: int | None = None) -> None:
+    def _on_end_list(self, payload: None, source_range: dict[str, int] | None) -> None:
         if self._list_stack:
             self._list_stack.pop()
         if not self._list_stack:
-            self._mark_block_end(source_end)
+            self._mark_block_end(self._source_end(source_range))
 
     # -- Tables ----------------------------------------------------------------
 
-    def _on_start_table(self, alignments, source_start: int | None = None) -> None:
-        self._ensure_block_spacing(source_start)
+    def _on_start_table(self, alignments, source_range: dict[str, int] | None) -> None:
+        self._ensure_block_spacing(self._source_start(source_range))
         self._in_table = True
         self._table_alignments = alignments if isinstance(alignments, tuple) else ()
         self._table_rows = []
 
-    def _on_end_table_cell(self) -> None:
+    def _on_start_table_row(self, payload: None, source_range: dict[str, int] | None) -> None:
+        self._current_row = []
+
+    def _on_start_table_cell(self, payload: None, source_range: dict[str, int] | None) -> None:
+        self._cell_parts = []
+        self._in_table_cell = True
+
+    def _on_end_table_cell(self, payload: None, source_range: dict[str, int] | None) -> None:
         self._current_row.append("".join(self._cell_parts))
         self._cell_parts = []
         self._in_table_cell = False
 
-    def _on_end_table_row(self) -> None:
+    def _on_end_table_row(self, payload: None, source_range: dict[str, int] | None) -> None:
         self._table_rows.append(self._current_row)
         self._current_row = []
 
-    def _on_end_table(self, source_end: int | None = None) -> None:
+    def _on_end_table(self, payload: None, source_range: dict[str, int] | None) -> None:
         self._in_table = False
         table_text = self._format_table(self._table_rows)
 
@@ -642,7 +1016,7 @@ class EventWalker:
         if length > 0:
             self._entities.append(MessageEntity(type="pre", offset=start, length=length))
         self._table_rows = []
-        self._mark_block_end(source_end)
+        self._mark_block_end(self._source_end(source_range))
 
     def _format_table(self, rows: list[list[str]]) -> str:
         if not rows:
@@ -687,6 +1061,24 @@ class EventWalker:
                 self._finalize_entity(scope)
                 return
 
+    def _on_start_format(
+        self, payload: None, source_range: dict[str, int] | None, *, entity_type: str
+    ) -> None:
+        self._entity_stack.append(_EntityScope(entity_type, self._buf.utf16_offset))
+
+    def _on_end_format(
+        self, payload: None, source_range: dict[str, int] | None, *, entity_type: str
+    ) -> None:
+        self._pop_entity(entity_type)
+
+    def _on_start_footnote_definition(
+        self, payload: None, source_range: dict[str, int] | None
+    ) -> None:
+        self._ensure_block_spacing(self._source_start(source_range))
+
+    def _on_end_image(self, payload: None, source_range: dict[str, int] | None) -> None:
+        self._pop_entity_any()
+
     def _pop_entity_any(self) -> None:
         if self._entity_stack:
             scope = self._entity_stack.pop()
@@ -741,6 +1133,67 @@ class EventWalker:
             if needed > 0:
                 self._buf.write("\n" * needed)
 
+    # -- Dispatch table --------------------------------------------------------
+
+    # Event kind → handler(walker, payload, source_range).  "Start" and "End"
+    # map to a nested table keyed by tag name; kinds without an entry (e.g.
+    # block "Html") are ignored.  Entries name an ``_on_*`` method, or give
+    # (method, entity_type) for the formatting tags, or are registered
+    # callables.  ``_bind_handlers`` resolves them per class into
+    # ``_dispatch``, so routing an event costs one call.
+    _handlers: dict[str, Any] = {
+        "Text": "_on_text",
+        "Code": "_on_inline_code",
+        "InlineMath": "_on_inline_math",
+        "DisplayMath": "_on_display_math",
+        "InlineHtml": "_on_inline_html",
+        "TaskListMarker": "_on_task_list_marker",
+        "FootnoteReference": "_on_footnote_reference",
+        "SoftBreak": "_on_soft_break",
+        "HardBreak": "_on_hard_break",
+        "Rule": "_on_rule",
+        "Start": {
+            "Strong": ("_on_start_format", "bold"),
+            "Emphasis": ("_on_start_format", "italic"),
+            "Strikethrough": ("_on_start_format", "strikethrough"),
+            "Paragraph": "_on_start_paragraph",
+            "Item": "_on_start_item",
+            "TableHead": "_on_start_table_row",
+            "TableRow": "_on_start_table_row",
+            "TableCell": "_on_start_table_cell",
+            "Heading": "_on_start_heading",
+            "CodeBlock": "_on_start_code_block",
+            "BlockQuote": "_on_start_blockquote",
+            "Link": "_on_start_link",
+            "Image": "_on_start_image",
+            "List": "_on_start_list",
+            "Table": "_on_start_table",
+            "FootnoteDefinition": "_on_start_footnote_definition",
+        },
+        "End": {
+            "Strong": ("_on_end_format", "bold"),
+            "Emphasis": ("_on_end_format", "italic"),
+            "Strikethrough": ("_on_end_format", "strikethrough"),
+            "Paragraph": "_on_end_paragraph",
+            "Item": "_on_end_item",
+            "CodeBlock": "_on_end_code_block",
+            "Table": "_on_end_table",
+            "TableCell": "_on_end_table_cell",
+            "TableRow": "_on_end_table_row",
+            # Header cells are directly inside TableHead
+            "TableHead": "_on_end_table_row",
+            "Link": ("_on_end_format", "text_link"),
+            "Image": "_on_end_image",
+            "Heading": "_on_end_heading",
+            "BlockQuote": "_on_end_blockquote",
+            "List": "_on_end_list",
+        },
+    }
+    _dispatch: dict[str, EventHandler | dict[str, EventHandler]]
+
+
+EventWalker._bind_handlers()
+
 
 # --- Public API ---------------------------------------------------------------
 
@@ -749,18 +1202,15 @@ def convert(
     markdown: str,
     *,
     latex_escape: bool = True,
-    config: RenderConfig | None = None,
+    config: RenderConfig | RenderProfile | None = None,
 ) -> tuple[str, list[MessageEntity]]:
     """Convert markdown to (plain_text, entities) for Telegram.
 
     :param markdown: Raw markdown text.
     :param latex_escape: Whether to convert LaTeX to Unicode.
-    :param config: Render configuration. Uses global config if None.
+    :param config: Render configuration or profile. Uses global config if None.
     :return: Tuple of (plain_text, list_of_entities).
     """
-    if config is None:
-        config = get_runtime_config()
-
     text, entities, _ = convert_with_segments(
         markdown, latex_escape=latex_escape, config=config
     )
@@ -771,20 +1221,329 @@ def convert_with_segments(
     markdown: str,
     *,
     latex_escape: bool = True,
-    config: RenderConfig | None = None,
+    config: RenderConfig | RenderProfile | None = None,
 ) -> tuple[str, list[MessageEntity], list[Segment]]:
     """Convert markdown to (plain_text, entities, segments).
 
     Like convert(), but also returns segment information for the pipeline.
     """
-    if config is None:
-        config = get_runtime_config()
+    text, entities, segments, _ = convert_with_index(
+        markdown, latex_escape=latex_escape, config=config
+    )
+    return text, entities, segments
+
 
-    preprocessed = markdown
-    if latex_escape:
-        preprocessed = _escape_latex(preprocessed)
-    preprocessed = _preprocess_spoilers(preprocessed)
+def convert_with_index(
+    markdown: str,
+    *,
+    latex_escape: bool = True,
+    config: RenderConfig | RenderProfile | None = None,
+) -> tuple[str, list[MessageEntity], list[Segment], Utf16Index]:
+    """Like convert_with_segments(), plus the UTF-16 index of the plain text.
 
+    The index is recorded while the text is built, so callers that split or
+    slice the text never need to rebuild an offset table.
+    """
+    preprocessed = _preprocess(markdown, latex_escape=latex_escape)
     events = pyromark.events_with_range(preprocessed, options=STANDARD_OPTIONS)
     walker = EventWalker(config, preprocessed)
-    return walker.walk(events)
+    text, entities, segments = walker.walk(events)
+    return text, entities, segments, walker.utf16_index()
+
+
+# --- Streaming ---------------------------------------------------------------
+
+# Link reference definitions resolve across the whole document, so a tail
+# parsed on its own could change earlier blocks.  Deliberately loose: a false
+# positive only turns incremental parsing off.
+_LINK_REFERENCE_RE = re.compile(r"\[[^\]\n]+\]:")
+
+
+@dataclasses.dataclass(slots=True)
+class _BlockMark:
+    """Walker position right after a closed top-level block."""
+
+    source_end: int  # UTF-8 byte offset in the parsed source
+    py_offset: int
+    utf16_offset: int
+    astral_count: int
+    trailing_newlines: int
+    entity_count: int
+    segment_count: int
+    block_count: int
+
+
+class StreamingConverter:
+    """Incrementally convert markdown that arrives in appended chunks.
+
+    Designed for LLM token streams: every :meth:`feed` returns the same
+    ``(text, entities)`` as ``convert()`` on the accumulated source, but only
+    the open tail after the last stable top-level block is re-parsed.
+
+    A top-level block is treated as stable once two further top-level blocks
+    have been parsed after it, so a partially received line can never change
+    how the block was closed.  Preprocessing (LaTeX and spoilers) resumes
+    from the last point no later text can affect.  If its changed ranges
+    show that the already committed prefix was rewritten differently, the
+    converter falls back to a full re-parse.
+
+    Entities of committed blocks are shared between successive results and
+    must be treated as read-only.
+    """
+
+    def __init__(
+        self,
+        *,
+        latex_escape: bool = True,
+        config: RenderConfig | RenderProfile | None = None,
+    ) -> None:
+        self._latex_escape = latex_escape
+        # Snapshot once so every feed renders the stream the same way
+        self._profile = RenderProfile.from_config(config)
+        self._source_parts: list[str] = []
+        self._incremental = True
+        self._reset_scan()
+        # Length of the preprocessed source covered by the checkpoint, and
+        # the preprocessing changes within it
+        self._committed_len = 0
+        self._committed_changes: list[_Change] = []
+        self._checkpoint = _WalkerCheckpoint()
+        self._segments: list[Segment] = []
+
+    @property
+    def source(self) -> str:
+        """The raw markdown fed so far."""
+        return "".join(self._source_parts)
+
+    @property
+    def segments(self) -> list[Segment]:
+        """Segments of the latest result (see ``convert_with_segments``)."""
+        return self._segments
+
+    def reset(self) -> None:
+        """Drop all fed text and start a new document."""
+        self._source_parts = []
+        self._incremental = True
+        self._reset_scan()
+        self._rollback()
+        self._segments = []
+
+    def feed(self, chunk: str) -> tuple[str, list[MessageEntity]]:
+        """Append *chunk* and return ``(text, entities)`` for the whole source."""
+        if chunk:
+            self._source_parts.append(chunk)
+        text, entities, self._segments = self._convert()
+        return text, list(entities)
+
+    def _reset_scan(self) -> None:
+        # Preprocessing resumes at _scan_state; the output and changes before it
+        self._scan_state = _ScanState()
+        self._scan_text = ""
+        self._scan_changes: list[_Change] = []
+        self._changes: list[_Change] = []
+
+    def _preprocess(self) -> str:
+        """Preprocess the source, rescanning only from the last resume point."""
+        tail, tail_changes, state = _scan_source(
+            self.source, latex_escape=self._latex_escape, resume=self._scan_state
+        )
+        preprocessed = self._scan_text + tail
+        self._changes = self._scan_changes + tail_changes
+        self._scan_state = state
+        self._scan_text = preprocessed[: state.text_pos]
+        self._scan_changes = [c for c in self._changes if c[2] < state.text_pos]
+        return preprocessed
+
+    def _committed_prefix_unchanged(self) -> bool:
+        # The source only grows, so the committed prefix is rewritten the same
+        # way exactly when the same changes, and no new ones, fall inside it
+        count = len(self._committed_changes)
+        return self._changes[:count] == self._committed_changes and (
+            len(self._changes) == count or self._changes[count][2] >= self._committed_len
+        )
+
+    def _convert(self) -> tuple[str, list[MessageEntity], list[Segment]]:
+        preprocessed = self._preprocess()
+        if not self._committed_prefix_unchanged():
+            self._rollback()
+        tail = preprocessed[self._committed_len:]
+        if self._incremental and _LINK_REFERENCE_RE.search(tail):
+            self._incremental = False
+            self._rollback()
+            tail = preprocessed
+
+        walker = EventWalker(self._profile, tail)
+        walker._resume(self._checkpoint)
+        # One entry per closed top-level block; None where the walk cannot be
+        # resumed after that block.
+        closed: list[_BlockMark | None] = []
+        depth = 0
+        for event in pyromark.events_with_range(tail, options=STANDARD_OPTIONS):
+            walker._handle_event(event)
+            kind, source_range = event
+            if isinstance(kind, dict):
+                if "Start" in kind:
+                    depth += 1
+                    continue
+                if "End" not in kind:
+                    continue
+                depth -= 1
+            elif kind != "Rule":
+                continue
+            if depth != 0:
+                continue
+            source_end = source_range["end"]
+            if walker._is_idle() and walker._last_block_end_source == source_end:
+                closed.append(
+                    _BlockMark(
+                        source_end=source_end,
+                        py_offset=walker._buf.py_offset,
+                        utf16_offset=walker._buf.utf16_offset,
+                        astral_count=walker._buf.astral_count,
+                        trailing_newlines=walker._buf.trailing_newline_count(),
+                        entity_count=len(walker._entities),
+                        segment_count=len(walker._segments),
+                        block_count=walker._block_count,
+                    )
+                )
+            else:
+                closed.append(None)
+
+        text, entities, segments = walker._finish()
+        if self._incremental:
+            # The last two blocks may still change with the next chunk
+            for mark in reversed(closed[:-2]):
+                if mark is not None:
+                    self._commit(walker, mark, text, entities, segments)
+                    break
+        return text, entities, segments
+
+    def _commit(
+        self,
+        walker: EventWalker,
+        mark: _BlockMark,
+        text: str,
+        entities: list[MessageEntity],
+        segments: list[Segment],
+    ) -> None:
+        self._committed_len += len(walker._source_bytes[: mark.source_end].decode("utf-8"))
+        self._committed_changes = [c for c in self._changes if c[2] < self._committed_len]
+        self._checkpoint = _WalkerCheckpoint(
+            text=text[: mark.py_offset],
+            utf16_offset=mark.utf16_offset,
+            astral=walker._buf.astral_prefix(mark.astral_count),
+            trailing_newlines=mark.trailing_newlines,
+            entities=entities[: mark.entity_count],
+            segments=segments[: mark.segment_count],
+            block_count=mark.block_count,
+        )
+
+    def _rollback(self) -> None:
+        self._committed_len = 0
+        self._committed_changes = []
+        self._checkpoint = _WalkerCheckpoint()
+
+
+# --- Block-level splitting ---------------------------------------------------
+
+# Top-level blocks whose End records the block end, so a walk resumed right
+# after them produces the same spacing as an uninterrupted one.
+_CUTTABLE_BLOCKS = frozenset({"Paragraph", "Heading", "CodeBlock", "BlockQuote", "List", "Table"})
+
+
+def _split_source(source: str, piece_size: int) -> list[str]:
+    """Cut preprocessed *source* after top-level blocks into pieces of about *piece_size* bytes.
+
+    Returns ``[source]`` when no cut is possible or the document contains
+    link reference definitions, which resolve across the whole document.
+    """
+    source_bytes = source.encode("utf-8")
+    if len(source_bytes) <= piece_size or _LINK_REFERENCE_RE.search(source):
+        return [source]
+    cuts = [0]
+    depth = 0
+    for kind, source_range in pyromark.events_with_range(source, options=STANDARD_OPTIONS):
+        if kind.__class__ is dict:
+            if "Start" in kind:
+                depth += 1
+                continue
+            if "End" not in kind:
+                continue
+            depth -= 1
+            if depth:
+                continue
+            tag = kind["End"]
+            if tag.__class__ is dict:
+                for tag in tag:
+                    pass
+            if tag not in _CUTTABLE_BLOCKS:
+                continue
+        elif kind != "Rule" or depth:
+            continue
+        if source_range["end"] - cuts[-1] >= piece_size:
+            cuts.append(source_range["end"])
+    if cuts[-1] < len(source_bytes):
+        cuts.append(len(source_bytes))
+    return [source_bytes[a:b].decode("utf-8") for a, b in zip(cuts, cuts[1:])]
+
+
+class _PieceWalker(EventWalker):
+    """Walker for a piece that follows a cut, as if a block had just ended.
+
+    The spacing before its first block is written against an empty buffer and
+    recorded in ``lead``, so the join can reduce it by the newlines the
+    previous piece already ends with.
+    """
+
+    def __init__(self, config: RenderConfig | RenderProfile, source_markdown: str) -> None:
+        super().__init__(config, source_markdown)
+        self._resume(_WalkerCheckpoint(block_count=1))
+        self.lead: int | None = None
+
+    def _ensure_block_spacing(self, next_block_start: int | None = None) -> None:
+        if self.lead is not None:
+            super()._ensure_block_spacing(next_block_start)
+            return
+        before = self._buf.py_offset
+        super()._ensure_block_spacing(next_block_start)
+        self.lead = self._buf.py_offset - before
+
+
+def _convert_piece(
+    piece: str, config: RenderConfig | RenderProfile, *, first: bool
+) -> tuple[str, list[MessageEntity], list[Segment], int]:
+    """Walk one preprocessed piece; returns its output and the spacing it leads with."""
+    walker = EventWalker(config, piece) if first else _PieceWalker(config, piece)
+    text, entities, segments = walker.walk(
+        pyromark.events_with_range(piece, options=STANDARD_OPTIONS)
+    )
+    return text, entities, segments, getattr(walker, "lead", None) or 0
+
+
+def _join_pieces(
+    pieces: list[tuple[str, list[MessageEntity], list[Segment], int]],
+) -> tuple[str, list[MessageEntity], list[Segment]]:
+    """Concatenate consecutive piece outputs as one uninterrupted walk would have."""
+    buf = _TextBuilder()
+    entities: list[MessageEntity] = []
+    segments: list[Segment] = []
+    for text, piece_entities, piece_segments, lead in pieces:
+        # The serial walk only tops up the newlines already in the buffer
+        drop = min(lead, buf.trailing_newline_count())
+        py_shift = buf.py_offset - drop
+        utf16_shift = buf.utf16_offset - drop
+        buf.write(text[drop:])
+        for ent in piece_entities:
+            ent.offset += utf16_shift
+            entities.append(ent)
+        for seg in piece_segments:
+            segments.append(
+                dataclasses.replace(
+                    seg,
+                    text_start=seg.text_start + py_shift,
+                    text_end=seg.text_end + py_shift,
+                    utf16_start=seg.utf16_start + utf16_shift,
+                    utf16_end=seg.utf16_end + utf16_shift,
+                )
+            )
+    return buf.get_text(), entities, segments
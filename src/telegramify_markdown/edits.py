@@ -0,0 +1,125 @@
+"""Edit planning for live-updated (streamed) answers.
+
+A bot that streams an answer re-runs :func:`telegramify` on the growing
+markdown and keeps the already sent messages in sync. :func:`diff_items`
+compares the previous output with the new one and returns only the Bot API
+calls that change something: messages whose content is identical are left
+alone, changed ones are edited in place, and new items are appended.
+
+Chat messages cannot be reordered, so when the item at some position changes
+kind (say a text message turns into a code file), that message and every
+message after it are deleted and sent again.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from typing import Any, Sequence, Union
+
+from telegramify_markdown.content import File, MediaGroup, Photo, Text
+
+Item = Union[Text, File, Photo, MediaGroup]
+
+
+@dataclasses.dataclass(frozen=True)
+class EditOperation:
+    """One Bot API call that brings the sent messages up to date.
+
+    ``action`` is one of:
+
+    - ``"edit_text"``: ``editMessageText`` of message *index* with *item*
+    - ``"edit_caption"``: ``editMessageCaption`` of message *index*; the file is unchanged
+    - ``"edit_media"``: ``editMessageMedia`` of message *index* with the new file and caption
+    - ``"delete"``: ``deleteMessage`` of message *index* (*item* is None)
+    - ``"send"``: send *item* as a new message, which becomes message *index*
+
+    Indexes count the messages in the order they were sent. A
+    :class:`MediaGroup` is one message per member: it is sent with one
+    ``sendMediaGroup`` call whose messages become *index* onwards, and its
+    members are edited and deleted one message at a time, an edit carrying
+    the member File or Photo as *item*.
+    """
+
+    action: str
+    index: int
+    item: Item | None = None
+
+
+def _same_caption(old: File | Photo, new: File | Photo) -> bool:
+    return old.caption_text == new.caption_text and old.caption_entities == new.caption_entities
+
+
+def _edit_action(old: Item, new: Item) -> str | None:
+    """The action that edits *old* into *new*; ``""`` if unchanged, None if impossible."""
+    if type(old) is not type(new):
+        return None
+    if isinstance(new, Text):
+        if old.text == new.text and old.entities == new.entities:
+            return ""
+        return "edit_text"
+    if old.file_name != new.file_name or old.file_data != new.file_data:
+        return "edit_media"
+    return "" if _same_caption(old, new) else "edit_caption"
+
+
+def _message_count(item: Item) -> int:
+    return len(item.items) if isinstance(item, MediaGroup) else 1
+
+
+def _member_pairs(old: Item, new: Item) -> list[tuple[Item, Item]] | None:
+    """The messages of *old* and *new* paired up; None if they cannot be edited into each other.
+
+    An album can be edited member by member only while it keeps its size.
+    """
+    if isinstance(old, MediaGroup) and isinstance(new, MediaGroup):
+        return list(zip(old.items, new.items)) if len(old.items) == len(new.items) else None
+    return [(old, new)]
+
+
+def diff_items(previous: Sequence[Item], current: Sequence[Item]) -> list[EditOperation]:
+    """Operations that turn the sent *previous* items into *current*.
+
+    Edits come first, then deletions, then sends, each in message order, so
+    applying them in the returned order keeps the chat in document order.
+    """
+    edits: list[EditOperation] = []
+    common = min(len(previous), len(current))
+    resend_from = common
+    message = 0
+    for index in range(common):
+        pairs = _member_pairs(previous[index], current[index])
+        actions = None if pairs is None else [_edit_action(old, new) for old, new in pairs]
+        if actions is None or None in actions:
+            resend_from = index
+            break
+        edits.extend(
+            EditOperation(action, message + offset, new)
+            for offset, (action, (_, new)) in enumerate(zip(actions, pairs))
+            if action
+        )
+        message += len(pairs)
+
+    sent = message + sum(_message_count(item) for item in previous[resend_from:])
+    deletes = [EditOperation("delete", index) for index in range(message, sent)]
+    sends = []
+    for item in current[resend_from:]:
+        sends.append(EditOperation("send", message, item))
+        message += _message_count(item)
+    return edits + deletes + sends
+
+
+async def plan_edits(
+    previous: Sequence[Item], markdown: str, **options: Any
+) -> tuple[list[Item], list[EditOperation]]:
+    """Convert the updated *markdown* and diff it against the *previous* result.
+
+    *options* are passed to :func:`telegramify_markdown.telegramify`; use the
+    same ones on every update. Returns the new items, to pass as *previous*
+    next time, and the operations to apply. While the answer is still
+    streaming, ``render_mermaid=False`` avoids rendering diagrams on every update,
+    and ``committed`` keeps the boundaries of messages that should no longer change.
+    """
+    from telegramify_markdown.pipeline import process_markdown
+
+    current = await process_markdown(markdown, **options)
+    return current, diff_items(previous, current)
@@ -1,20 +1,14 @@
 from __future__ import annotations
 
 import dataclasses
-from typing import Optional
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import accumulate
+from typing import Iterable, Iterator, Optional, Sequence, overload
 
-
-def utf16_len(text: str) -> int:
-    """Return the length of text measured in UTF-16 code units.
-
-    Telegram measures entity offsets and lengths in UTF-16 code units,
-    not Python str characters. Characters outside the BMP (codepoint > 0xFFFF)
-    take 2 UTF-16 code units (a surrogate pair); all others take 1.
-    """
-    count = 0
-    for ch in text:
-        count += 2 if ord(ch) > 0xFFFF else 1
-    return count
+from telegramify_markdown.utf16 import Utf16Index, utf16_len  # noqa: F401
 
 
 @dataclasses.dataclass(slots=True)
@@ -44,6 +38,223 @@ class MessageEntity:
         return result
 
 
+# Entity type names are stored as small ids; the table only ever grows
+_TYPE_NAMES: list[str] = [
+    "bold", "italic", "underline", "strikethrough", "spoiler", "code", "pre",
+    "text_link", "custom_emoji", "blockquote", "expandable_blockquote",
+]
+_TYPE_IDS: dict[str, int] = {name: i for i, name in enumerate(_TYPE_NAMES)}
+
+_NO_EXTRAS = (None, None, None)
+
+
+def _type_id(name: str) -> int:
+    type_id = _TYPE_IDS.get(name)
+    if type_id is None:
+        type_id = _TYPE_IDS[name] = len(_TYPE_NAMES)
+        _TYPE_NAMES.append(name)
+    return type_id
+
+
+class EntityArray(Sequence[MessageEntity]):
+    """Compact, immutable struct-of-arrays storage for a list of entities.
+
+    Offsets and lengths live in ``array('i')``, types are interned ids, and
+    ``(url, language, custom_emoji_id)`` triples sit in a table that is shared
+    with every array derived by :meth:`clip`, :meth:`shift` or slicing.
+    :class:`MessageEntity` objects are created only when items are accessed.
+    """
+
+    __slots__ = ("_types", "_offsets", "_lengths", "_extras", "_extra_table")
+
+    def __init__(self, entities: Iterable[MessageEntity] = ()) -> None:
+        types = array("H")
+        offsets = array("i")
+        lengths = array("i")
+        extras = array("i")
+        table: list[tuple] = [_NO_EXTRAS]
+        table_ids: dict[tuple, int] = {_NO_EXTRAS: 0}
+        for ent in entities:
+            types.append(_type_id(ent.type))
+            offsets.append(ent.offset)
+            lengths.append(ent.length)
+            extra = (ent.url, ent.language, ent.custom_emoji_id)
+            extra_id = table_ids.get(extra)
+            if extra_id is None:
+                extra_id = table_ids[extra] = len(table)
+                table.append(extra)
+            extras.append(extra_id)
+        self._set(types, offsets, lengths, extras, table)
+
+    @classmethod
+    def from_entities(cls, entities: Iterable[MessageEntity]) -> EntityArray:
+        """Pack *entities*; an EntityArray is returned as is."""
+        if isinstance(entities, EntityArray):
+            return entities
+        return cls(entities)
+
+    def _set(self, types: array, offsets: array, lengths: array, extras: array, table: list) -> None:
+        self._types = types
+        self._offsets = offsets
+        self._lengths = lengths
+        self._extras = extras
+        self._extra_table = table
+
+    def _derive(self, types: array, offsets: array, lengths: array, extras: array) -> EntityArray:
+        derived = EntityArray.__new__(EntityArray)
+        derived._set(types, offsets, lengths, extras, self._extra_table)
+        return derived
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    @overload
+    def __getitem__(self, index: int) -> MessageEntity: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> EntityArray: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._derive(
+                self._types[index], self._offsets[index], self._lengths[index], self._extras[index]
+            )
+        return MessageEntity(
+            _TYPE_NAMES[self._types[index]],
+            self._offsets[index],
+            self._lengths[index],
+            *self._extra_table[self._extras[index]],
+        )
+
+    def __iter__(self) -> Iterator[MessageEntity]:
+        names = _TYPE_NAMES
+        table = self._extra_table
+        for type_id, offset, length, extra_id in zip(
+            self._types, self._offsets, self._lengths, self._extras
+        ):
+            yield MessageEntity(names[type_id], offset, length, *table[extra_id])
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (EntityArray, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"EntityArray({list(self)!r})"
+
+    def to_list(self) -> list[MessageEntity]:
+        return list(self)
+
+    def shift(self, delta: int) -> EntityArray:
+        """All entities moved by *delta* UTF-16 code units."""
+        return self._derive(
+            self._types, array("i", [offset + delta for offset in self._offsets]),
+            self._lengths, self._extras,
+        )
+
+    def clip(self, start: int, end: int, *, index: EntityIndex | None = None) -> EntityArray:
+        """Entities overlapping ``[start, end)``, clipped to it and shifted so *start* is 0.
+
+        :param index: :class:`EntityIndex` of this array, to find the
+            overlapping entities without scanning all of them.
+        """
+        if start >= end:
+            return self[:0]
+        offsets = self._offsets
+        lengths = self._lengths
+        if index is not None:
+            rows = index.overlapping(start, end)
+        else:
+            rows = [
+                i for i, offset, length in zip(range(len(offsets)), offsets, lengths)
+                if offset < end and offset + length > start and length
+            ]
+        types = self._types
+        extras = self._extras
+        new_offsets = array("i")
+        new_lengths = array("i")
+        for i in rows:
+            clipped_start = max(offsets[i], start)
+            new_offsets.append(clipped_start - start)
+            new_lengths.append(min(offsets[i] + lengths[i], end) - clipped_start)
+        return self._derive(
+            array("H", [types[i] for i in rows]), new_offsets, new_lengths,
+            array("i", [extras[i] for i in rows]),
+        )
+
+
+class EntityIndex:
+    """Static interval index answering "which ranges overlap ``[a, b)``".
+
+    Ranges are sorted by start once; a max-end segment tree over that order
+    finds the ranges that start before *b* and end after *a* in
+    O(log n + k). Empty ranges never match. Results are row numbers in the
+    original order, so clipped entity lists keep their order.
+    """
+
+    __slots__ = ("_order", "_sorted_starts", "_ends", "_size", "_max_end")
+
+    def __init__(self, starts: Sequence[int], ends: Sequence[int]) -> None:
+        order = sorted((i for i in range(len(starts)) if ends[i] > starts[i]), key=starts.__getitem__)
+        self._order = order
+        self._sorted_starts = [starts[i] for i in order]
+        self._ends = ends
+        size = 1
+        while size < len(order):
+            size <<= 1
+        max_end = [-1] * (2 * size)
+        max_end[size:size + len(order)] = [ends[i] for i in order]
+        for node in range(size - 1, 0, -1):
+            left = max_end[2 * node]
+            right = max_end[2 * node + 1]
+            max_end[node] = left if left > right else right
+        self._size = size
+        self._max_end = max_end
+
+    @classmethod
+    def from_entities(cls, entities: Sequence[MessageEntity]) -> EntityIndex:
+        """Index entities by their UTF-16 ``[offset, offset + length)`` ranges."""
+        if isinstance(entities, EntityArray):
+            offsets = entities._offsets
+            lengths = entities._lengths
+        else:
+            offsets = [ent.offset for ent in entities]
+            lengths = [ent.length for ent in entities]
+        return cls(offsets, [offset + length for offset, length in zip(offsets, lengths)])
+
+    def overlapping(self, start: int, end: int) -> list[int]:
+        """Rows whose range overlaps ``[start, end)``, in ascending row order."""
+        if start >= end:
+            return []
+        # Only ranges starting before end can overlap; among those, find the ones ending after start
+        limit = bisect_left(self._sorted_starts, end)
+        if not limit:
+            return []
+        max_end = self._max_end
+        order = self._order
+        size = self._size
+        rows: list[int] = []
+        stack = [(1, 0, size)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if lo >= limit or max_end[node] <= start:
+                continue
+            if node >= size:
+                rows.append(order[lo])
+                continue
+            mid = (lo + hi) >> 1
+            stack.append((2 * node + 1, mid, hi))
+            stack.append((2 * node, lo, mid))
+        rows.sort()
+        return rows
+
+    def containing(self, position: int) -> list[int]:
+        """Rows whose range contains *position*."""
+        return self.overlapping(position, position + 1)
+
+
 def _find_newline_positions(text: str) -> list[int]:
     """Find newline positions in text suitable for splitting.
 
@@ -51,117 +262,345 @@ def _find_newline_positions(text: str) -> list[int]:
     sorted in order of appearance.
     """
     points: list[int] = []
-    for i, ch in enumerate(text):
-        if ch == "\n":
-            points.append(i + 1)
+    find = text.find
+    pos = find("\n")
+    while pos != -1:
+        pos += 1
+        points.append(pos)
+        pos = find("\n", pos)
     return points
 
 
-def _build_utf16_offset_table(text: str) -> list[int]:
-    """Build a cumulative UTF-16 offset table for each character position.
-
-    Returns a list of length len(text)+1 where result[i] is the UTF-16
-    offset of text[i] (or the total length for i == len(text)).
-    """
-    offsets = [0] * (len(text) + 1)
-    cum = 0
-    for i, ch in enumerate(text):
-        offsets[i] = cum
-        cum += 2 if ord(ch) > 0xFFFF else 1
-    offsets[len(text)] = cum
-    return offsets
-
-
 def split_entities(
     text: str,
-    entities: list[MessageEntity],
+    entities: Sequence[MessageEntity],
     max_utf16_len: int,
+    *,
+    utf16_index: Utf16Index | None = None,
+    packing: str = "greedy",
+    max_entities_per_message: int | None = None,
+    committed: Sequence[int] = (),
 ) -> list[tuple[str, list[MessageEntity]]]:
     """Split (text, entities) into chunks not exceeding max_utf16_len UTF-16 code units.
 
     Tries to split at newline boundaries. Entities that span a split boundary
     are clipped into both chunks.
+
+    :param utf16_index: Index of *text* if the caller already has one
+        (e.g. from ``convert_with_index``); built from *text* otherwise.
+    :param packing: ``"greedy"`` fills each chunk up to the last newline that
+        fits. ``"optimal"`` minimizes the number of chunks, then prefers
+        paragraph over line over sentence over hard breaks and avoids cutting
+        entities (``pre`` and blockquotes most of all).
+    :param max_entities_per_message: Most entities a chunk may carry; pass
+        100, Telegram's limit, when sending the chunks as messages. An entity
+        clipped into two chunks counts in both. ``None`` (the default)
+        disables the limit.
+    :param committed: UTF-16 end offsets of chunks already sent, in order.
+        Those chunks are returned unchanged, whatever the packing would do
+        now, and only the text after the last one is split. Meant for
+        streaming, where the text before the last boundary no longer changes.
     """
-    total = utf16_len(text)
-    if total <= max_utf16_len:
+    if utf16_index is None:
+        utf16_index = Utf16Index(text)
+    if not committed and utf16_index.utf16_len <= max_utf16_len and not _over_entity_limit(
+        entities, max_entities_per_message
+    ):
         return [(text, list(entities))]
+    return [
+        (chunk_text, chunk_entities.to_list())
+        for chunk_text, chunk_entities in split_entity_array(
+            text, EntityArray.from_entities(entities), max_utf16_len,
+            utf16_index=utf16_index, packing=packing,
+            max_entities_per_message=max_entities_per_message, committed=committed,
+        )
+    ]
+
 
-    offsets = _build_utf16_offset_table(text)
+def split_entity_array(
+    text: str,
+    entities: EntityArray,
+    max_utf16_len: int,
+    *,
+    utf16_index: Utf16Index | None = None,
+    packing: str = "greedy",
+    max_entities_per_message: int | None = None,
+    committed: Sequence[int] = (),
+) -> list[tuple[str, EntityArray]]:
+    """:func:`split_entities` for an :class:`EntityArray`, without materializing entities."""
+    if packing not in ("greedy", "optimal"):
+        raise ValueError(f"Unknown packing mode: {packing!r}")
+    if max_entities_per_message is not None and max_entities_per_message <= 0:
+        raise ValueError("max_entities_per_message must be greater than 0")
+    if utf16_index is None:
+        utf16_index = Utf16Index(text)
+    if committed:
+        return _split_after_committed(
+            text, entities, max_utf16_len, utf16_index, committed,
+            packing=packing, max_entities_per_message=max_entities_per_message,
+        )
+    over_limit = _over_entity_limit(entities, max_entities_per_message)
+    if utf16_index.utf16_len <= max_utf16_len and not over_limit:
+        return [(text, entities)]
+
+    to_utf16 = utf16_index.py_to_utf16
+    index = EntityIndex.from_entities(entities)
+    budget = _EntityBudget(entities, max_entities_per_message) if over_limit else None
+    if packing == "optimal":
+        ranges = _optimal_ranges(text, max_utf16_len, utf16_index, entities, budget)
+    else:
+        ranges = _split_ranges(text, max_utf16_len, utf16_index, budget)
+    return [
+        (
+            text[chunk_py_start:chunk_py_end],
+            entities.clip(to_utf16(chunk_py_start), to_utf16(chunk_py_end), index=index),
+        )
+        for chunk_py_start, chunk_py_end in ranges
+    ]
+
+
+def _split_after_committed(
+    text: str,
+    entities: EntityArray,
+    max_utf16_len: int,
+    utf16_index: Utf16Index,
+    committed: Sequence[int],
+    *,
+    packing: str,
+    max_entities_per_message: int | None,
+) -> list[tuple[str, EntityArray]]:
+    """Committed chunks cut exactly at *committed*, then the rest split as usual."""
+    index = EntityIndex.from_entities(entities)
+    chunks: list[tuple[str, EntityArray]] = []
+    start = py_start = 0
+    for boundary in committed:
+        py_boundary = utf16_index.utf16_to_py(boundary)
+        if boundary <= start or py_boundary is None:
+            raise ValueError(
+                f"Invalid committed boundary {boundary}: boundaries must increase, "
+                "stay within the text and not split a surrogate pair"
+            )
+        chunks.append((text[py_start:py_boundary], entities.clip(start, boundary, index=index)))
+        start, py_start = boundary, py_boundary
+    if py_start < len(text):
+        chunks.extend(split_entity_array(
+            text[py_start:],
+            entities.clip(start, utf16_index.utf16_len, index=index),
+            max_utf16_len,
+            utf16_index=utf16_index.slice(py_start, len(text)),
+            packing=packing,
+            max_entities_per_message=max_entities_per_message,
+        ))
+    return chunks
+
+
+def _over_entity_limit(entities: Sequence[MessageEntity], limit: int | None) -> bool:
+    """Whether more than *limit* nonempty entities would have to share one chunk."""
+    if limit is None or len(entities) <= limit:
+        return False
+    if isinstance(entities, EntityArray):
+        return sum(1 for length in entities._lengths if length) > limit
+    return sum(1 for entity in entities if entity.length) > limit
+
+
+class _EntityBudget:
+    """How far a chunk may reach before it carries more than *limit* entities.
+
+    The chunk ``[s, e)`` overlaps every nonempty entity starting before *e*
+    except those already ended by *s*, so with the starts and ends sorted
+    both counts are a bisect away.
+    """
+
+    __slots__ = ("_starts", "_ends", "_limit")
 
-    # Build list of candidate split points (newline positions)
+    def __init__(self, entities: EntityArray, limit: int) -> None:
+        spans = [
+            (offset, offset + length)
+            for offset, length in zip(entities._offsets, entities._lengths)
+            if length
+        ]
+        self._starts = sorted(start for start, _ in spans)
+        self._ends = sorted(end for _, end in spans)
+        self._limit = limit
+
+    def cap(self, start: int) -> int:
+        """Most entity starts a chunk from *start* may include before its end.
+
+        When the entities still open at *start* already exceed the limit, the
+        chunk may not take in any new entity but still has to move on.
+        """
+        return max(
+            self._limit + bisect_right(self._ends, start),
+            bisect_right(self._starts, start),
+        )
+
+    def starts_before(self, end: int) -> int:
+        return bisect_left(self._starts, end)
+
+    def end_limit(self, start: int) -> int | None:
+        """Furthest end of a chunk from *start*, or None when any end fits."""
+        cap = self.cap(start)
+        return self._starts[cap] if cap < len(self._starts) else None
+
+
+def _split_ranges(
+    text: str,
+    max_utf16_len: int,
+    utf16_index: Utf16Index,
+    budget: _EntityBudget | None = None,
+) -> list[tuple[int, int]]:
+    """Python index ranges of the chunks, packed greedily up to *max_utf16_len*.
+
+    Each chunk ends at the last newline that fits, found by bisecting the
+    newline offsets, or at a hard split when none does. A *budget* pulls the
+    chunk end in where the entity limit is reached first.
+    """
+    to_utf16 = utf16_index.py_to_utf16
+    total_utf16 = utf16_index.utf16_len
+
+    # Candidate split points (right after each newline) and their UTF-16 offsets
     split_points = _find_newline_positions(text)
+    split_utf16 = split_points if utf16_index.is_bmp else [to_utf16(sp) for sp in split_points]
 
-    # Determine actual split positions using greedy packing
     chunks_ranges: list[tuple[int, int]] = []  # (py_start, py_end)
     py_start = 0
 
     while py_start < len(text):
-        utf16_start = offsets[py_start]
+        utf16_start = to_utf16(py_start)
         utf16_budget = utf16_start + max_utf16_len
+        if budget is not None:
+            entity_end = budget.end_limit(utf16_start)
+            if entity_end is not None and entity_end < utf16_budget:
+                utf16_budget = entity_end
 
-        if offsets[len(text)] <= utf16_budget:
+        if total_utf16 <= utf16_budget:
             # Remaining text fits
             chunks_ranges.append((py_start, len(text)))
             break
 
-        # Find the last split point that fits within budget
-        best_split = None
-        for sp in split_points:
-            if sp <= py_start:
-                continue
-            if offsets[sp] <= utf16_budget:
-                best_split = sp
-            else:
-                break
-
-        if best_split is None or best_split == py_start:
+        # Last split point that fits within budget
+        best = bisect_right(split_utf16, utf16_budget) - 1
+        if best >= 0 and split_points[best] > py_start:
+            best_split = split_points[best]
+        else:
             # No newline split fits -- hard split at max_utf16_len boundary
-            best_split = py_start
-            for i in range(py_start + 1, len(text) + 1):
-                if offsets[i] > utf16_budget:
-                    best_split = i - 1
-                    break
-            if best_split == py_start:
+            best_split = utf16_index.utf16_to_py_floor(utf16_budget)
+            if best_split <= py_start:
                 best_split = py_start + 1  # Force progress
 
         chunks_ranges.append((py_start, best_split))
         py_start = best_split
 
-    # Assign entities to chunks, clipping as needed
-    result: list[tuple[str, list[MessageEntity]]] = []
-    for chunk_py_start, chunk_py_end in chunks_ranges:
-        chunk_text = text[chunk_py_start:chunk_py_end]
-        chunk_utf16_start = offsets[chunk_py_start]
-        chunk_utf16_end = offsets[chunk_py_end]
-        chunk_entities: list[MessageEntity] = []
+    return chunks_ranges
 
-        for ent in entities:
-            ent_start = ent.offset
-            ent_end = ent.offset + ent.length
 
-            # Check overlap
-            if ent_end <= chunk_utf16_start or ent_start >= chunk_utf16_end:
-                continue  # No overlap
+# Optimal packing: cost of ending a chunk at each kind of break, and of
+# cutting an entity in two there.  Chunk count always dominates these.
+_PARAGRAPH_BREAK_COST = 0
+_LINE_BREAK_COST = 1
+_SENTENCE_BREAK_COST = 4
+_HARD_BREAK_COST = 16
+_ENTITY_CUT_COST = 2
+_BLOCK_ENTITY_CUT_COST = 8
+_BLOCK_ENTITY_TYPES = frozenset({"pre", "blockquote", "expandable_blockquote"})
 
-            # Clip to chunk boundaries
-            clipped_start = max(ent_start, chunk_utf16_start)
-            clipped_end = min(ent_end, chunk_utf16_end)
-            clipped_length = clipped_end - clipped_start
+_SENTENCE_END_RE = re.compile(r"[.!?…][ \t]+|[。！？]")
 
-            if clipped_length <= 0:
-                continue
 
-            chunk_entities.append(
-                MessageEntity(
-                    type=ent.type,
-                    offset=clipped_start - chunk_utf16_start,
-                    length=clipped_length,
-                    url=ent.url,
-                    language=ent.language,
-                    custom_emoji_id=ent.custom_emoji_id,
-                )
-            )
-
-        result.append((chunk_text, chunk_entities))
-
-    return result
+def _optimal_ranges(
+    text: str,
+    max_utf16_len: int,
+    utf16_index: Utf16Index,
+    entities: EntityArray,
+    budget: _EntityBudget | None = None,
+) -> list[tuple[int, int]]:
+    """Chunk ranges with the fewest chunks, then the lowest total break cost.
+
+    Candidate breaks are scored once; a sliding-window minimum over the
+    candidates within one chunk length of each break keeps the dynamic
+    program linear in the number of candidates. The greedy packing is always
+    among the candidates, so this never needs more chunks than greedy.
+    """
+    to_utf16 = utf16_index.py_to_utf16
+    break_costs: dict[int, int] = {
+        m.end(): _SENTENCE_BREAK_COST for m in _SENTENCE_END_RE.finditer(text)
+    }
+    for sp in _find_newline_positions(text):
+        paragraph = sp >= 2 and text[sp - 2] == "\n"
+        break_costs[sp] = _PARAGRAPH_BREAK_COST if paragraph else _LINE_BREAK_COST
+    break_costs.pop(len(text), None)
+
+    # The greedy packing's hard breaks keep a packing with at most as many
+    # chunks as greedy among the candidates, even where no soft break fits.
+    for _, end in _split_ranges(text, max_utf16_len, utf16_index, budget):
+        break_costs.setdefault(end, _HARD_BREAK_COST)
+    break_costs[len(text)] = 0
+
+    points = [0]
+    points.extend(sorted(break_costs))
+    offsets = [to_utf16(pos) for pos in points]
+    costs = [break_costs.get(pos, 0) for pos in points]
+    costs[0] = 0
+
+    # Weight of the entities cut at u: those starting before u minus those
+    # already ended by u, from prefix sums over starts and ends.
+    weights = [
+        _BLOCK_ENTITY_CUT_COST if _TYPE_NAMES[type_id] in _BLOCK_ENTITY_TYPES else _ENTITY_CUT_COST
+        for type_id in entities._types
+    ]
+    by_start = sorted(zip(entities._offsets, weights))
+    by_end = sorted(zip(
+        [offset + length for offset, length in zip(entities._offsets, entities._lengths)], weights
+    ))
+    start_keys = [start for start, _ in by_start]
+    end_keys = [end for end, _ in by_end]
+    start_sums = list(accumulate((weight for _, weight in by_start), initial=0))
+    end_sums = list(accumulate((weight for _, weight in by_end), initial=0))
+    for i in range(1, len(points) - 1):
+        utf16_pos = offsets[i]
+        costs[i] += (
+            start_sums[bisect_left(start_keys, utf16_pos)]
+            - end_sums[bisect_right(end_keys, utf16_pos)]
+        )
+
+    # A chunk from points[j] to points[i] stays within the entity limit while
+    # the entity starts before offsets[i] stay within caps[j]; both only grow.
+    if budget is not None:
+        caps = [budget.cap(utf16_pos) for utf16_pos in offsets]
+        starts_before = [budget.starts_before(utf16_pos) for utf16_pos in offsets]
+
+    # best[i] = (chunks, cost) of the cheapest packing of text[:points[i]]
+    unreachable = (len(points) + 1, 0)
+    best: list[tuple[int, int]] = [(0, 0)]
+    previous = [0]
+    window: deque[int] = deque([0])
+    for i in range(1, len(points)):
+        while window and (
+            offsets[i] - offsets[window[0]] > max_utf16_len
+            or (budget is not None and starts_before[i] > caps[window[0]])
+        ):
+            window.popleft()
+        if window:
+            j = window[0]
+        elif points[i] - points[i - 1] == 1:
+            j = i - 1  # A single character wider than the limit still has to go somewhere
+        else:
+            best.append(unreachable)
+            previous.append(i - 1)
+            continue
+        chunks, cost = best[j]
+        score = (chunks + 1, cost + costs[i])
+        best.append(score)
+        previous.append(j)
+        while window and best[window[-1]] >= score:
+            window.pop()
+        window.append(i)
+
+    ranges: list[tuple[int, int]] = []
+    i = len(points) - 1
+    while i:
+        j = previous[i]
+        ranges.append((points[j], points[i]))
+        i = j
+    ranges.reverse()
+    return ranges
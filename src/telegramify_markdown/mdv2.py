@@ -4,7 +4,7 @@
 转为 parse_mode="MarkdownV2" 可直接使用的字符串。
 
 核心算法：扫描线事件排序
-1. 构建 UTF-16 offset → Python index 映射
+1. 构建 UTF-16 offset → Python index 映射（Utf16Index，只记录 BMP 外字符位置）
 2. 将每个 entity 拆为 open/close 事件，按 Python index 排序
 3. 从左到右扫描文本，在事件边界插入 MarkdownV2 标记，分区域转义
 4. blockquote 在扫描过程中内联处理（逐行添加 > 前缀），不做后处理
@@ -12,7 +12,19 @@
 
 from __future__ import annotations
 
-from telegramify_markdown.entity import MessageEntity, split_entities, utf16_len
+import re
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from telegramify_markdown.entity import (
+    EntityArray,
+    EntityIndex,
+    MessageEntity,
+    _EntityBudget,
+    _find_newline_positions,
+    _over_entity_limit,
+)
+from telegramify_markdown.utf16 import Utf16Index, astral_positions, utf16_len
 
 # MarkdownV2 普通文本需要转义的 20 个字符
 _MDV2_ESCAPE_CHARS = frozenset("_*[]()~`>#+-=|{}.!\\")
@@ -23,50 +35,55 @@ _CODE_ESCAPE_CHARS = frozenset("`\\")
 # URL 内只需转义的字符
 _URL_ESCAPE_CHARS = frozenset(")\\")
 
+# 转义位置（只在切分时需要，渲染长度模型用）
+_MDV2_ESCAPE_RE = re.compile(r"[_*\[\]()~`>#+\-=|{}.!\\]")
+_CODE_ESCAPE_RE = re.compile(r"[`\\]")
+
+
+def _escape_pairs(chars: frozenset[str]) -> tuple[tuple[str, str], ...]:
+    """(字符, 转义后) 替换表。反斜杠必须最先替换，否则会把插入的反斜杠再转义一次。"""
+    return tuple((ch, "\\" + ch) for ch in sorted(chars, key=lambda ch: (ch != "\\", ch)))
+
+
+_MDV2_ESCAPES = _escape_pairs(_MDV2_ESCAPE_CHARS)
+_CODE_ESCAPES = _escape_pairs(_CODE_ESCAPE_CHARS)
+_URL_ESCAPES = _escape_pairs(_URL_ESCAPE_CHARS)
+
+
+def _escape_counted(text: str, pairs: tuple[tuple[str, str], ...]) -> tuple[str, int]:
+    """按替换表逐字符 str.replace（C 层扫描，文本中没有的字符直接跳过）。
+
+    返回转义结果与新增的反斜杠数（反斜杠是 ASCII，也就是增加的 UTF-16 长度）。
+    """
+    escaped = text
+    for ch, replacement in pairs:
+        if ch in escaped:
+            escaped = escaped.replace(ch, replacement)
+    return escaped, len(escaped) - len(text)
+
+
+def _count_escapes(
+    text: str, pairs: tuple[tuple[str, str], ...], start: int = 0, end: int | None = None
+) -> int:
+    """text[start:end] 转义时会新增的反斜杠数，不构建转义结果。"""
+    if end is None:
+        end = len(text)
+    return sum(text.count(ch, start, end) for ch, _ in pairs)
+
 
 def _escape_markdownv2(text: str) -> str:
     """普通文本区域的 MarkdownV2 转义（20 个特殊字符）。"""
-    result = []
-    for ch in text:
-        if ch in _MDV2_ESCAPE_CHARS:
-            result.append("\\")
-        result.append(ch)
-    return "".join(result)
+    return _escape_counted(text, _MDV2_ESCAPES)[0]
 
 
 def _escape_code(text: str) -> str:
     """code/pre 内部的转义（只转义 ` 和 \\）。"""
-    result = []
-    for ch in text:
-        if ch in _CODE_ESCAPE_CHARS:
-            result.append("\\")
-        result.append(ch)
-    return "".join(result)
+    return _escape_counted(text, _CODE_ESCAPES)[0]
 
 
 def _escape_url(url: str) -> str:
     """URL 内部的转义（只转义 ) 和 \\）。"""
-    result = []
-    for ch in url:
-        if ch in _URL_ESCAPE_CHARS:
-            result.append("\\")
-        result.append(ch)
-    return "".join(result)
-
-
-def _utf16_offset_to_pyindex(text: str) -> dict[int, int]:
-    """构建 UTF-16 offset → Python str index 的映射表。
-
-    返回 dict，key 为 UTF-16 offset，value 为对应的 Python index。
-    包含 text 末尾的哨兵位置。
-    """
-    mapping: dict[int, int] = {}
-    utf16_pos = 0
-    for i, ch in enumerate(text):
-        mapping[utf16_pos] = i
-        utf16_pos += 2 if ord(ch) > 0xFFFF else 1
-    mapping[utf16_pos] = len(text)  # 哨兵：末尾位置
-    return mapping
+    return _escape_counted(url, _URL_ESCAPES)[0]
 
 
 # entity type → (open_tag, close_tag) 的简单标记映射
@@ -94,53 +111,7 @@ def entities_to_markdownv2(text: str, entities: list[MessageEntity] | None = Non
     if not entities:
         return _escape_markdownv2(text)
 
-    utf16_to_py = _utf16_offset_to_pyindex(text)
-
-    # 分离 blockquote 和其他 entity，并将 blockquote 转为 Python index 范围
-    bq_ranges: list[tuple[int, int, str]] = []  # (start_py, end_py, type)
-    other_entities: list[MessageEntity] = []
-    for ent in entities:
-        if ent.type in ("blockquote", "expandable_blockquote"):
-            start_py = utf16_to_py.get(ent.offset)
-            end_py = utf16_to_py.get(ent.offset + ent.length)
-            if start_py is not None and end_py is not None:
-                bq_ranges.append((start_py, end_py, ent.type))
-        else:
-            other_entities.append(ent)
-
-    # blockquote 查询辅助函数
-    def _bq_at(py_idx: int) -> str | None:
-        """返回 py_idx 位置的 blockquote 类型，不在 blockquote 内返回 None。"""
-        for s, e, t in bq_ranges:
-            if s <= py_idx < e:
-                return t
-        return None
-
-    def _is_expandable_start(py_idx: int) -> bool:
-        for s, _, t in bq_ranges:
-            if py_idx == s and t == "expandable_blockquote":
-                return True
-        return False
-
-    def _is_expandable_end(py_idx: int) -> bool:
-        for _, e, t in bq_ranges:
-            if py_idx == e and t == "expandable_blockquote":
-                return True
-        return False
-
-    # 构建扫描线事件
-    events: list[tuple[int, int, int, int, MessageEntity]] = []
-    for seq, ent in enumerate(other_entities):
-        start_utf16 = ent.offset
-        end_utf16 = ent.offset + ent.length
-        start_py = utf16_to_py.get(start_utf16)
-        end_py = utf16_to_py.get(end_utf16)
-        if start_py is None or end_py is None:
-            continue
-        events.append((start_py, 1, -ent.length, seq, ent))    # open
-        events.append((end_py, 0, ent.length, -seq, ent))       # close: -seq 实现 LIFO
-
-    events.sort(key=lambda e: (e[0], e[1], e[2], e[3]))
+    bqs, events = _sweep_events(text, entities, Utf16Index(text))
 
     # 追踪当前活跃的 code/pre entity
     active_code_entities: set[int] = set()
@@ -150,55 +121,28 @@ def entities_to_markdownv2(text: str, entities: list[MessageEntity] | None = Non
     prev_py = 0
 
     # 输出文本第一行的 blockquote 前缀（如果 position 0 在 blockquote 内）
-    if bq_ranges:
-        if _is_expandable_start(0):
-            parts.append("**>")
-        elif _bq_at(0) is not None:
-            parts.append(">")
+    if bqs:
+        parts.append(bqs.line_prefix(0))
 
     def _emit_segment(segment: str, seg_start_py: int) -> None:
         """输出文本段，在 \\n 后插入 blockquote 前缀。"""
         escape_fn = _escape_code if active_code_entities else _escape_markdownv2
-        if not bq_ranges:
+        if not bqs:
             parts.append(escape_fn(segment))
             return
         # 逐行处理，在每个 \n 后检查下一行是否在 blockquote 内
         line_start = 0
-        for i, ch in enumerate(segment):
-            if ch == "\n":
-                parts.append(escape_fn(segment[line_start:i]))
-                parts.append("\n")
-                next_py = seg_start_py + i + 1
-                # 检查下一行的 blockquote 状态
-                if _is_expandable_start(next_py):
-                    parts.append("**>")
-                elif _bq_at(next_py) is not None:
-                    parts.append(">")
-                line_start = i + 1
+        newline = segment.find("\n")
+        while newline != -1:
+            parts.append(escape_fn(segment[line_start:newline]))
+            parts.append("\n")
+            line_start = newline + 1
+            parts.append(bqs.line_prefix(seg_start_py + line_start))
+            newline = segment.find("\n", line_start)
         # 输出最后一段（\n 之后的剩余内容）
         if line_start < len(segment):
             parts.append(escape_fn(segment[line_start:]))
 
-    def _emit_tag(tag: str, pos_py: int) -> None:
-        """输出标记字符串，处理 tag 中的 \\n（如 pre 的 ```\\n）。
-
-        tag 中的 \\n 后如果对应的原始文本位置在 blockquote 内，也需加 > 前缀。
-        """
-        if not bq_ranges or "\n" not in tag:
-            parts.append(tag)
-            return
-        # tag 中的 \n 后需要检查 blockquote
-        # pos_py 是 tag 对应的原始文本边界位置
-        bq = _bq_at(pos_py)
-        if bq is None:
-            # pos_py 可能恰好在 blockquote 边界外，检查 pos_py-1
-            if pos_py > 0:
-                bq = _bq_at(pos_py - 1)
-        if bq:
-            parts.append(tag.replace("\n", "\n>"))
-        else:
-            parts.append(tag)
-
     # 扫描线主循环
     event_idx = 0
     while event_idx < len(events):
@@ -209,7 +153,7 @@ def entities_to_markdownv2(text: str, entities: list[MessageEntity] | None = Non
             _emit_segment(text[prev_py:pos], prev_py)
 
         # 检查 expandable blockquote 结束标记
-        if bq_ranges and _is_expandable_end(pos):
+        if bqs and bqs.is_expandable_end(pos):
             parts.append("||")
 
         # 处理该位置的所有事件
@@ -220,12 +164,12 @@ def entities_to_markdownv2(text: str, entities: list[MessageEntity] | None = Non
             if event_type == 0:
                 # close 事件
                 active_code_entities.discard(ent_id)
-                _emit_tag(_get_close_tag(ent), pos)
+                parts.append(bqs.tag(_get_close_tag(ent), pos))
             else:
                 # open 事件
                 if ent.type in _CODE_ENTITY_TYPES:
                     active_code_entities.add(ent_id)
-                _emit_tag(_get_open_tag(ent), pos)
+                parts.append(bqs.tag(_get_open_tag(ent), pos))
 
             event_idx += 1
 
@@ -236,55 +180,375 @@ def entities_to_markdownv2(text: str, entities: list[MessageEntity] | None = Non
         _emit_segment(text[prev_py:], prev_py)
 
     # 检查 expandable blockquote 在文本末尾结束
-    if bq_ranges and _is_expandable_end(len(text)):
+    if bqs and bqs.is_expandable_end(len(text)):
         parts.append("||")
 
     return "".join(parts)
 
 
+class _Blockquotes:
+    """blockquote 查询：按起点排序的区间数组 + 二分查找，以及可折叠 blockquote 起止位置集合。
+
+    Telegram 的 blockquote 互不重叠，每次查询只需一次二分；
+    手工构造的重叠区间退回区间索引，保持“取第一个 blockquote”的语义。
+    """
+
+    __slots__ = (
+        "_ranges", "_starts", "_ends", "_types", "_index",
+        "_expandable_starts", "_expandable_ends",
+    )
+
+    def __init__(self, ranges: list[tuple[int, int, str]]) -> None:
+        self._ranges = ranges  # (start_py, end_py, type)
+        ordered = sorted((r for r in ranges if r[1] > r[0]), key=lambda r: r[0])
+        self._starts = [s for s, _, _ in ordered]
+        self._ends = [e for _, e, _ in ordered]
+        self._types = [t for _, _, t in ordered]
+        self._index = None
+        if any(prev_end > start for prev_end, start in zip(self._ends, self._starts[1:])):
+            self._index = EntityIndex([s for s, _, _ in ranges], [e for _, e, _ in ranges])
+        self._expandable_starts = {s for s, _, t in ranges if t == "expandable_blockquote"}
+        self._expandable_ends = {e for _, e, t in ranges if t == "expandable_blockquote"}
+
+    def __bool__(self) -> bool:
+        return bool(self._ranges)
+
+    def at(self, py_idx: int) -> str | None:
+        """返回 py_idx 位置的 blockquote 类型，不在 blockquote 内返回 None。"""
+        if self._index is not None:
+            rows = self._index.containing(py_idx)
+            return self._ranges[rows[0]][2] if rows else None
+        i = bisect_right(self._starts, py_idx) - 1
+        return self._types[i] if i >= 0 and py_idx < self._ends[i] else None
+
+    def is_expandable_end(self, py_idx: int) -> bool:
+        return py_idx in self._expandable_ends
+
+    def line_prefix(self, py_idx: int) -> str:
+        """从 py_idx 开始的一行的前缀：可折叠 blockquote 起点为 **>，blockquote 内为 >。"""
+        if py_idx in self._expandable_starts:
+            return "**>"
+        if self.at(py_idx) is not None:
+            return ">"
+        return ""
+
+    def tag(self, tag: str, pos_py: int) -> str:
+        """处理 tag 中的 \\n（如 pre 的 ```\\n）。
+
+        tag 中的 \\n 后如果对应的原始文本位置在 blockquote 内，也需加 > 前缀。
+        """
+        if not self._ranges or "\n" not in tag:
+            return tag
+        # pos_py 是 tag 对应的原始文本边界位置
+        bq = self.at(pos_py)
+        if bq is None:
+            # pos_py 可能恰好在 blockquote 边界外，检查 pos_py-1
+            if pos_py > 0:
+                bq = self.at(pos_py - 1)
+        if bq:
+            return tag.replace("\n", "\n>")
+        return tag
+
+
+def _sweep_events(
+    text: str, entities: list[MessageEntity], utf16_index: Utf16Index
+) -> tuple[_Blockquotes, list[tuple[int, int, int, int, MessageEntity]]]:
+    """分离 blockquote 和其他 entity，并将后者拆为按 Python index 排序的扫描线事件。"""
+    bq_ranges: list[tuple[int, int, str]] = []
+    events: list[tuple[int, int, int, int, MessageEntity]] = []
+    seq = 0
+    for ent in entities:
+        start_py = utf16_index.utf16_to_py(ent.offset)
+        end_py = utf16_index.utf16_to_py(ent.offset + ent.length)
+        if ent.type in ("blockquote", "expandable_blockquote"):
+            if start_py is not None and end_py is not None:
+                bq_ranges.append((start_py, end_py, ent.type))
+            continue
+        if start_py is not None and end_py is not None:
+            events.append((start_py, 1, -ent.length, seq, ent))    # open
+            events.append((end_py, 0, ent.length, -seq, ent))       # close: -seq 实现 LIFO
+        seq += 1
+
+    events.sort(key=lambda e: (e[0], e[1], e[2], e[3]))
+    return _Blockquotes(bq_ranges), events
+
+
+class _RenderedLength:
+    """entities_to_markdownv2() 输出长度（UTF-16 单位）的稀疏模型，不构建字符串。
+
+    输出 = 原文 + 转义用的反斜杠 + 标记（entity 标签、blockquote 行前缀、可折叠结束符 ||）。
+    总长度只需按区域统计转义字符数；切分时才把转义位置展开为有序数组。
+    BMP 外字符同样记为有序位置数组，标记记为按生效位置排序的长度前缀和，
+    因此任意文本位置之前的输出长度只需几次二分查找。
+    """
+
+    __slots__ = (
+        "_text", "_py_len", "_astral", "_code_spans", "_escape_count", "_escapes",
+        "_mark_positions", "_mark_sums", "_open_lengths", "_bqs", "_spans", "_tags",
+    )
+
+    def __init__(self, text: str, entities: list[MessageEntity]) -> None:
+        astral = astral_positions(text)
+        self._text = text
+        self._py_len = len(text)
+        self._astral = astral
+        bqs, events = _sweep_events(text, entities, Utf16Index.from_astral(astral, len(text)))
+
+        # (生效位置, 长度)：位置 <= p 的标记计入 before(p)
+        marks: list[tuple[int, int]] = []
+        # 每个位置的开始标记总长；entity 的 Python 区间与标记，切分时计算两端用
+        open_lengths: dict[int, int] = {}
+        span_starts: dict[int, int] = {}
+        spans: list[tuple[int, int]] = []
+        tags: list[tuple[str, str]] = []
+        # 与渲染时相同地模拟活跃的 code/pre entity，得到 code 转义区间
+        code_spans: list[tuple[int, int]] = []
+        active_code_entities: set[int] = set()
+        event_idx = 0
+        while event_idx < len(events):
+            pos = events[event_idx][0]
+            if bqs and bqs.is_expandable_end(pos):
+                marks.append((pos, 2))
+            while event_idx < len(events) and events[event_idx][0] == pos:
+                _, event_type, _, seq, ent = events[event_idx]
+                if event_type == 0:
+                    active_code_entities.discard(id(ent))
+                    close_tag = _get_close_tag(ent)
+                    marks.append((pos, utf16_len(bqs.tag(close_tag, pos))))
+                    span_start = span_starts.pop(-seq, None)
+                    if span_start is not None:  # 空 entity 先关闭后打开，不记区间
+                        spans.append((span_start, pos))
+                        tags.append((_get_open_tag(ent), close_tag))
+                else:
+                    if ent.type in _CODE_ENTITY_TYPES:
+                        active_code_entities.add(id(ent))
+                    # 开始标记在同一位置的结束标记之后输出，只计入 pos 之后的位置
+                    length = utf16_len(bqs.tag(_get_open_tag(ent), pos))
+                    marks.append((pos + 1, length))
+                    open_lengths[pos] = open_lengths.get(pos, 0) + length
+                    span_starts[seq] = pos
+                event_idx += 1
+            if active_code_entities:
+                next_pos = events[event_idx][0] if event_idx < len(events) else len(text)
+                if code_spans and code_spans[-1][1] == pos:
+                    code_spans[-1] = (code_spans[-1][0], next_pos)
+                else:
+                    code_spans.append((pos, next_pos))
+        if bqs:
+            if bqs.is_expandable_end(len(text)):
+                marks.append((len(text), 2))
+            marks.append((0, len(bqs.line_prefix(0))))
+            marks.extend(
+                (line_start, len(bqs.line_prefix(line_start)))
+                for line_start in _find_newline_positions(text)
+            )
+
+        escape_count = 0
+        prev = 0
+        for start, end in code_spans:
+            escape_count += _count_escapes(text, _MDV2_ESCAPES, prev, start)
+            escape_count += _count_escapes(text, _CODE_ESCAPES, start, end)
+            prev = end
+        self._escape_count = escape_count + _count_escapes(text, _MDV2_ESCAPES, prev)
+        self._code_spans = code_spans
+        self._escapes: list[int] | None = None
+
+        marks.sort()
+        self._mark_positions = [pos for pos, _ in marks]
+        self._mark_sums = list(accumulate((length for _, length in marks), initial=0))
+        self._open_lengths = open_lengths
+        self._bqs = bqs
+        self._spans = EntityIndex([start for start, _ in spans], [end for _, end in spans])
+        self._tags = tags
+
+    @property
+    def total(self) -> int:
+        """完整输出的长度。"""
+        return self._py_len + len(self._astral) + self._escape_count + self._mark_sums[-1]
+
+    def _escape_positions(self) -> list[int]:
+        if self._escapes is None:
+            text = self._text
+            escapes: list[int] = []
+            prev = 0
+            for start, end in self._code_spans:
+                escapes.extend(m.start() for m in _MDV2_ESCAPE_RE.finditer(text, prev, start))
+                escapes.extend(m.start() for m in _CODE_ESCAPE_RE.finditer(text, start, end))
+                prev = end
+            escapes.extend(m.start() for m in _MDV2_ESCAPE_RE.finditer(text, prev))
+            self._escapes = escapes
+        return self._escapes
+
+    def before(self, py_idx: int) -> int:
+        """输出中位于 text[py_idx] 之前的长度，含该位置的结束标记，不含开始标记。"""
+        return (
+            py_idx
+            + bisect_left(self._astral, py_idx)
+            + bisect_left(self._escape_positions(), py_idx)
+            + self._mark_sums[bisect_right(self._mark_positions, py_idx)]
+        )
+
+
+    def piece_length(self, start: int, end: int) -> int:
+        """text[start:end] 单独渲染（entities 裁剪到该区间）时的输出长度，不构建字符串。
+
+        区间内部的转义和标记与完整输出相同，直接由前缀和相减；不同的只有两端：
+        跨越 start 的 entity 在开头重新打开、跨越 end 的在结尾关闭，开头补 blockquote
+        行前缀，跨越 end 的可折叠 blockquote 在结尾补 ||。
+        要求 entities 都非空且边界不拆开代理对（裁剪时会丢弃或补全这些 entity）。
+        """
+        positions = self._mark_positions
+        sums = self._mark_sums
+        escapes = self._escape_positions()
+        open_lengths = self._open_lengths
+        # 内部标记：位置在 (start, end) 的标记；开始标记记在 pos + 1，两端各修正一次
+        length = (
+            end - start
+            + bisect_left(self._astral, end) - bisect_left(self._astral, start)
+            + bisect_left(escapes, end) - bisect_left(escapes, start)
+            + sums[bisect_right(positions, end - 1)] - sums[bisect_right(positions, start)]
+            - open_lengths.get(start, 0) + open_lengths.get(end - 1, 0)
+        )
+        tags = self._tags
+        for row in self._spans.containing(start):
+            length += self._tag_length(tags[row][0], start, start, end)
+        closing = self._spans.containing(end - 1)
+        for row in closing:
+            length += self._tag_length(tags[row][1], end, start, end)
+        bqs = self._bqs
+        if bqs:
+            expandable = [(s, e) for s, e, t in bqs._ranges if t == "expandable_blockquote"]
+            if any(s <= start < e for s, e in expandable):
+                length += 3
+            elif bqs.at(start) is not None:
+                length += 1
+            if any(s < end <= e for s, e in expandable):
+                # 与 entities_to_markdownv2 相同：末尾有事件时 || 在循环内外各输出一次
+                length += 4 if closing else 2
+        return length
+
+    def _tag_length(self, tag: str, pos: int, start: int, end: int) -> int:
+        """tag 在 text[start:end] 单独渲染时位于 pos 处的长度（同 _Blockquotes.tag）。"""
+        newlines = tag.count("\n")
+        bqs = self._bqs
+        if newlines and (
+            (pos < end and bqs.at(pos) is not None)
+            or (pos > start and bqs.at(pos - 1) is not None)
+        ):
+            return utf16_len(tag) + newlines
+        return utf16_len(tag)
+
+
+def markdownv2_length(text: str, entities: list[MessageEntity] | None = None) -> int:
+    """entities_to_markdownv2(text, entities) 的 UTF-16 长度，不构建输出字符串。
+
+    转义、entity 标记、blockquote 前缀和可折叠结束符都计算在内。
+    """
+    if not text:
+        return 0
+    return _RenderedLength(text, list(entities or [])).total
+
+
 def split_markdownv2(
     text: str,
     entities: list[MessageEntity] | None = None,
     max_utf16_len: int = 4096,
+    max_entities_per_message: int | None = None,
 ) -> list[str]:
     """Split text/entities into MarkdownV2 strings that fit Telegram's length limit.
 
     ``split_entities()`` limits the plain text length. MarkdownV2 adds escapes and
     formatting markers, so a plain-text chunk near 4096 code units can still become
     too long after ``entities_to_markdownv2()``. This helper splits by the rendered
-    MarkdownV2 length instead.
+    MarkdownV2 length instead: the rendered length up to every position is
+    known from one sweep, so each chunk is cut once, preferably after a
+    newline, and rendered once.
+
+    Telegram also rejects messages with more than 100 entities; pass
+    *max_entities_per_message* to keep every chunk within a limit (``None``,
+    the default, disables it).
     """
     if max_utf16_len <= 0:
         raise ValueError("max_utf16_len must be greater than 0")
+    if max_entities_per_message is not None and max_entities_per_message <= 0:
+        raise ValueError("max_entities_per_message must be greater than 0")
     if not text:
         return []
 
-    pending = split_entities(text, list(entities or []), max_utf16_len)
-    chunks: list[str] = []
-
-    while pending:
-        chunk_text, chunk_entities = pending.pop(0)
-        rendered = entities_to_markdownv2(chunk_text, chunk_entities)
-        if utf16_len(rendered) <= max_utf16_len:
-            chunks.append(rendered)
-            continue
-
-        plain_len = utf16_len(chunk_text)
-        if plain_len <= 1:
+    entities = list(entities or [])
+    layout = _RenderedLength(text, entities)
+    over_limit = _over_entity_limit(entities, max_entities_per_message)
+    if not over_limit and layout.total <= max_utf16_len:
+        return [entities_to_markdownv2(text, entities)]
+
+    utf16_index = Utf16Index(text)
+    # 空 entity 与拆开代理对的 entity 在完整输出中本就不渲染，裁剪后却可能变成有效的，
+    # 先去掉它们，各块的长度才能由 layout.piece_length() 直接算出
+    valid = [
+        ent for ent in entities
+        if ent.length
+        and utf16_index.utf16_to_py(ent.offset) is not None
+        and utf16_index.utf16_to_py(ent.offset + ent.length) is not None
+    ]
+    if len(valid) != len(entities):
+        entities = valid
+        layout = _RenderedLength(text, entities)
+    entity_array = EntityArray.from_entities(entities)
+    index = EntityIndex.from_entities(entity_array)
+    budget = _EntityBudget(entity_array, max_entities_per_message) if over_limit else None
+    newlines = _find_newline_positions(text)
+
+    def piece(start: int, end: int) -> tuple[str, list[MessageEntity]]:
+        clipped = entity_array.clip(
+            utf16_index.py_to_utf16(start), utf16_index.py_to_utf16(end), index=index
+        )
+        return text[start:end], clipped.to_list()
+
+    def furthest(start: int, reach: int, room: int) -> int:
+        """[start, reach] 内按估算渲染长度不超过 room 的最远位置（before() 单调不减）。"""
+        limit = layout.before(start) + room
+        lo, hi = start, reach
+        while lo < hi:
+            mid = (lo + hi + 1) >> 1
+            if layout.before(mid) <= limit:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def chunk_end(start: int) -> int:
+        reach = len(text)
+        if budget is not None:
+            limit = budget.end_limit(utf16_index.py_to_utf16(start))
+            if limit is not None:
+                reach = max(start + 1, utf16_index.utf16_to_py_floor(limit))
+        # 估算不含切分处重新打开/关闭的标记；实际长度超出时把差额留作余量再找一次
+        slack = 0
+        while True:
+            far = furthest(start, reach, max_utf16_len - slack)
+            if far <= start:
+                break
+            end = far
+            if far < len(text):
+                k = bisect_right(newlines, far) - 1
+                if k >= 0 and newlines[k] > start:
+                    end = newlines[k]
+            length = layout.piece_length(start, end)
+            if length <= max_utf16_len:
+                return end
+            slack = max(slack + 1, length - (layout.before(end) - layout.before(start)))
+        if layout.piece_length(start, start + 1) > max_utf16_len:
             raise ValueError(
                 "A single text unit renders longer than max_utf16_len in MarkdownV2"
             )
+        return start + 1
 
-        sub_limit = max(1, plain_len // 2)
-        sub_chunks = split_entities(chunk_text, chunk_entities, sub_limit)
-        if len(sub_chunks) == 1:
-            sub_limit = max(1, plain_len - 1)
-            sub_chunks = split_entities(chunk_text, chunk_entities, sub_limit)
-        if len(sub_chunks) == 1:
-            raise ValueError("Unable to split MarkdownV2 output within max_utf16_len")
-
-        pending = sub_chunks + pending
-
+    chunks: list[str] = []
+    start = 0
+    while start < len(text):
+        end = chunk_end(start)
+        chunks.append(entities_to_markdownv2(*piece(start, end)))
+        start = end
     return chunks
 
 
@@ -8,7 +8,7 @@ from typing import TYPE_CHECKING
 from typing import Union, Tuple
 from urllib.parse import urlencode
 
-from telegramify_markdown.config import get_runtime_config
+from telegramify_markdown.config import RenderProfile
 from telegramify_markdown.logger import logger
 
 if TYPE_CHECKING:
@@ -110,15 +110,20 @@ def safe_base64_encode(data):
     return base64.urlsafe_b64encode(data)
 
 
-def generate_pako(graph_markdown: str, mermaid_config: MermaidConfig = None) -> str:
+def generate_pako(
+        graph_markdown: str,
+        mermaid_config: MermaidConfig = None,
+        profile: RenderProfile = None,
+) -> str:
     """
     Generate the pako URL for the Mermaid graph.
     :param graph_markdown: Input Mermaid graph markdown
     :param mermaid_config: Mermaid configuration
+    :param profile: Render profile the theme is taken from. Uses global config if None.
     :return: The pako URL
     """
     if mermaid_config is None:
-        mermaid_config = MermaidConfig(theme=get_runtime_config().mermaid.theme)
+        mermaid_config = MermaidConfig(theme=RenderProfile.from_config(profile).mermaid_theme)
     graph_data = {
         "code": graph_markdown,
         "mermaid": mermaid_config.__dict__
@@ -129,15 +134,15 @@ def generate_pako(graph_markdown: str, mermaid_config: MermaidConfig = None) ->
     return f"pako:{base64_encoded.decode('ascii')}"
 
 
-def _build_mermaid_ink_query() -> str:
-    """Build Mermaid Ink query parameters from runtime config."""
-    mermaid_config = get_runtime_config().mermaid
+def _build_mermaid_ink_query(profile: RenderProfile = None) -> str:
+    """Build Mermaid Ink query parameters from the profile (runtime config if None)."""
+    profile = RenderProfile.from_config(profile)
     return urlencode(
         {
-            "theme": mermaid_config.theme,
-            "width": mermaid_config.width,
-            "scale": mermaid_config.scale,
-            "type": mermaid_config.image_type,
+            "theme": profile.mermaid_theme,
+            "width": profile.mermaid_width,
+            "scale": profile.mermaid_scale,
+            "type": profile.mermaid_image_type,
         }
     )
 
@@ -154,33 +159,38 @@ def b64_mermaid_url(diagram: str) -> str:
     return f'https://mermaid.ink/img/{diagram_encoded}?{_build_mermaid_ink_query()}'
 
 
-def get_mermaid_live_url(graph_markdown: str) -> str:
+def get_mermaid_live_url(graph_markdown: str, profile: RenderProfile = None) -> str:
     """
     Get the Mermaid Live URL for the graph.
     Can be used to edit the graph in the browser.
     :param graph_markdown:
+    :param profile: Render profile. Uses global config if None.
     :return:
     """
-    return f'https://mermaid.live/edit/#{generate_pako(graph_markdown)}'
+    return f'https://mermaid.live/edit/#{generate_pako(graph_markdown, profile=profile)}'
 
 
-def get_mermaid_ink_url(graph_markdown: str) -> str:
+def get_mermaid_ink_url(graph_markdown: str, profile: RenderProfile = None) -> str:
     """
     Get the Mermaid Ink URL for the graph.
     Can be used to download the image.
     :param graph_markdown: The Mermaid graph Markdown
+    :param profile: Render profile. Uses global config if None.
     :return: Link
     """
-    return f'https://mermaid.ink/img/{generate_pako(graph_markdown)}?{_build_mermaid_ink_query()}'
+    pako = generate_pako(graph_markdown, profile=profile)
+    return f'https://mermaid.ink/img/{pako}?{_build_mermaid_ink_query(profile)}'
 
 
 async def render_mermaid(
         diagram: str,
         session: "ClientSession" = None,
+        profile: RenderProfile = None,
 ) -> Tuple[BytesIO, str]:
     # render picture
-    img_url = get_mermaid_ink_url(diagram)
-    caption = get_mermaid_live_url(diagram)
+    profile = RenderProfile.from_config(profile)
+    img_url = get_mermaid_ink_url(diagram, profile)
+    caption = get_mermaid_live_url(diagram, profile)
     # Download the image
     img_data = await download_image(
         url=img_url,
@@ -2,105 +2,47 @@
 
 from __future__ import annotations
 
-from telegramify_markdown.converter import Segment, convert_with_segments
-from telegramify_markdown.entity import MessageEntity, split_entities, utf16_len
+import asyncio
+import dataclasses
+import threading
+from typing import AsyncIterator, Iterator, Sequence
+
+from telegramify_markdown.config import RenderConfig, RenderProfile
+from telegramify_markdown.converter import Segment, convert_with_index
+from telegramify_markdown.entity import EntityArray, EntityIndex, MessageEntity, split_entity_array
 from telegramify_markdown.logger import logger
 from telegramify_markdown.code_file import get_filename
-from telegramify_markdown.content import ContentTrace, File, Photo, Text
+from telegramify_markdown.content import ContentTrace, File, MediaGroup, Photo, Text
+from telegramify_markdown.utf16 import Utf16Index, utf16_len
 
 
 def _strip_newlines_adjust(
-    text: str, entities: list[MessageEntity]
-) -> tuple[str, list[MessageEntity]]:
+    text: str, entities: EntityArray
+) -> tuple[str, EntityArray]:
     """Strip leading/trailing newlines from text and adjust entity offsets."""
-    # Count leading newlines
-    leading = 0
-    for ch in text:
-        if ch == "\n":
-            leading += 1
-        else:
-            break
-
-    # Count trailing newlines
-    trailing = 0
-    for ch in reversed(text):
-        if ch == "\n":
-            trailing += 1
-        else:
-            break
-
-    if leading == 0 and trailing == 0:
+    stripped = text.strip("\n")
+    if len(stripped) == len(text):
         return text, entities
-
-    end = len(text) - trailing if trailing else len(text)
-    stripped = text[leading:end]
     if not stripped:
-        return stripped, []
-
+        return stripped, EntityArray()
     # Newlines are each 1 UTF-16 code unit
-    leading_utf16 = leading
-    new_utf16_len = utf16_len(stripped)
-
-    adjusted: list[MessageEntity] = []
-    for ent in entities:
-        new_offset = ent.offset - leading_utf16
-        new_end = new_offset + ent.length
-        # Skip entities entirely outside the stripped range
-        if new_end <= 0 or new_offset >= new_utf16_len:
-            continue
-        # Clip to boundaries
-        new_offset = max(0, new_offset)
-        new_end = min(new_end, new_utf16_len)
-        new_length = new_end - new_offset
-        if new_length <= 0:
-            continue
-        adjusted.append(
-            MessageEntity(
-                type=ent.type,
-                offset=new_offset,
-                length=new_length,
-                url=ent.url,
-                language=ent.language,
-                custom_emoji_id=ent.custom_emoji_id,
-            )
-        )
-
-    return stripped, adjusted
+    leading = len(text) - len(text.lstrip("\n"))
+    return stripped, entities.clip(leading, leading + utf16_len(stripped))
 
 
 def _slice_text_entities(
     full_text: str,
-    full_entities: list[MessageEntity],
+    full_entities: EntityArray,
     py_start: int,
     py_end: int,
     utf16_start: int,
     utf16_end: int,
-) -> tuple[str, list[MessageEntity]]:
+    entity_index: EntityIndex | None = None,
+) -> tuple[str, EntityArray]:
     """Extract a substring and its overlapping entities, adjusting offsets."""
-    chunk_text = full_text[py_start:py_end]
-    chunk_entities: list[MessageEntity] = []
-    for ent in full_entities:
-        ent_start = ent.offset
-        ent_end = ent.offset + ent.length
-        # Check overlap with [utf16_start, utf16_end)
-        if ent_end <= utf16_start or ent_start >= utf16_end:
-            continue
-        clipped_start = max(ent_start, utf16_start)
-        clipped_end = min(ent_end, utf16_end)
-        clipped_length = clipped_end - clipped_start
-        if clipped_length <= 0:
-            continue
-        chunk_entities.append(
-            MessageEntity(
-                type=ent.type,
-                offset=clipped_start - utf16_start,
-                length=clipped_length,
-                url=ent.url,
-                language=ent.language,
-                custom_emoji_id=ent.custom_emoji_id,
-            )
-        )
-    return chunk_text, chunk_entities
+    return full_text[py_start:py_end], full_entities.clip(
+        utf16_start, utf16_end, index=entity_index
+    )
 
 
 async def process_markdown(
@@ -110,7 +52,15 @@ async def process_markdown(
     latex_escape: bool = True,
     render_mermaid: bool = True,
     min_file_lines: int = 1,
-) -> list[Text | File | Photo]:
+    config: RenderConfig | RenderProfile | None = None,
+    packing: str = "greedy",
+    max_entities_per_message: int | None = 100,
+    mermaid_concurrency: int = 4,
+    mermaid_timeout: float | None = 30.0,
+    pack_captions: bool = False,
+    media_groups: bool = False,
+    committed: Sequence[int] = (),
+) -> list[Text | File | Photo | MediaGroup]:
     """Full async pipeline: markdown → list of sendable content pieces.
 
     :param content: Raw markdown text.
@@ -122,21 +72,240 @@ async def process_markdown(
     :param min_file_lines: Minimum line count for a code block to be extracted
         as a separate file.  Set to ``0`` to disable file extraction entirely
         (all code blocks stay inline as ``pre`` entities).
+    :param config: Render configuration or profile. Uses global config if None.
+    :param packing: How long text is split into messages, ``"greedy"`` or
+        ``"optimal"`` (see :func:`split_entities`).
+    :param max_entities_per_message: Most entities per text message; Telegram
+        rejects messages with more than 100. ``None`` disables the limit.
+    :param mermaid_concurrency: Most Mermaid diagrams rendered at the same time.
+    :param mermaid_timeout: Seconds all Mermaid renders may take together;
+        diagrams not rendered by then are sent as File. ``None`` waits for all.
+    :param pack_captions: Move a Text that directly follows a File or Photo
+        into its caption when it fits Telegram's 1024-unit caption limit.
+    :param media_groups: Batch runs of consecutive Files (or of consecutive
+        Photos) into :class:`MediaGroup` items of up to 10, for ``sendMediaGroup``.
+    :param committed: Where text messages already sent end: the
+        ``content_trace.extra["utf16_end"]`` of their :class:`Text` items.
+        Text is always cut there and only the text after the last one is
+        repacked, so those messages never reflow (see :func:`split_entities`).
+        A boundary that no longer falls within text raises :exc:`ValueError`.
 
     Pipeline steps:
 
     1. Convert markdown to (text, entities, segments) via converter
     2. Walk segments in order:
-       - mermaid → render as Photo (or File on failure), unless *render_mermaid* is False
+       - mermaid → reserve its place, unless *render_mermaid* is False
        - code_block → extract as File if line count ≥ *min_file_lines*
        - text regions → collect and split by *max_message_length*
-    3. Return ordered list of Text | File | Photo
+    3. Render all mermaid diagrams concurrently as Photo (or File on failure)
+       and put them in their places, within *mermaid_timeout* overall
+    4. Fold text into the preceding media caption if *pack_captions*, then
+       batch consecutive media if *media_groups*
+    5. Return ordered list of Text | File | Photo | MediaGroup
+    """
+    if mermaid_concurrency <= 0:
+        raise ValueError("mermaid_concurrency must be greater than 0")
+    profile = RenderProfile.from_config(config)
+    parts = _walk_markdown(
+        content,
+        max_message_length=max_message_length,
+        latex_escape=latex_escape,
+        render_mermaid=render_mermaid,
+        min_file_lines=min_file_lines,
+        profile=profile,
+        packing=packing,
+        max_entities_per_message=max_entities_per_message,
+        committed=committed,
+    )
+    mermaid_segments = [part for part in parts if isinstance(part, Segment)]
+    if mermaid_segments:
+        renders = _MermaidRenders(
+            mermaid_segments, profile, mermaid_concurrency, mermaid_timeout
+        )
+        try:
+            parts = [
+                await renders.next() if isinstance(part, Segment) else part for part in parts
+            ]
+        finally:
+            await renders.aclose()
+    stages = _output_stages(pack_captions, media_groups, max_entities_per_message)
+    if stages:
+        return _run_stages(stages, parts)
+    return parts
+
+
+async def iter_markdown(
+    content: str,
+    *,
+    max_message_length: int = 4096,
+    latex_escape: bool = True,
+    render_mermaid: bool = True,
+    min_file_lines: int = 1,
+    config: RenderConfig | RenderProfile | None = None,
+    packing: str = "greedy",
+    max_entities_per_message: int | None = 100,
+    mermaid_concurrency: int = 4,
+    mermaid_timeout: float | None = 30.0,
+    pack_captions: bool = False,
+    media_groups: bool = False,
+    committed: Sequence[int] = (),
+) -> AsyncIterator[Text | File | Photo | MediaGroup]:
+    """:func:`process_markdown` as an async generator, yielding items as they are final.
+
+    Text and code files are ready as soon as the markdown is converted; every
+    Mermaid diagram starts rendering up front and is yielded when its turn
+    comes, so the text before the first diagram can be sent while the
+    diagrams are still downloading. Takes the same options as
+    :func:`process_markdown` and yields the same items in the same order.
+    Closing the generator early cancels the renders still running.
+    """
+    if mermaid_concurrency <= 0:
+        raise ValueError("mermaid_concurrency must be greater than 0")
+    profile = RenderProfile.from_config(config)
+    parts = _walk_markdown(
+        content,
+        max_message_length=max_message_length,
+        latex_escape=latex_escape,
+        render_mermaid=render_mermaid,
+        min_file_lines=min_file_lines,
+        profile=profile,
+        packing=packing,
+        max_entities_per_message=max_entities_per_message,
+        committed=committed,
+    )
+    mermaid_segments = [part for part in parts if isinstance(part, Segment)]
+    renders = None
+    if mermaid_segments:
+        renders = _MermaidRenders(
+            mermaid_segments, profile, mermaid_concurrency, mermaid_timeout
+        )
+    # Media held back by the output stages waits only for the items after it
+    stages = _output_stages(pack_captions, media_groups, max_entities_per_message)
+    try:
+        for part in parts:
+            item = await renders.next() if isinstance(part, Segment) else part
+            for ready in _feed_stages(stages, item):
+                yield ready
+        for ready in _flush_stages(stages):
+            yield ready
+    finally:
+        if renders is not None:
+            await renders.aclose()
+
+
+def telegramify_sync(
+    content: str,
+    *,
+    max_message_length: int = 4096,
+    latex_escape: bool = True,
+    render_mermaid: bool = True,
+    min_file_lines: int = 1,
+    config: RenderConfig | RenderProfile | None = None,
+    packing: str = "greedy",
+    max_entities_per_message: int | None = 100,
+    mermaid_concurrency: int = 4,
+    mermaid_timeout: float | None = 30.0,
+    pack_captions: bool = False,
+    media_groups: bool = False,
+    committed: Sequence[int] = (),
+) -> list[Text | File | Photo | MediaGroup]:
+    """Synchronous :func:`process_markdown` for code without an event loop.
+
+    Takes the same options and returns the same items. Documents without
+    Mermaid diagrams to render (or with *render_mermaid* False) never touch
+    asyncio. Diagrams are rendered on a shared background event loop thread
+    while the calling thread waits, so it is safe to call from worker threads
+    such as pyTelegramBotAPI handlers.
+    """
+    if mermaid_concurrency <= 0:
+        raise ValueError("mermaid_concurrency must be greater than 0")
+    profile = RenderProfile.from_config(config)
+    parts = _walk_markdown(
+        content,
+        max_message_length=max_message_length,
+        latex_escape=latex_escape,
+        render_mermaid=render_mermaid,
+        min_file_lines=min_file_lines,
+        profile=profile,
+        packing=packing,
+        max_entities_per_message=max_entities_per_message,
+        committed=committed,
+    )
+    mermaid_segments = [part for part in parts if isinstance(part, Segment)]
+    if mermaid_segments:
+        parts = _render_on_background_loop(
+            parts, mermaid_segments, profile, mermaid_concurrency, mermaid_timeout
+        )
+    stages = _output_stages(pack_captions, media_groups, max_entities_per_message)
+    if stages:
+        return _run_stages(stages, parts)
+    return parts
+
+
+def _render_on_background_loop(
+    parts: list[Text | File | Segment],
+    mermaid_segments: list[Segment],
+    profile: RenderProfile,
+    concurrency: int,
+    timeout: float | None,
+) -> list[Text | File | Photo]:
+    """Replace each mermaid Segment in *parts* with its render, from a sync caller."""
+
+    async def render_all() -> list[Photo | File]:
+        renders = _MermaidRenders(mermaid_segments, profile, concurrency, timeout)
+        try:
+            return [await renders.next() for _ in mermaid_segments]
+        finally:
+            await renders.aclose()
+
+    items = iter(
+        asyncio.run_coroutine_threadsafe(render_all(), _background_loop()).result()
+    )
+    return [next(items) if isinstance(part, Segment) else part for part in parts]
+
+
+_BACKGROUND_LOOP: asyncio.AbstractEventLoop | None = None
+_BACKGROUND_LOOP_LOCK = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop running in a daemon thread, started on first use and then shared."""
+    global _BACKGROUND_LOOP
+    with _BACKGROUND_LOOP_LOCK:
+        if _BACKGROUND_LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="telegramify-mermaid", daemon=True
+            ).start()
+            _BACKGROUND_LOOP = loop
+        return _BACKGROUND_LOOP
+
+
+def _walk_markdown(
+    content: str,
+    *,
+    max_message_length: int,
+    latex_escape: bool,
+    render_mermaid: bool,
+    min_file_lines: int,
+    profile: RenderProfile,
+    packing: str,
+    max_entities_per_message: int | None,
+    committed: Sequence[int] = (),
+) -> list[Text | File | Segment]:
+    """Pipeline steps 1–2: everything that needs no network, in document order.
+
+    Mermaid diagrams to render are left in place as their :class:`Segment`.
     """
-    full_text, full_entities, segments = convert_with_segments(
-        content, latex_escape=latex_escape
+    if any(later <= earlier for earlier, later in zip(committed, committed[1:])):
+        raise ValueError("committed boundaries must increase")
+    full_text, entity_list, segments, full_index = convert_with_index(
+        content, latex_escape=latex_escape, config=profile
     )
+    full_entities = EntityArray(entity_list)
+    entity_index = EntityIndex.from_entities(full_entities)
 
-    result: list[Text | File | Photo] = []
+    result: list[Text | File | Segment] = []
 
     # Build a sorted list of segments to extract (as File/Photo instead of inline text).
     # - code_block: extract when min_file_lines > 0 and the block is long enough
@@ -156,69 +325,137 @@ async def process_markdown(
 
     # Walk through the text, interleaving text chunks with special segments
     cursor_py = 0
-    cursor_utf16 = 0
+    text_ranges: list[tuple[int, int]] = []
 
     for seg in special_segments:
         # Emit text before this segment
         if seg.text_start > cursor_py:
-            text_chunk, text_entities = _slice_text_entities(
-                full_text, full_entities,
-                cursor_py, seg.text_start,
-                cursor_utf16, seg.utf16_start,
-            )
-            text_chunk, text_entities = _strip_newlines_adjust(text_chunk, text_entities)
-            if text_chunk:
-                _append_text_chunks(result, text_chunk, text_entities, max_message_length)
+            text_ranges.append(_append_text_region(
+                result, full_text, full_entities, entity_index, full_index,
+                cursor_py, seg.text_start, max_message_length, packing,
+                max_entities_per_message, committed,
+            ))
 
-        # Handle special segment
+        # Handle special segment; mermaid diagrams are rendered later
         if seg.kind == "mermaid":
-            await _handle_mermaid(result, seg)
+            result.append(seg)
         elif seg.kind == "code_block":
             _handle_code_block(result, seg)
 
         cursor_py = seg.text_end
-        cursor_utf16 = seg.utf16_end
 
     # Emit remaining text after last special segment
     if cursor_py < len(full_text):
-        text_chunk, text_entities = _slice_text_entities(
-            full_text, full_entities,
-            cursor_py, len(full_text),
-            cursor_utf16, utf16_len(full_text),
-        )
-        text_chunk, text_entities = _strip_newlines_adjust(text_chunk, text_entities)
-        if text_chunk:
-            _append_text_chunks(result, text_chunk, text_entities, max_message_length)
+        text_ranges.append(_append_text_region(
+            result, full_text, full_entities, entity_index, full_index,
+            cursor_py, len(full_text), max_message_length, packing,
+            max_entities_per_message, committed,
+        ))
+
+    for boundary in committed:
+        if not any(start <= boundary <= end for start, end in text_ranges):
+            raise ValueError(
+                f"Invalid committed boundary {boundary}: not within a text message; "
+                "pass the 'utf16_end' of sent Text items"
+            )
 
     # If no output was generated, emit empty text
     if not result and full_text.strip():
-        _append_text_chunks(result, full_text.strip(), full_entities, max_message_length)
+        _append_text_chunks(
+            result, full_text.strip(), full_entities, max_message_length,
+            packing=packing, max_entities_per_message=max_entities_per_message,
+        )
 
     return result
 
 
+def _append_text_region(
+    result: list[Text | File | Segment],
+    full_text: str,
+    full_entities: EntityArray,
+    entity_index: EntityIndex,
+    full_index: Utf16Index,
+    py_start: int,
+    py_end: int,
+    max_message_length: int,
+    packing: str = "greedy",
+    max_entities_per_message: int | None = 100,
+    committed: Sequence[int] = (),
+) -> tuple[int, int]:
+    """Emit full_text[py_start:py_end] without its leading/trailing newlines.
+
+    *committed* boundaries are offsets in *full_text*; those inside the region
+    are passed on relative to its start. Returns the UTF-16 range emitted.
+    """
+    region = full_text[py_start:py_end]
+    stripped = region.strip("\n")
+    if not stripped:
+        utf16_start = full_index.py_to_utf16(py_start)
+        return utf16_start, utf16_start
+    py_start += len(region) - len(region.lstrip("\n"))
+    py_end = py_start + len(stripped)
+    utf16_start = full_index.py_to_utf16(py_start)
+    utf16_end = full_index.py_to_utf16(py_end)
+    text_chunk, text_entities = _slice_text_entities(
+        full_text, full_entities,
+        py_start, py_end,
+        utf16_start, utf16_end,
+        entity_index,
+    )
+    _append_text_chunks(
+        result, text_chunk, text_entities, max_message_length,
+        utf16_index=full_index.slice(py_start, py_end),
+        packing=packing, max_entities_per_message=max_entities_per_message,
+        committed=[
+            boundary - utf16_start
+            for boundary in committed
+            if utf16_start < boundary < utf16_end
+        ],
+        utf16_start=utf16_start,
+    )
+    return utf16_start, utf16_end
+
+
 def _append_text_chunks(
-    result: list[Text | File | Photo],
+    result: list[Text | File | Segment],
     text: str,
-    entities: list[MessageEntity],
+    entities: EntityArray,
     max_message_length: int,
+    utf16_index: Utf16Index | None = None,
+    packing: str = "greedy",
+    max_entities_per_message: int | None = 100,
+    committed: Sequence[int] = (),
+    utf16_start: int = 0,
 ) -> None:
-    """Split text by max_message_length and emit Text objects."""
-    chunks = split_entities(text, entities, max_message_length)
+    """Split text by max_message_length and emit Text objects.
+
+    Each Text records in ``content_trace.extra["utf16_end"]`` where its chunk
+    ends in the converted text, *text* starting at *utf16_start*.
+    """
+    chunks = split_entity_array(
+        text, entities, max_message_length, utf16_index=utf16_index,
+        packing=packing, max_entities_per_message=max_entities_per_message,
+        committed=committed,
+    )
+    utf16_end = utf16_start
     for chunk_text, chunk_entities in chunks:
+        utf16_end += utf16_len(chunk_text)
         chunk_text, chunk_entities = _strip_newlines_adjust(chunk_text, chunk_entities)
         if chunk_text:
             result.append(
                 Text(
                     text=chunk_text,
-                    entities=chunk_entities,
-                    content_trace=ContentTrace(source_type="text"),
+                    entities=chunk_entities.to_list(),
+                    content_trace=ContentTrace(
+                        source_type="text",
+                        extra={"utf16_end": utf16_end},
+                    ),
                 )
             )
 
 
 def _handle_code_block(
-    result: list[Text | File | Photo],
+    result: list[Text | File | Segment],
     seg: Segment,
 ) -> None:
     """Extract a code block as a File."""
@@ -237,54 +474,221 @@ def _handle_code_block(
     )
 
 
-async def _handle_mermaid(
-    result: list[Text | File | Photo],
-    seg: Segment,
-) -> None:
-    """Render a mermaid diagram as a Photo, or fall back to File."""
-    from telegramify_markdown.mermaid import support_mermaid
+def _mermaid_file(seg: Segment, file_name: str) -> File:
+    """Fallback for a mermaid diagram that could not be rendered."""
+    return File(
+        file_name=file_name,
+        file_data=seg.raw_code.encode("utf-8"),
+        content_trace=ContentTrace(source_type="mermaid"),
+    )
+
+
+async def _render_mermaid_photo(seg: Segment, profile: RenderProfile | None = None) -> Photo:
+    """Render a mermaid diagram as a Photo captioned with its mermaid.live link."""
+    from telegramify_markdown.mermaid import render_mermaid, get_mermaid_live_url
 
     raw_code = seg.raw_code
-    if not support_mermaid():
-        logger.warning("Mermaid support not available (missing aiohttp/Pillow). Sending as file.")
-        result.append(
-            File(
-                file_name="mermaid.txt",
-                file_data=raw_code.encode("utf-8"),
-                content_trace=ContentTrace(source_type="mermaid"),
+    img_data, _caption_url = await render_mermaid(raw_code, profile=profile)
+    edit_url = get_mermaid_live_url(raw_code, profile)
+    # 用 text_link entity 避免长 URL 撑爆 caption 长度限制
+    caption = "Edit on mermaid.live"
+    return Photo(
+        file_name="mermaid.webp",
+        file_data=img_data.read(),
+        content_trace=ContentTrace(source_type="mermaid"),
+        caption_text=caption,
+        caption_entities=[
+            MessageEntity(
+                type="text_link",
+                offset=0,
+                length=utf16_len(caption),
+                url=edit_url,
             )
-        )
-        return
+        ],
+    )
 
-    try:
-        from telegramify_markdown.mermaid import render_mermaid, get_mermaid_live_url
-
-        img_data, _caption_url = await render_mermaid(raw_code)
-        edit_url = get_mermaid_live_url(raw_code)
-        # 用 text_link entity 避免长 URL 撑爆 caption 长度限制
-        caption = "Edit on mermaid.live"
-        result.append(
-            Photo(
-                file_name="mermaid.webp",
-                file_data=img_data.read(),
-                content_trace=ContentTrace(source_type="mermaid"),
-                caption_text=caption,
-                caption_entities=[
-                    MessageEntity(
-                        type="text_link",
-                        offset=0,
-                        length=utf16_len(caption),
-                        url=edit_url,
-                    )
-                ],
-            )
-        )
-    except Exception as e:
-        logger.error(f"Mermaid rendering failed: {e}")
-        result.append(
-            File(
-                file_name="invalid_mermaid.txt",
-                file_data=raw_code.encode("utf-8"),
-                content_trace=ContentTrace(source_type="mermaid"),
-            )
-        )
+
+class _MermaidRenders:
+    """Concurrent renders of a document's mermaid diagrams under one deadline.
+
+    All renders start right away, at most *concurrency* downloading at once.
+    :meth:`next` returns the diagrams in document order as Photo, or as File
+    when the render failed or was not done within *timeout* seconds of the
+    start. Call :meth:`aclose` when done to cancel the renders left over.
+    """
+
+    def __init__(
+        self,
+        segments: list[Segment],
+        profile: RenderProfile | None = None,
+        concurrency: int = 4,
+        timeout: float | None = 30.0,
+    ) -> None:
+        from telegramify_markdown.mermaid import support_mermaid
+
+        self._segments = iter(segments)
+        self._timeout = timeout
+        self._tasks: Iterator[asyncio.Task[Photo]] | None = None
+        self._pending: list[asyncio.Task[Photo]] = []
+        if not support_mermaid():
+            logger.warning("Mermaid support not available (missing aiohttp/Pillow). Sending as file.")
+            return
+
+        loop = asyncio.get_running_loop()
+        self._deadline = None if timeout is None else loop.time() + timeout
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def render(seg: Segment) -> Photo:
+            async with semaphore:
+                return await _render_mermaid_photo(seg, profile)
+
+        self._pending = [asyncio.ensure_future(render(seg)) for seg in segments]
+        self._tasks = iter(self._pending)
+
+    async def next(self) -> Photo | File:
+        seg = next(self._segments)
+        if self._tasks is None:
+            return _mermaid_file(seg, "mermaid.txt")
+        task = next(self._tasks)
+        if not task.done():
+            remaining = None
+            if self._deadline is not None:
+                remaining = max(0.0, self._deadline - asyncio.get_running_loop().time())
+            await asyncio.wait([task], timeout=remaining)
+        if not task.done():
+            task.cancel()
+            logger.error(f"Mermaid rendering timed out after {self._timeout}s")
+            return _mermaid_file(seg, "mermaid.txt")
+        if task.exception() is not None:
+            logger.error(f"Mermaid rendering failed: {task.exception()}")
+            return _mermaid_file(seg, "invalid_mermaid.txt")
+        return task.result()
+
+    async def aclose(self) -> None:
+        for task in self._pending:
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+
+
+# Telegram's limit for photo and document captions, in UTF-16 code units
+_MAX_CAPTION_LENGTH = 1024
+
+
+def _fold_caption(
+    media: File | Photo, text: Text, max_entities: int | None
+) -> File | Photo | None:
+    """*media* with *text* appended to its caption, or None if it does not fit."""
+    prefix = media.caption_text + "\n\n" if media.caption_text else ""
+    shift = utf16_len(prefix)
+    if shift + utf16_len(text.text) > _MAX_CAPTION_LENGTH:
+        return None
+    entities = list(media.caption_entities)
+    entities.extend(
+        dataclasses.replace(entity, offset=entity.offset + shift) for entity in text.entities
+    )
+    if max_entities is not None and len(entities) > max_entities:
+        return None
+    return dataclasses.replace(media, caption_text=prefix + text.text, caption_entities=entities)
+
+
+class _CaptionPacker:
+    """Folds each Text into the caption of a File or Photo right before it.
+
+    Items go in through :meth:`feed` in document order and come back out,
+    packed, in the same order; a media item is held until the next item
+    shows whether it takes a caption. :meth:`flush` returns the last one.
+    """
+
+    def __init__(self, max_entities: int | None = 100) -> None:
+        self._max_entities = max_entities
+        self._media: File | Photo | None = None
+
+    def feed(self, item: Text | File | Photo) -> list[Text | File | Photo]:
+        media, self._media = self._media, None
+        if media is not None and isinstance(item, Text):
+            packed = _fold_caption(media, item, self._max_entities)
+            if packed is not None:
+                return [packed]
+        ready: list[Text | File | Photo] = [] if media is None else [media]
+        if isinstance(item, Text):
+            ready.append(item)
+        else:
+            self._media = item
+        return ready
+
+    def flush(self) -> list[Text | File | Photo]:
+        media, self._media = self._media, None
+        return [] if media is None else [media]
+
+
+# sendMediaGroup takes 2-10 items
+_MAX_MEDIA_GROUP_SIZE = 10
+
+
+class _MediaGrouper:
+    """Batches runs of consecutive Files, or of consecutive Photos, into MediaGroups.
+
+    Same :meth:`feed`/:meth:`flush` protocol as :class:`_CaptionPacker`.
+    Runs longer than 10 are cut into groups of 10; a single item stays as is.
+    """
+
+    def __init__(self) -> None:
+        self._run: list[File | Photo] = []
+
+    def feed(self, item: Text | File | Photo) -> list[Text | File | Photo | MediaGroup]:
+        if isinstance(item, Text):
+            ready = self.flush()
+            ready.append(item)
+            return ready
+        ready = []
+        if self._run and (
+            type(item) is not type(self._run[0]) or len(self._run) == _MAX_MEDIA_GROUP_SIZE
+        ):
+            ready = self.flush()
+        self._run.append(item)
+        return ready
+
+    def flush(self) -> list[File | Photo | MediaGroup]:
+        run, self._run = self._run, []
+        if len(run) < 2:
+            return run
+        return [MediaGroup(items=run, content_trace=ContentTrace(source_type="media_group"))]
+
+
+def _output_stages(
+    pack_captions: bool, media_groups: bool, max_entities: int | None
+) -> list[_CaptionPacker | _MediaGrouper]:
+    """The opt-in stages that repackage the finished items, in the order they run."""
+    stages: list[_CaptionPacker | _MediaGrouper] = []
+    if pack_captions:
+        stages.append(_CaptionPacker(max_entities))
+    if media_groups:
+        stages.append(_MediaGrouper())
+    return stages
+
+
+def _feed_stages(stages: list, item: Text | File | Photo) -> list:
+    items = [item]
+    for stage in stages:
+        items = [ready for item in items for ready in stage.feed(item)]
+    return items
+
+
+def _flush_stages(stages: list) -> list:
+    items: list = []
+    for stage in stages:
+        items = [ready for item in items for ready in stage.feed(item)]
+        items.extend(stage.flush())
+    return items
+
+
+def _run_stages(stages: list, items: list[Text | File | Photo]) -> list:
+    result = [ready for item in items for ready in _feed_stages(stages, item)]
+    result.extend(_flush_stages(stages))
+    return result
+
+
+def _pack_captions(
+    items: list[Text | File | Photo], max_entities: int | None = 100
+) -> list[Text | File | Photo]:
+    return _run_stages([_CaptionPacker(max_entities)], items)
@@ -0,0 +1,115 @@
+"""UTF-16 code unit accounting shared by the converter, splitter and MarkdownV2 renderer.
+
+Telegram measures entity offsets and lengths in UTF-16 code units. Only
+characters outside the BMP (astral, codepoint > 0xFFFF) differ from Python
+str indexing: they take two code units (a surrogate pair). Everything here is
+therefore built around a sparse, sorted list of astral character positions,
+found by C-level scanning instead of per-character Python loops.
+"""
+
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+
+_ASTRAL_RE = re.compile("[\U00010000-\U0010ffff]")
+
+
+def utf16_len(text: str) -> int:
+    """Return the length of text measured in UTF-16 code units.
+
+    Telegram measures entity offsets and lengths in UTF-16 code units,
+    not Python str characters. Characters outside the BMP (codepoint > 0xFFFF)
+    take 2 UTF-16 code units (a surrogate pair); all others take 1.
+    """
+    if text.isascii():
+        return len(text)
+    # Lone surrogates are kept as a single code unit, like the BMP characters they are
+    return len(text.encode("utf-16-le", "surrogatepass")) >> 1
+
+
+def astral_positions(text: str) -> list[int]:
+    """Return the sorted Python indices of all characters outside the BMP."""
+    if text.isascii():
+        return []
+    return [m.start() for m in _ASTRAL_RE.finditer(text)]
+
+
+class Utf16Index:
+    """Two-way mapping between Python str indices and UTF-16 offsets of one text.
+
+    Stores only the astral character positions, so BMP-only text costs
+    nothing beyond an ``isascii()``/regex scan and lookups are O(log astral).
+    """
+
+    __slots__ = ("_astral", "_astral_utf16", "_utf16_len")
+
+    def __init__(self, text: str) -> None:
+        self._set_astral(astral_positions(text), len(text))
+
+    @classmethod
+    def from_astral(cls, astral: list[int], py_len: int) -> Utf16Index:
+        """Build from already known astral positions of a text of length *py_len*."""
+        index = cls.__new__(cls)
+        index._set_astral(astral, py_len)
+        return index
+
+    def _set_astral(self, astral: list[int], py_len: int) -> None:
+        self._astral = astral
+        self._astral_utf16 = [pos + k for k, pos in enumerate(astral)]
+        self._utf16_len = py_len + len(astral)
+
+    @property
+    def utf16_len(self) -> int:
+        return self._utf16_len
+
+    @property
+    def is_bmp(self) -> bool:
+        """True when Python indices and UTF-16 offsets coincide."""
+        return not self._astral
+
+    def py_to_utf16(self, py_index: int) -> int:
+        """UTF-16 offset of text[py_index] (``len(text)`` maps to the total length)."""
+        if not self._astral:
+            return py_index
+        return py_index + bisect_left(self._astral, py_index)
+
+    def utf16_to_py(self, offset: int) -> int | None:
+        """Python index at UTF-16 *offset*.
+
+        Returns None when *offset* is out of range or falls between the two
+        halves of a surrogate pair.
+        """
+        if offset < 0 or offset > self._utf16_len:
+            return None
+        if not self._astral:
+            return offset
+        # Astral characters starting strictly before offset
+        before = bisect_left(self._astral_utf16, offset)
+        if before and self._astral_utf16[before - 1] + 1 == offset:
+            return None
+        return offset - before
+
+    def utf16_to_py_floor(self, offset: int) -> int:
+        """Largest Python index whose UTF-16 offset is <= *offset* (clamped to the text).
+
+        An offset between the halves of a surrogate pair maps to the astral
+        character itself.
+        """
+        if offset <= 0:
+            return 0
+        if offset >= self._utf16_len:
+            return self._utf16_len - len(self._astral)
+        if not self._astral:
+            return offset
+        return offset - bisect_left(self._astral_utf16, offset)
+
+    def slice(self, py_start: int, py_end: int) -> Utf16Index:
+        """Index of text[py_start:py_end], without rescanning the text."""
+        if not self._astral:
+            return Utf16Index.from_astral([], py_end - py_start)
+        lo = bisect_left(self._astral, py_start)
+        hi = bisect_left(self._astral, py_end)
+        return Utf16Index.from_astral(
+            [pos - py_start for pos in self._astral[lo:hi]], py_end - py_start
+        )
@@ -5,7 +5,7 @@ In the entity-based approach, the text sent to Telegram is plain text
 So counting is simply the UTF-16 length of the text.
 """
 
-from telegramify_markdown.entity import utf16_len
+from telegramify_markdown.utf16 import utf16_len
 
 
 def count_text(text: str) -> int:
@@ -0,0 +1,97 @@
+import pathlib
+import unittest
+
+from telegramify_markdown.batch import ConversionPool, convert_many, telegramify_many
+from telegramify_markdown.config import get_runtime_config
+from telegramify_markdown.converter import convert, convert_with_segments
+from telegramify_markdown.pipeline import process_markdown
+
+DOCUMENTS = [
+    f"# Doc {i}\n\n**bold {i}** and `code`\n\n- item\n- \\(\\alpha_{i}\\)\n" for i in range(25)
+]
+
+
+class ConvertManyTest(unittest.TestCase):
+    def test_matches_convert_in_order(self):
+        expected = [convert(md) for md in DOCUMENTS]
+        self.assertEqual(convert_many(DOCUMENTS, workers=2, chunksize=4), expected)
+
+    def test_single_worker_runs_inline(self):
+        expected = [convert(md, latex_escape=False) for md in DOCUMENTS]
+        self.assertEqual(convert_many(iter(DOCUMENTS), workers=1, latex_escape=False), expected)
+
+    def test_empty_input(self):
+        self.assertEqual(convert_many([], workers=2), [])
+
+    def test_workers_follow_runtime_config(self):
+        cfg = get_runtime_config()
+        saved = cfg.markdown_symbol.heading_level_1
+        try:
+            with ConversionPool(workers=2, chunksize=1) as pool:
+                cfg.markdown_symbol.heading_level_1 = ""
+                results = pool.convert_many(["# Title", "# Other"])
+            self.assertEqual([text for text, _ in results], ["Title", "Other"])
+        finally:
+            cfg.markdown_symbol.heading_level_1 = saved
+
+    def test_invalid_chunksize(self):
+        with self.assertRaises(ValueError):
+            ConversionPool(workers=1, chunksize=0)
+
+
+class ParallelConvertTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ConversionPool(workers=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_sample_documents_match_serial(self):
+        tests_dir = pathlib.Path(__file__).parent
+        markdown = "\n\n".join(
+            (tests_dir / name).read_text(encoding="utf-8") for name in ("exp1.md", "exp2.md")
+        )
+        for piece_size in (1, 500, 4000):
+            with self.subTest(piece_size=piece_size):
+                self.assertEqual(
+                    self.pool.convert_with_segments(markdown, piece_size=piece_size),
+                    convert_with_segments(markdown),
+                )
+
+    def test_block_spacing_and_offsets_across_cuts(self):
+        markdown = (
+            "# Title 😀\n\n\n- a\n- b\n"
+            "```python\n\ncode\n```\n"
+            "> " + "quoted " * 40 + "\n\n"
+            "---\n"
+            "| a | b |\n|---|---|\n| 1 | 😀 |\n\n"
+            "<div>\nhtml\n</div>\n\n"
+            "**end** \\(\\alpha\\)"
+        )
+        for latex_escape in (True, False):
+            with self.subTest(latex_escape=latex_escape):
+                self.assertEqual(
+                    self.pool.convert(markdown, latex_escape=latex_escape, piece_size=1),
+                    convert(markdown, latex_escape=latex_escape),
+                )
+
+    def test_link_references_are_not_split(self):
+        markdown = "See [docs][ref].\n\nMore text.\n\n[ref]: https://example.com\n"
+        self.assertEqual(self.pool.convert(markdown, piece_size=1), convert(markdown))
+
+
+class TelegramifyManyTest(unittest.IsolatedAsyncioTestCase):
+    async def test_matches_process_markdown_in_order(self):
+        docs = DOCUMENTS[:6] + ["Text\n\n```python\nprint(1)\n```"]
+        expected = [await process_markdown(md) for md in docs]
+        results = await telegramify_many(docs, workers=2, chunksize=3)
+        self.assertEqual(len(results), len(expected))
+        for got, want in zip(results, expected):
+            self.assertEqual([type(item) for item in got], [type(item) for item in want])
+            self.assertEqual(got, want)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from unittest import mock
+
+from telegramify_markdown.cache import ConversionCache
+from telegramify_markdown.config import get_runtime_config
+from telegramify_markdown.content import MediaGroup, Text
+from telegramify_markdown.converter import convert
+from telegramify_markdown.entity import MessageEntity
+
+
+class ConversionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cfg = get_runtime_config()
+        self._saved_h1 = self.cfg.markdown_symbol.heading_level_1
+
+    def tearDown(self):
+        self.cfg.markdown_symbol.heading_level_1 = self._saved_h1
+
+    def test_matches_convert(self):
+        cache = ConversionCache()
+        md = "# Title\n\n**bold** and `code`"
+        text, entities = cache.convert(md)
+        expected_text, expected_entities = convert(md)
+        self.assertEqual(text, expected_text)
+        self.assertEqual(list(entities), expected_entities)
+        self.assertIsInstance(entities, tuple)
+
+    def test_hit_returns_equal_result(self):
+        cache = ConversionCache()
+        first = cache.convert("**bold**")
+        second = cache.convert("**bold**")
+        self.assertEqual(first, second)
+        stats = cache.stats
+        self.assertEqual((stats.hits, stats.misses, stats.size), (1, 1, 1))
+
+    def test_mutating_result_does_not_affect_cache(self):
+        cache = ConversionCache()
+        _, first = cache.convert("a **bold** word")
+        first[0].offset = 0
+        first[0].type = "italic"
+        _, second = cache.convert("a **bold** word")
+        second[0].length = 1
+        _, third = cache.convert("a **bold** word")
+        self.assertEqual(third, (MessageEntity(type="bold", offset=2, length=4),))
+
+    def test_options_are_part_of_key(self):
+        cache = ConversionCache()
+        md = r"\(\alpha\)"
+        escaped = cache.convert(md)
+        raw = cache.convert(md, latex_escape=False)
+        self.assertNotEqual(escaped[0], raw[0])
+        self.assertEqual(cache.stats.misses, 2)
+
+    def test_config_change_invalidates(self):
+        cache = ConversionCache()
+        self.cfg.markdown_symbol.heading_level_1 = "#"
+        text, _ = cache.convert("# Title")
+        self.assertTrue(text.startswith("#"))
+        self.cfg.markdown_symbol.heading_level_1 = ""
+        text, _ = cache.convert("# Title")
+        self.assertEqual(text, "Title")
+        self.assertEqual(cache.stats.hits, 0)
+
+    def test_lru_eviction(self):
+        cache = ConversionCache(maxsize=2)
+        cache.convert("a")
+        cache.convert("b")
+        cache.convert("a")  # "b" is now least recently used
+        cache.convert("c")
+        self.assertEqual(cache.stats.evictions, 1)
+        cache.convert("a")
+        self.assertEqual(cache.stats.hits, 2)
+        cache.convert("b")
+        self.assertEqual(cache.stats.misses, 4)
+
+    def test_clear(self):
+        cache = ConversionCache()
+        cache.convert("a")
+        cache.clear()
+        self.assertEqual(cache.stats.size, 0)
+        cache.convert("a")
+        self.assertEqual(cache.stats.misses, 2)
+
+    def test_invalid_maxsize(self):
+        with self.assertRaises(ValueError):
+            ConversionCache(maxsize=0)
+
+
+class ConversionCacheTelegramifyTest(unittest.IsolatedAsyncioTestCase):
+    async def test_telegramify_cached(self):
+        cache = ConversionCache()
+        md = "Hello **world**"
+        first = await cache.telegramify(md)
+        second = await cache.telegramify(md)
+        self.assertEqual(first, second)
+        self.assertIsInstance(first[0], Text)
+        self.assertEqual(cache.stats.hits, 1)
+
+    async def test_mutating_result_does_not_affect_cache(self):
+        cache = ConversionCache()
+        md = "Hello **world**"
+        first = await cache.telegramify(md)
+        first[0].text = "changed"
+        first[0].entities[0].offset = 0
+        second = await cache.telegramify(md)
+        second[0].entities.clear()
+        third = await cache.telegramify(md)
+        self.assertEqual(third[0].text, "Hello world")
+        self.assertEqual(third[0].entities, [MessageEntity(type="bold", offset=6, length=5)])
+
+    async def test_telegramify_options_are_part_of_key(self):
+        cache = ConversionCache()
+        md = "Text\n\n```python\nprint(1)\n```"
+        with_file = await cache.telegramify(md)
+        inline = await cache.telegramify(md, min_file_lines=0)
+        self.assertNotEqual(len(with_file), len(inline))
+        self.assertEqual(cache.stats.hits, 0)
+
+    async def test_failed_mermaid_in_media_group_not_cached(self):
+        cache = ConversionCache()
+        md = "```mermaid\ngraph TD\nA-->B\n```\n\n```mermaid\ngraph TD\nB-->C\n```"
+        with mock.patch("telegramify_markdown.mermaid.support_mermaid", return_value=False):
+            first = await cache.telegramify(md, media_groups=True)
+            await cache.telegramify(md, media_groups=True)
+        self.assertIsInstance(first[0], MediaGroup)
+        self.assertEqual(cache.stats.hits, 0)
+        self.assertEqual(cache.stats.size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
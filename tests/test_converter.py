@@ -1,7 +1,27 @@
+import pathlib
+import pickle
+import re
 import unittest
 
-from telegramify_markdown.converter import convert, convert_with_segments
+import pyromark
+
+from telegramify_markdown.config import RenderProfile, get_runtime_config
+from telegramify_markdown.converter import (
+    EventWalker,
+    StreamingConverter,
+    _TextBuilder,
+    _contains_latex_symbols,
+    _preprocess,
+    _scan_source,
+    _trie_pattern,
+    convert,
+    convert_with_index,
+    convert_with_segments,
+)
 from telegramify_markdown.entity import MessageEntity, utf16_len
+from telegramify_markdown.latex_escape.const import LATEX_STYLES, LATEX_SYMBOLS, NOT_MAP
+
+TESTS_DIR = pathlib.Path(__file__).parent
 
 
 def _find_entity(entities: list[MessageEntity], etype: str) -> MessageEntity | None:
@@ -255,6 +275,54 @@ class SpoilerTest(unittest.TestCase):
         self.assertIsNone(spoiler)
 
 
+class PreprocessTest(unittest.TestCase):
+    def test_latex_not_rewritten_in_code_fence(self):
+        md = "```latex\n\\(\\alpha + \\beta\\)\n```"
+        text, _ = convert(md)
+        self.assertIn("\\(\\alpha + \\beta\\)", text)
+
+    def test_latex_not_rewritten_in_inline_code(self):
+        text, _ = convert("use `\\(\\alpha\\)` here")
+        self.assertIn("\\(\\alpha\\)", text)
+
+    def test_latex_and_spoiler_outside_code(self):
+        md = "||\\(\\alpha^2\\)|| and `||x||`"
+        text, entities = convert(md)
+        self.assertIn("α", text)
+        self.assertIn("||x||", text)
+        self.assertEqual(len(_find_entities(entities, "spoiler")), 1)
+
+    def test_preprocess_skips_code(self):
+        md = "a ||b|| `||c||` \\(\\alpha\\)\n\n```\n\\(\\alpha\\) ||d||\n```\n"
+        self.assertEqual(
+            _preprocess(md),
+            "a <tg-spoiler>b</tg-spoiler> `||c||` $α$\n\n```\n\\(\\alpha\\) ||d||\n```\n",
+        )
+
+    def test_preprocess_skips_tilde_and_long_fences(self):
+        md = "~~~\n\\(\\alpha\\)\n~~~\n\n````\n```\n||d||\n````\n"
+        self.assertEqual(_preprocess(md), md)
+
+    def test_preprocess_skips_indented_code(self):
+        md = "text\n\n    \\(\\alpha\\) ||d||\n\nafter ||e||"
+        self.assertEqual(
+            _preprocess(md),
+            "text\n\n    \\(\\alpha\\) ||d||\n\nafter <tg-spoiler>e</tg-spoiler>",
+        )
+
+    def test_preprocess_rewrites_list_continuation(self):
+        # Less than four columns past the list item's content: not a code block
+        self.assertEqual(
+            _preprocess("- item\n\n    ||d||"),
+            "- item\n\n    <tg-spoiler>d</tg-spoiler>",
+        )
+
+    def test_scan_reports_changed_ranges(self):
+        text, changes, _ = _scan_source("a ||b|| `||c||`")
+        self.assertEqual(text, "a <tg-spoiler>b</tg-spoiler> `||c||`")
+        self.assertEqual(changes, [(2, 7, 2, 28)])
+
+
 class RuleTest(unittest.TestCase):
     def test_horizontal_rule(self):
         text, entities = convert("above\n\n---\n\nbelow", latex_escape=False)
@@ -674,6 +742,31 @@ class LatexConverterTest(unittest.TestCase):
         self.assertIn("½", text)
 
 
+class LatexSymbolDetectorTest(unittest.TestCase):
+    def _brute_force(self, content: str) -> bool:
+        keys = (
+            (r"\frac", r"\sqrt", r"\begin")
+            + tuple(LATEX_SYMBOLS) + tuple(NOT_MAP) + tuple(LATEX_STYLES)
+        )
+        return len(content) >= 5 and any(key in content for key in keys)
+
+    def test_matches_every_key(self):
+        for key in list(LATEX_SYMBOLS) + list(NOT_MAP) + list(LATEX_STYLES):
+            with self.subTest(key=key):
+                self.assertTrue(_contains_latex_symbols(f"ab{key}cd"))
+
+    def test_agrees_with_substring_search(self):
+        for content in ("plain words", "x^2 + y^2", "E mc^2", "abcd", r"\alpha", "a ≤ b c", "ab~cd"):
+            with self.subTest(content=content):
+                self.assertEqual(_contains_latex_symbols(content), self._brute_force(content))
+
+    def test_trie_pattern(self):
+        pattern = re.compile(_trie_pattern(["abc", "abd", "x", "y"]))
+        self.assertTrue(pattern.search("--abd--"))
+        self.assertTrue(pattern.search("y"))
+        self.assertIsNone(pattern.search("ab ac"))
+
+
 class ComplexDocumentTest(unittest.TestCase):
     def test_mixed_content(self):
         md = """# Hello World
@@ -739,5 +832,200 @@ class TaskListMarkerTest(unittest.TestCase):
         self.assertIn("✅", text)
 
 
+class RenderProfileTest(unittest.TestCase):
+    def test_default_profile_matches_runtime_config(self):
+        md = "# H1\n\n##### H5\n\n- [x] done\n- [ ] todo\n\n![img](http://x)\n\n> " + "q" * 250
+        self.assertEqual(convert(md, config=RenderProfile()), convert(md))
+
+    def test_hashable_and_comparable(self):
+        a = RenderProfile(heading_symbols=("#",) * 6)
+        b = RenderProfile(heading_symbols=["#"] * 6)
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertNotEqual(a, RenderProfile())
+        with self.assertRaises(AttributeError):
+            a.image = "x"
+
+    def test_custom_profile_leaves_runtime_config_alone(self):
+        plain = RenderProfile(
+            heading_symbols=("",) * 6, task_completed="[x]", task_uncompleted="[ ]"
+        )
+        text, _ = convert("# Title\n\n- [x] a\n- [ ] b", config=plain)
+        self.assertEqual(text.rstrip(), "Title\n\n[x] a\n[ ] b")
+        text, _ = convert("# Title")
+        self.assertTrue(text.startswith(get_runtime_config().markdown_symbol.heading_level_1))
+
+    def test_expandable_threshold(self):
+        md = "> " + "q" * 50
+        short = RenderProfile(expandable_length=10)
+        _, entities = convert(md, config=short)
+        self.assertEqual(entities[0].type, "expandable_blockquote")
+        _, entities = convert(md, config=RenderProfile(expandable_length=10, cite_expandable=False))
+        self.assertEqual(entities[0].type, "blockquote")
+
+    def test_expandable_upgrade_leaves_walker_entities_alone(self):
+        # Streaming checkpoints keep the walker's entities; the upgrade must copy
+        md = "> " + "q" * 50
+        walker = EventWalker(RenderProfile(expandable_length=10), md)
+        _, entities, _ = walker.walk(pyromark.events_with_range(md))
+        self.assertEqual(entities[0].type, "expandable_blockquote")
+        self.assertEqual(walker._entities[0].type, "blockquote")
+
+    def test_from_config_snapshot(self):
+        cfg = get_runtime_config()
+        saved = cfg.markdown_symbol.heading_level_2
+        try:
+            cfg.markdown_symbol.heading_level_2 = "##"
+            profile = RenderProfile.from_config()
+        finally:
+            cfg.markdown_symbol.heading_level_2 = saved
+        self.assertEqual(profile.heading_prefixes["H2"], "## ")
+        self.assertIs(RenderProfile.from_config(profile), profile)
+
+    def test_heading_prefixes_read_only(self):
+        profile = RenderProfile(heading_symbols=("#", "##", "", "", "", ""))
+        with self.assertRaises(TypeError):
+            profile.heading_prefixes["H1"] = "!"
+        self.assertEqual(profile.heading_prefixes["H1"], "# ")
+
+    def test_pickle_round_trip(self):
+        profile = RenderProfile(heading_symbols=("#", "##", "", "", "", ""), mermaid_scale=3)
+        restored = pickle.loads(pickle.dumps(profile))
+        self.assertEqual(restored, profile)
+        self.assertEqual(restored.heading_prefixes["H2"], "## ")
+
+    def test_wrong_heading_count(self):
+        with self.assertRaises(ValueError):
+            RenderProfile(heading_symbols=("#",))
+
+
+class EventDispatchTest(unittest.TestCase):
+    def test_register_handler_on_subclass(self):
+        class ShoutingWalker(EventWalker):
+            pass
+
+        ShoutingWalker.register_handler("Text", lambda w, p, r: w._on_text(p.upper()))
+        ShoutingWalker.register_handler("Start", None, tag="Strong")
+        walker = ShoutingWalker(get_runtime_config(), "hi **there**")
+        text, entities, _ = walker.walk(pyromark.events_with_range("hi **there**"))
+        self.assertEqual(text, "HI THERE")
+        # Without a Start handler the End handler finds no open bold scope
+        self.assertEqual(entities, [])
+        # The base class table is untouched
+        self.assertEqual(convert("hi **there**")[0], "hi there")
+
+    def test_subclass_override_is_dispatched(self):
+        class ShoutingWalker(EventWalker):
+            def _on_text(self, text, source_range=None):
+                super()._on_text(text.upper(), source_range)
+
+        class QuietStrongWalker(ShoutingWalker):
+            pass
+
+        QuietStrongWalker.register_handler("Start", None, tag="Strong")
+
+        class SubWalker(QuietStrongWalker):
+            pass
+
+        walker = ShoutingWalker(get_runtime_config(), "hi **there**")
+        text, entities, _ = walker.walk(pyromark.events_with_range("hi **there**"))
+        self.assertEqual(text, "HI THERE")
+        self.assertEqual([e.type for e in entities], ["bold"])
+        # Registrations are inherited along with the overrides
+        walker = SubWalker(get_runtime_config(), "hi **there**")
+        text, entities, _ = walker.walk(pyromark.events_with_range("hi **there**"))
+        self.assertEqual(text, "HI THERE")
+        self.assertEqual(entities, [])
+
+    def test_unknown_events_are_ignored(self):
+        walker = EventWalker(get_runtime_config(), "")
+        walker._handle_event({"Start": "NotAThing"})
+        walker._handle_event({"NotAThing": "x"})
+        walker._handle_event("NotAThing")
+        self.assertEqual(walker.walk(()), ("", [], []))
+
+
+class TextBuilderTest(unittest.TestCase):
+    def test_offsets(self):
+        buf = _TextBuilder()
+        for part in ("a📌", "\n", "你好", "🇺🇸\n\n"):
+            buf.write(part)
+        text = buf.get_text()
+        self.assertEqual(buf.py_offset, len(text))
+        self.assertEqual(buf.utf16_offset, utf16_len(text))
+        self.assertEqual(buf.trailing_newline_count(), 2)
+
+    def test_trailing_newlines_across_parts(self):
+        buf = _TextBuilder()
+        buf.write("x\n")
+        buf.write("\n")
+        buf.write("")
+        self.assertEqual(buf.trailing_newline_count(), 2)
+        buf.write("y")
+        self.assertEqual(buf.trailing_newline_count(), 0)
+
+    def test_pop_last(self):
+        buf = _TextBuilder()
+        buf.write("item\n\n")
+        buf.write("📌 ")
+        self.assertEqual(buf.pop_last(), "📌 ")
+        self.assertEqual(buf.py_offset, 6)
+        self.assertEqual(buf.utf16_offset, 6)
+        self.assertEqual(buf.trailing_newline_count(), 2)
+        self.assertEqual(buf.utf16_index().utf16_len, 6)
+
+    def test_index_matches_text(self):
+        text, _, _, index = convert_with_index("# Title\n\n- 📌 a\n- b 🇺🇸\n\n`x`")
+        self.assertEqual(index.utf16_len, utf16_len(text))
+        for i in range(len(text) + 1):
+            self.assertEqual(index.py_to_utf16(i), utf16_len(text[:i]))
+
+
+class StreamingConverterTest(unittest.TestCase):
+    def _assert_stream_matches(self, md: str, chunk_size: int) -> StreamingConverter:
+        stream = StreamingConverter()
+        for i in range(0, len(md), chunk_size):
+            result = stream.feed(md[i:i + chunk_size])
+            self.assertEqual(result, convert(md[:i + chunk_size]))
+        return stream
+
+    def test_matches_one_shot_exp2(self):
+        md = (TESTS_DIR / "exp2.md").read_text(encoding="utf-8")
+        for chunk_size in (37, 500):
+            with self.subTest(chunk_size=chunk_size):
+                self._assert_stream_matches(md, chunk_size)
+
+    def test_matches_one_shot_with_link_reference(self):
+        md = (TESTS_DIR / "exp1.md").read_text(encoding="utf-8")
+        self._assert_stream_matches(md, 120)
+
+    def test_closed_blocks_are_not_reparsed(self):
+        md = "".join(f"Paragraph **{i}**\n\n" for i in range(50))
+        stream = self._assert_stream_matches(md, 16)
+        self.assertGreater(stream._committed_len, len(md) // 2)
+        # Preprocessing resumes near the end instead of rescanning everything
+        self.assertGreater(stream._scan_state.source_pos, len(md) - 32)
+
+    def test_heading_interrupt_on_partial_line(self):
+        # "a\n#" is paragraph + empty heading, "a\n#b" is a single paragraph
+        self._assert_stream_matches("intro\n\nfirst\n#b more\n\nlast", 1)
+
+    def test_spoiler_across_blocks(self):
+        self._assert_stream_matches("one\n\n||two\n\nthree\n\nfour||\n\nfive", 3)
+
+    def test_segments(self):
+        stream = StreamingConverter()
+        stream.feed("text\n\n```python\nprint(1)\n")
+        stream.feed("```\n\nafter")
+        _, _, segments = convert_with_segments(stream.source)
+        self.assertEqual(stream.segments, segments)
+
+    def test_reset(self):
+        stream = StreamingConverter()
+        stream.feed("**old**")
+        stream.reset()
+        self.assertEqual(stream.feed("new"), convert("new"))
+
+
 if __name__ == "__main__":
     unittest.main()
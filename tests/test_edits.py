@@ -0,0 +1,145 @@
+import unittest
+
+from telegramify_markdown.content import ContentTrace, File, MediaGroup, Photo, Text
+from telegramify_markdown.edits import EditOperation, diff_items, plan_edits
+from telegramify_markdown.entity import MessageEntity
+
+
+def text(value, entities=()):
+    return Text(text=value, entities=list(entities), content_trace=ContentTrace(source_type="text"))
+
+
+def file(data, caption=""):
+    return File(
+        file_name="a.py",
+        file_data=data,
+        content_trace=ContentTrace(source_type="file"),
+        caption_text=caption,
+    )
+
+
+class DiffItemsTest(unittest.TestCase):
+    def test_identical_is_empty(self):
+        items = [text("a"), file(b"x"), text("b")]
+        self.assertEqual(diff_items(items, list(items)), [])
+
+    def test_edit_only_changed_text(self):
+        old = [text("a"), text("b")]
+        new = [text("a"), text("b c")]
+        self.assertEqual(diff_items(old, new), [EditOperation("edit_text", 1, new[1])])
+
+    def test_entity_change_is_an_edit(self):
+        old = [text("ab")]
+        new = [text("ab", [MessageEntity(type="bold", offset=0, length=2)])]
+        self.assertEqual(diff_items(old, new), [EditOperation("edit_text", 0, new[0])])
+
+    def test_append(self):
+        old = [text("a")]
+        new = [text("a"), file(b"x"), text("b")]
+        self.assertEqual(
+            diff_items(old, new),
+            [EditOperation("send", 1, new[1]), EditOperation("send", 2, new[2])],
+        )
+
+    def test_caption_and_media_edits(self):
+        old = [file(b"x"), file(b"y")]
+        new = [file(b"x", caption="about x"), file(b"y2")]
+        self.assertEqual(
+            diff_items(old, new),
+            [EditOperation("edit_caption", 0, new[0]), EditOperation("edit_media", 1, new[1])],
+        )
+
+    def test_kind_change_resends_the_rest(self):
+        old = [text("a"), text("b"), text("c")]
+        new = [text("a2"), file(b"x"), text("b")]
+        self.assertEqual(
+            diff_items(old, new),
+            [
+                EditOperation("edit_text", 0, new[0]),
+                EditOperation("delete", 1),
+                EditOperation("delete", 2),
+                EditOperation("send", 1, new[1]),
+                EditOperation("send", 2, new[2]),
+            ],
+        )
+
+    def test_shrink_deletes(self):
+        old = [text("a"), text("b")]
+        self.assertEqual(diff_items(old, [text("a")]), [EditOperation("delete", 1)])
+
+    def test_changed_media_group_is_edited_per_member(self):
+        trace = ContentTrace(source_type="media_group")
+        old = [MediaGroup(items=[file(b"x"), file(b"y")], content_trace=trace), text("a")]
+        new = [MediaGroup(items=[file(b"x"), file(b"z")], content_trace=trace), text("b")]
+        # The album is messages 0 and 1, so the text after it is message 2
+        self.assertEqual(
+            diff_items(old, new),
+            [EditOperation("edit_media", 1, new[0].items[1]), EditOperation("edit_text", 2, new[1])],
+        )
+        self.assertEqual(diff_items(old, list(old)), [])
+
+    def test_resized_media_group_is_resent(self):
+        trace = ContentTrace(source_type="media_group")
+        old = [text("a"), MediaGroup(items=[file(b"x"), file(b"y")], content_trace=trace)]
+        new = [
+            text("a"),
+            MediaGroup(items=[file(b"x"), file(b"y"), file(b"z")], content_trace=trace),
+            text("b"),
+        ]
+        self.assertEqual(
+            diff_items(old, new),
+            [
+                EditOperation("delete", 1),
+                EditOperation("delete", 2),
+                EditOperation("send", 1, new[1]),
+                EditOperation("send", 4, new[2]),
+            ],
+        )
+
+    def test_photo_and_file_are_different_kinds(self):
+        photo = Photo(
+            file_name="a.py", file_data=b"x", content_trace=ContentTrace(source_type="mermaid")
+        )
+        self.assertEqual(
+            diff_items([file(b"x")], [photo]),
+            [EditOperation("delete", 0), EditOperation("send", 0, photo)],
+        )
+
+
+class PlanEditsTest(unittest.IsolatedAsyncioTestCase):
+    async def test_streamed_answer(self):
+        items, ops = await plan_edits([], "Hello")
+        self.assertEqual([op.action for op in ops], ["send"])
+
+        items, ops = await plan_edits(items, "Hello **wor")
+        self.assertEqual([op.action for op in ops], ["edit_text"])
+
+        items, ops = await plan_edits(items, "Hello **world**\n\n```python\nprint(1)\n```")
+        self.assertEqual([(op.action, op.index) for op in ops], [("edit_text", 0), ("send", 1)])
+        self.assertIsInstance(ops[1].item, File)
+
+        same, ops = await plan_edits(items, "Hello **world**\n\n```python\nprint(1)\n```")
+        self.assertEqual(ops, [])
+        self.assertEqual(same, items)
+
+    async def test_options_are_passed_on(self):
+        items, _ = await plan_edits([], "a\n\n```\nx\n```", min_file_lines=0)
+        self.assertEqual(len(items), 1)
+
+    async def test_committed_messages_do_not_reflow(self):
+        items, _ = await plan_edits([], "first line\nsecond", max_message_length=30)
+        grown = "first line\nsecond line\nthird line here"
+
+        _, ops = await plan_edits(items, grown, max_message_length=30)
+        self.assertEqual([op.action for op in ops], ["edit_text", "send"])
+
+        committed = [item.content_trace.extra["utf16_end"] for item in items]
+        self.assertEqual(committed, [17])
+        current, ops = await plan_edits(items, grown, max_message_length=30, committed=committed)
+        self.assertEqual([op.action for op in ops], ["send"])
+        self.assertEqual(current[0], items[0])
+        self.assertEqual(current[1].text, " line\nthird line here")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,16 @@
+import random
+import sys
 import unittest
 
-from telegramify_markdown.entity import MessageEntity, utf16_len, split_entities
+from telegramify_markdown.entity import (
+    EntityArray,
+    EntityIndex,
+    MessageEntity,
+    split_entities,
+    split_entity_array,
+    utf16_len,
+)
+from telegramify_markdown.utf16 import Utf16Index
 
 
 class Utf16LenTest(unittest.TestCase):
@@ -152,6 +162,269 @@ class SplitEntitiesTest(unittest.TestCase):
         for chunk_text, _ in result:
             self.assertLessEqual(utf16_len(chunk_text), 4)
 
+    def test_hard_split_respects_surrogate_pairs(self):
+        text = "a📌📌📌b"
+        result = split_entities(text, [], max_utf16_len=4)
+        self.assertEqual([chunk for chunk, _ in result], ["a📌", "📌📌", "b"])
+
+    def test_prefers_last_newline_that_fits(self):
+        text = "aa\nbb\ncc\ndd"
+        result = split_entities(text, [], max_utf16_len=7)
+        self.assertEqual([chunk for chunk, _ in result], ["aa\nbb\n", "cc\ndd"])
+
+    def test_unknown_packing(self):
+        with self.assertRaises(ValueError):
+            split_entities("a\nb", [], 1, packing="best")
+
+    def test_reuses_utf16_index(self):
+        text = "📌a\n📌b\n📌c"
+        entities = [MessageEntity(type="bold", offset=3, length=5)]
+        self.assertEqual(
+            split_entities(text, entities, 6, utf16_index=Utf16Index(text)),
+            split_entities(text, entities, 6),
+        )
+
+
+class OptimalPackingTest(unittest.TestCase):
+    def test_prefers_sentence_over_hard_break(self):
+        text = "Alpha beta. Gamma delta epsilon."
+        greedy = split_entities(text, [], 20)
+        optimal = split_entities(text, [], 20, packing="optimal")
+        self.assertEqual(len(optimal), len(greedy))
+        self.assertEqual([chunk for chunk, _ in optimal], ["Alpha beta. ", "Gamma delta epsilon."])
+
+    def test_avoids_cutting_pre(self):
+        text = "Intro paragraph here.\n\nline one\nline two\nline three\n\nTail text."
+        entities = [MessageEntity(type="pre", offset=23, length=28, language="python")]
+        greedy = split_entities(text, entities, 45)
+        optimal = split_entities(text, entities, 45, packing="optimal")
+        self.assertEqual(len(greedy[0][1]) + len(greedy[1][1]), 2)  # greedy cuts the pre
+        self.assertEqual(len(optimal), 2)
+        self.assertEqual(optimal[0], ("Intro paragraph here.\n\n", []))
+        self.assertEqual(optimal[1][1], [MessageEntity(type="pre", offset=0, length=28, language="python")])
+
+    def test_never_more_chunks_than_greedy(self):
+        rng = random.Random(11)
+        for _ in range(500):
+            text = "".join(rng.choice("ab. \n📌") for _ in range(rng.randrange(1, 100)))
+            limit = rng.randrange(2, 25)
+            greedy = split_entities(text, [], limit)
+            optimal = split_entities(text, [], limit, packing="optimal")
+            self.assertEqual("".join(chunk for chunk, _ in optimal), text)
+            self.assertLessEqual(len(optimal), len(greedy))
+            for chunk, _ in optimal:
+                self.assertLessEqual(utf16_len(chunk), limit)
+
+    def test_single_wide_character(self):
+        result = split_entities("📌📌", [], 1, packing="optimal")
+        self.assertEqual([chunk for chunk, _ in result], ["📌", "📌"])
+
+
+class EntityLimitTest(unittest.TestCase):
+    def _bold_words(self, count):
+        text = " ".join("w" for _ in range(count))
+        entities = [MessageEntity(type="bold", offset=2 * i, length=1) for i in range(count)]
+        return text, entities
+
+    def test_splits_on_entity_count(self):
+        text, entities = self._bold_words(250)
+        chunks = split_entities(text, entities, 4096, max_entities_per_message=100)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual("".join(chunk for chunk, _ in chunks), text)
+        self.assertEqual([len(chunk_entities) for _, chunk_entities in chunks], [100, 100, 50])
+
+    def test_prefers_newline_within_entity_limit(self):
+        text = "\n".join("w w" for _ in range(60))
+        entities = [MessageEntity(type="bold", offset=4 * i, length=1) for i in range(60)]
+        entities += [MessageEntity(type="italic", offset=4 * i + 2, length=1) for i in range(60)]
+        chunks = split_entities(text, entities, 4096, max_entities_per_message=100)
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[0][0].endswith("\n"))
+        self.assertLessEqual(len(chunks[0][1]), 100)
+
+    def test_clipped_entity_counts_in_both_chunks(self):
+        text = "abcdef"
+        entities = [
+            MessageEntity(type="italic", offset=0, length=6),
+            MessageEntity(type="bold", offset=1, length=1),
+            MessageEntity(type="bold", offset=3, length=1),
+        ]
+        chunks = split_entities(text, entities, 100, max_entities_per_message=2)
+        self.assertEqual([chunk for chunk, _ in chunks], ["abc", "def"])
+        self.assertEqual([len(chunk_entities) for _, chunk_entities in chunks], [2, 2])
+
+    def test_optimal_respects_entity_limit(self):
+        text, entities = self._bold_words(250)
+        chunks = split_entities(
+            text, entities, 4096, packing="optimal", max_entities_per_message=100
+        )
+        self.assertEqual(len(chunks), 3)
+        for _, chunk_entities in chunks:
+            self.assertLessEqual(len(chunk_entities), 100)
+
+    def test_limit_disabled(self):
+        text, entities = self._bold_words(250)
+        self.assertEqual(
+            split_entities(text, entities, 4096, max_entities_per_message=None),
+            [(text, entities)],
+        )
+
+    def test_no_limit_by_default(self):
+        text, entities = self._bold_words(250)
+        self.assertEqual(split_entities(text, entities, 4096), [(text, entities)])
+
+    def test_invalid_limit(self):
+        text, entities = self._bold_words(3)
+        with self.assertRaises(ValueError):
+            split_entities(text, entities, 4096, max_entities_per_message=0)
+
+
+class CommittedSplitTest(unittest.TestCase):
+    TEXT = "aaaa\nbbbb\ncccc\ndddd\n"
+
+    def test_committed_chunks_are_kept(self):
+        self.assertEqual(
+            [chunk for chunk, _ in split_entities(self.TEXT, [], 10)],
+            ["aaaa\nbbbb\n", "cccc\ndddd\n"],
+        )
+        chunks = split_entities(self.TEXT + "ee\n", [], 10, committed=[5])
+        self.assertEqual([chunk for chunk, _ in chunks], ["aaaa\n", "bbbb\ncccc\n", "dddd\nee\n"])
+
+    def test_tail_split_matches_plain_split(self):
+        rng = random.Random(3)
+        for _ in range(200):
+            text = "".join(rng.choice("ab \n📌") for _ in range(rng.randrange(5, 80)))
+            entities = [MessageEntity(type="bold", offset=0, length=utf16_len(text))]
+            plain = split_entities(text, entities, 12)
+            boundary = utf16_len("".join(chunk for chunk, _ in plain[:1]))
+            chunks = split_entities(text, entities, 12, committed=[boundary])
+            self.assertEqual(chunks, plain)
+
+    def test_entity_across_boundary_is_clipped(self):
+        entities = [MessageEntity(type="bold", offset=3, length=4)]
+        chunks = split_entities(self.TEXT, entities, 100, committed=[5])
+        self.assertEqual(chunks[0][1], [MessageEntity(type="bold", offset=3, length=2)])
+        self.assertEqual(chunks[1][1], [MessageEntity(type="bold", offset=0, length=2)])
+
+    def test_everything_committed(self):
+        chunks = split_entities(self.TEXT, [], 10, committed=[5, 20])
+        self.assertEqual([chunk for chunk, _ in chunks], ["aaaa\n", self.TEXT[5:]])
+
+    def test_invalid_boundaries(self):
+        for committed in ([5, 5], [0], [21], [3, 2]):
+            with self.subTest(committed=committed), self.assertRaises(ValueError):
+                split_entities(self.TEXT, [], 10, committed=committed)
+        with self.assertRaises(ValueError):
+            split_entities("a📌b", [], 10, committed=[2])
+
+
+class EntityArrayTest(unittest.TestCase):
+    ENTITIES = [
+        MessageEntity(type="bold", offset=0, length=5),
+        MessageEntity(type="text_link", offset=3, length=4, url="https://a"),
+        MessageEntity(type="pre", offset=8, length=6, language="python"),
+        MessageEntity(type="text_link", offset=10, length=2, url="https://a"),
+        MessageEntity(type="custom_emoji", offset=12, length=2, custom_emoji_id="42"),
+        MessageEntity(type="my_custom_type", offset=14, length=0),
+    ]
+
+    def test_round_trip(self):
+        array = EntityArray(self.ENTITIES)
+        self.assertEqual(len(array), len(self.ENTITIES))
+        self.assertEqual(array.to_list(), self.ENTITIES)
+        self.assertEqual(array[1], self.ENTITIES[1])
+        self.assertEqual(array[-1], self.ENTITIES[-1])
+        self.assertEqual(array[1:3], self.ENTITIES[1:3])
+        self.assertEqual(array, EntityArray(self.ENTITIES))
+
+    def test_views_are_fresh_objects(self):
+        array = EntityArray(self.ENTITIES)
+        array[0].offset = 99
+        self.assertEqual(array[0].offset, 0)
+
+    def test_clip_matches_manual_clipping(self):
+        array = EntityArray(self.ENTITIES)
+        for start in range(0, 16):
+            for end in range(start, 17):
+                expected = []
+                for ent in self.ENTITIES:
+                    lo = max(ent.offset, start)
+                    hi = min(ent.offset + ent.length, end)
+                    if hi > lo:
+                        expected.append(
+                            MessageEntity(
+                                ent.type, lo - start, hi - lo,
+                                ent.url, ent.language, ent.custom_emoji_id,
+                            )
+                        )
+                self.assertEqual(array.clip(start, end).to_list(), expected, (start, end))
+
+    def test_shift(self):
+        shifted = EntityArray(self.ENTITIES).shift(10)
+        self.assertEqual([e.offset for e in shifted], [e.offset + 10 for e in self.ENTITIES])
+
+    def test_derived_arrays_share_tables(self):
+        array = EntityArray(self.ENTITIES)
+        self.assertIs(array.clip(2, 12)._extra_table, array._extra_table)
+
+    def test_memory_per_entity(self):
+        entities = [
+            MessageEntity(type="bold", offset=i * 3, length=2) for i in range(10000)
+        ]
+        array = EntityArray(entities)
+        objects = sys.getsizeof(entities) + sum(sys.getsizeof(e) for e in entities)
+        packed = sum(
+            sys.getsizeof(column)
+            for column in (array._types, array._offsets, array._lengths, array._extras)
+        )
+        self.assertLess(packed * 4, objects)
+
+    def test_split_entity_array_matches_split_entities(self):
+        text = "📌 bold line\nsecond line here\nthird"
+        entities = [
+            MessageEntity(type="bold", offset=0, length=12),
+            MessageEntity(type="italic", offset=5, length=20),
+        ]
+        chunks = split_entity_array(text, EntityArray(entities), 12)
+        self.assertEqual(
+            [(t, e.to_list()) for t, e in chunks], split_entities(text, entities, 12)
+        )
+
+
+class EntityIndexTest(unittest.TestCase):
+    def test_matches_linear_scan(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            starts = [rng.randrange(100) for _ in range(rng.randrange(40))]
+            ends = [start + rng.randrange(30) for start in starts]
+            index = EntityIndex(starts, ends)
+            for _ in range(20):
+                a = rng.randrange(-5, 130)
+                b = a + rng.randrange(40)
+                expected = [
+                    i for i in range(len(starts))
+                    if starts[i] < b and ends[i] > a and ends[i] > starts[i] and a < b
+                ]
+                self.assertEqual(index.overlapping(a, b), expected)
+
+    def test_containing(self):
+        index = EntityIndex([0, 2, 5], [10, 4, 5])
+        self.assertEqual(index.containing(3), [0, 1])
+        self.assertEqual(index.containing(4), [0])
+        self.assertEqual(index.containing(5), [0])  # empty range never matches
+        self.assertEqual(index.containing(10), [])
+
+    def test_clip_with_index(self):
+        entities = EntityArray(EntityArrayTest.ENTITIES)
+        index = EntityIndex.from_entities(entities)
+        self.assertIsInstance(index, EntityIndex)
+        for start, end in ((0, 4), (3, 11), (9, 20), (14, 15)):
+            self.assertEqual(entities.clip(start, end, index=index), entities.clip(start, end))
+
+    def test_from_entity_list(self):
+        index = EntityIndex.from_entities(EntityArrayTest.ENTITIES)
+        self.assertEqual(index.overlapping(9, 11), [2, 3])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -5,10 +5,15 @@ import unittest
 
 from telegramify_markdown.entity import MessageEntity, utf16_len
 from telegramify_markdown.mdv2 import (
+    _MDV2_ESCAPES,
+    _RenderedLength,
+    _count_escapes,
     _escape_code,
+    _escape_counted,
     _escape_markdownv2,
     _escape_url,
     entities_to_markdownv2,
+    markdownv2_length,
     split_markdownv2,
 )
 
@@ -33,6 +38,19 @@ class EscapeMarkdownV2Test(unittest.TestCase):
     def test_mixed(self):
         self.assertEqual(_escape_markdownv2("a*b"), "a\\*b")
 
+    def test_backslash_escaped_once(self):
+        """反斜杠先替换，后插入的反斜杠不会被再次转义"""
+        self.assertEqual(_escape_markdownv2("\\.*"), "\\\\\\.\\*")
+
+    def test_escape_count(self):
+        text = "a.b! (c) \\ 😀"
+        escaped, count = _escape_counted(text, _MDV2_ESCAPES)
+        self.assertEqual(escaped, _escape_markdownv2(text))
+        self.assertEqual(count, 5)
+        self.assertEqual(count, utf16_len(escaped) - utf16_len(text))
+        self.assertEqual(_count_escapes(text, _MDV2_ESCAPES), 5)
+        self.assertEqual(_count_escapes(text, _MDV2_ESCAPES, 0, 3), 1)
+
 
 class EscapeCodeTest(unittest.TestCase):
     def test_escape_code(self):
@@ -172,6 +190,26 @@ class BlockquoteTest(unittest.TestCase):
         result = entities_to_markdownv2(text, entities)
         self.assertEqual(result, ">line1\n>line2\n>line3")
 
+    def test_many_blockquotes(self):
+        """交替的引用行与普通行：每行只在自己的 blockquote 内加前缀"""
+        text = "\n".join(f"q{i}\nr{i}" for i in range(50))
+        entities = [
+            MessageEntity(type="blockquote", offset=text.index(f"q{i}\n"), length=len(f"q{i}"))
+            for i in range(50)
+        ]
+        result = entities_to_markdownv2(text, entities)
+        self.assertEqual(result, "\n".join(f">q{i}\nr{i}" for i in range(50)))
+
+    def test_overlapping_blockquotes(self):
+        """重叠的 blockquote 仍按第一个 entity 的类型加前缀"""
+        text = "a\nb\nc"
+        entities = [
+            MessageEntity(type="blockquote", offset=2, length=3),
+            MessageEntity(type="expandable_blockquote", offset=0, length=3),
+        ]
+        result = entities_to_markdownv2(text, entities)
+        self.assertEqual(result, "**>a\n>b\n>c")
+
 
 class ExpandableBlockquoteTest(unittest.TestCase):
     def test_expandable_blockquote(self):
@@ -281,6 +319,94 @@ class SplitMarkdownV2Test(unittest.TestCase):
         for chunk in chunks:
             self.assertLessEqual(utf16_len(chunk), 4096)
 
+    def test_split_prefers_newlines_and_keeps_text(self):
+        text = "\n".join(f"line {i}." for i in range(40))
+        entities = [MessageEntity(type="bold", offset=0, length=len(text))]
+        chunks = split_markdownv2(text, entities, max_utf16_len=60)
+        for chunk in chunks:
+            self.assertLessEqual(utf16_len(chunk), 60)
+        for chunk in chunks[:-1]:
+            self.assertTrue(chunk.endswith("\n*"))
+        plain = "".join(chunk.replace("*", "").replace("\\", "") for chunk in chunks)
+        self.assertEqual(plain, text)
+
+    def test_split_single_unit_too_long(self):
+        with self.assertRaises(ValueError):
+            entities = [MessageEntity(type="text_link", offset=0, length=1, url="https://e.io")]
+            split_markdownv2("x", entities, 5)
+
+    def test_split_respects_entity_limit(self):
+        text = " ".join("w" for _ in range(150))
+        entities = [MessageEntity(type="bold", offset=2 * i, length=1) for i in range(150)]
+        self.assertEqual(len(split_markdownv2(text, entities)), 1)
+        chunks = split_markdownv2(text, entities, max_entities_per_message=100)
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual([chunk.count("*w*") for chunk in chunks], [100, 50])
+
+
+class MarkdownV2LengthTest(unittest.TestCase):
+    def test_matches_rendered_length(self):
+        cases = [
+            ("a.b! (c)", []),
+            ("code `x` \\ y", [MessageEntity(type="code", offset=5, length=3)]),
+            (
+                "😀 link",
+                [MessageEntity(type="text_link", offset=3, length=4, url="https://x.io/a)b")],
+            ),
+            ("print(1)", [MessageEntity(type="pre", offset=0, length=8, language="python")]),
+            (
+                "quote\nline two\nafter",
+                [MessageEntity(type="expandable_blockquote", offset=0, length=14),
+                 MessageEntity(type="bold", offset=6, length=4)],
+            ),
+            ("a\nb", [MessageEntity(type="blockquote", offset=0, length=3),
+                      MessageEntity(type="pre", offset=0, length=3)]),
+        ]
+        for text, entities in cases:
+            with self.subTest(text=text):
+                self.assertEqual(
+                    markdownv2_length(text, entities),
+                    utf16_len(entities_to_markdownv2(text, entities)),
+                )
+
+    def test_matches_rendered_length_of_examples(self):
+        from telegramify_markdown import convert
+
+        for name in ("exp1.md", "exp2.md"):
+            text, entities = convert((TESTS_DIR / name).read_text(encoding="utf-8"))
+            with self.subTest(name=name):
+                self.assertEqual(
+                    markdownv2_length(text, entities),
+                    utf16_len(entities_to_markdownv2(text, entities)),
+                )
+
+    def test_empty(self):
+        self.assertEqual(markdownv2_length(""), 0)
+        self.assertEqual(markdownv2_length("a.b"), 4)
+
+    def test_piece_length_matches_rendered_piece(self):
+        from telegramify_markdown import convert
+        from telegramify_markdown.entity import EntityArray
+        from telegramify_markdown.utf16 import Utf16Index
+
+        md = (
+            "**bold `co.de` text**\n\n> quote one\n> quote two!\n\n"
+            "```py\nprint('a.b')\n```\n\n[link](https://x.io/a)b) 😀 end."
+        )
+        text, entities = convert(md)
+        entities.append(MessageEntity(type="expandable_blockquote", offset=0, length=12))
+        layout = _RenderedLength(text, entities)
+        array = EntityArray.from_entities(entities)
+        index = Utf16Index(text)
+        for start in range(len(text)):
+            for end in range(start + 1, len(text) + 1):
+                piece = array.clip(index.py_to_utf16(start), index.py_to_utf16(end)).to_list()
+                self.assertEqual(
+                    layout.piece_length(start, end),
+                    utf16_len(entities_to_markdownv2(text[start:end], piece)),
+                    (start, end),
+                )
+
 
 class EmptyTextTest(unittest.TestCase):
     def test_empty_text(self):
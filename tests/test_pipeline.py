@@ -1,7 +1,17 @@
+import asyncio
 import unittest
+from unittest import mock
 
-from telegramify_markdown.pipeline import process_markdown
-from telegramify_markdown.content import Text, File, Photo
+from telegramify_markdown import telegramify_iter
+from telegramify_markdown.entity import MessageEntity
+from telegramify_markdown.pipeline import (
+    _MediaGrouper,
+    _pack_captions,
+    iter_markdown,
+    process_markdown,
+    telegramify_sync,
+)
+from telegramify_markdown.content import ContentTrace, ContentType, MediaGroup, Text, File, Photo
 
 
 class ProcessMarkdownTest(unittest.IsolatedAsyncioTestCase):
@@ -121,6 +131,313 @@ class ProcessMarkdownTest(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(results[0].entities[0].type, "pre")
         self.assertEqual(results[0].entities[0].language, "mermaid")
 
+    async def test_entity_limit_splits_messages(self):
+        md = " ".join(f"[l{i}](https://e.com/{i})" for i in range(150))
+        results = await process_markdown(md)
+        self.assertEqual(len(results), 2)
+        for r in results:
+            self.assertLessEqual(len(r.entities), 100)
+        self.assertEqual(sum(len(r.entities) for r in results), 150)
+
+
+class CommittedBoundariesTest(unittest.IsolatedAsyncioTestCase):
+    MD = "x\n\n```py\nprint(1)\n```\n\none two three four five six seven eight nine ten"
+
+    async def test_text_items_record_their_end(self):
+        results = await process_markdown(self.MD, max_message_length=20)
+        # The converted text is "x\n\nprint(1)\n\none two ...", "one" at offset 13
+        self.assertEqual(
+            [(r.text, r.content_trace.extra["utf16_end"]) for r in results if isinstance(r, Text)],
+            [("x", 1), ("one two three four f", 33), ("ive six seven eight ", 53), ("nine ten", 61)],
+        )
+
+    async def test_committed_messages_keep_their_text(self):
+        sent = await process_markdown(self.MD[:-35], max_message_length=20)
+        self.assertEqual(sent[-1].text, "one two three")
+        committed = [r.content_trace.extra["utf16_end"] for r in sent if isinstance(r, Text)]
+        results = await process_markdown(self.MD, max_message_length=20, committed=committed)
+        self.assertEqual(
+            [r.text for r in results if isinstance(r, Text)],
+            ["x", "one two three", " four five six seven", " eight nine ten"],
+        )
+
+    async def test_all_entry_points_agree(self):
+        expected = await process_markdown(self.MD, max_message_length=20, committed=[26])
+        self.assertEqual(
+            telegramify_sync(self.MD, max_message_length=20, committed=[26]), expected
+        )
+        items = telegramify_iter(self.MD, max_message_length=20, committed=[26])
+        self.assertEqual([item async for item in items], expected)
+
+    async def test_boundaries_must_increase(self):
+        with self.assertRaises(ValueError):
+            await process_markdown(self.MD, max_message_length=20, committed=[26, 1])
+
+    async def test_boundary_outside_text_is_rejected(self):
+        # Offset 5 falls in the code block, which is sent as a file
+        with self.assertRaises(ValueError):
+            await process_markdown(self.MD, max_message_length=20, committed=[5])
+
+
+class TelegramifySyncTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            "telegramify_markdown.mermaid.support_mermaid", return_value=True
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch(
+            "telegramify_markdown.pipeline._render_mermaid_photo", self.fake_render
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def fake_render(self, seg, profile=None):
+        return Photo(
+            file_name="mermaid.png",
+            file_data=seg.raw_code.encode(),
+            content_trace=ContentTrace(source_type="mermaid"),
+        )
+
+    async def test_matches_process_markdown(self):
+        for md in (
+            "Hello **world**",
+            "first\n\n```python\nprint(1)\n```\n\nlast",
+            "```mermaid\ngraph TD\nA-->B\n```",
+            "para\n\n" * 500,
+        ):
+            for render_mermaid in (True, False):
+                with self.subTest(md=md[:20], render_mermaid=render_mermaid):
+                    self.assertEqual(
+                        telegramify_sync(md, max_message_length=300, render_mermaid=render_mermaid),
+                        await process_markdown(md, max_message_length=300, render_mermaid=render_mermaid),
+                    )
+
+    def test_without_event_loop(self):
+        with mock.patch("asyncio.run_coroutine_threadsafe") as run:
+            results = telegramify_sync(
+                "Hello **world**\n\n```mermaid\ngraph TD\nA-->B\n```", render_mermaid=False
+            )
+        run.assert_not_called()
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].entities[1].language, "mermaid")
+
+
+class CaptionPackingTest(unittest.IsolatedAsyncioTestCase):
+    MD = "Intro\n\n```python\nprint(1)\n```\n\nThis **prints** one.\n\n```python\nprint(2)\n```"
+
+    async def test_text_after_file_becomes_caption(self):
+        results = await process_markdown(self.MD, pack_captions=True)
+        self.assertEqual([type(r) for r in results], [Text, File, File])
+        self.assertEqual(results[1].caption_text, "This prints one.")
+        self.assertEqual(
+            results[1].caption_entities, [MessageEntity(type="bold", offset=5, length=6)]
+        )
+        self.assertEqual(results[2].caption_text, "")
+
+    async def test_disabled_by_default(self):
+        results = await process_markdown(self.MD)
+        self.assertEqual([type(r) for r in results], [Text, File, Text, File])
+
+    async def test_all_entry_points_agree(self):
+        expected = await process_markdown(self.MD, pack_captions=True)
+        self.assertEqual([r async for r in iter_markdown(self.MD, pack_captions=True)], expected)
+        self.assertEqual(telegramify_sync(self.MD, pack_captions=True), expected)
+
+    async def test_long_text_stays_separate(self):
+        md = "```\ncode\n```\n\n" + "word " * 300
+        results = await process_markdown(md, pack_captions=True)
+        self.assertEqual([type(r) for r in results], [File, Text])
+
+    def test_existing_caption_shifts_entities(self):
+        photo = Photo(
+            file_name="mermaid.webp",
+            file_data=b"",
+            content_trace=ContentTrace(source_type="mermaid"),
+            caption_text="Edit 📌",
+            caption_entities=[MessageEntity(type="text_link", offset=0, length=4, url="u")],
+        )
+        text = Text(
+            text="Some *x*",
+            entities=[MessageEntity(type="italic", offset=5, length=1)],
+            content_trace=ContentTrace(source_type="text"),
+        )
+        (packed,) = _pack_captions([photo, text])
+        self.assertEqual(packed.caption_text, "Edit 📌\n\nSome *x*")
+        self.assertEqual(packed.caption_entities[1], MessageEntity(type="italic", offset=14, length=1))
+        self.assertEqual(photo.caption_text, "Edit 📌")
+
+    def test_entity_limit(self):
+        file = File(file_name="a.py", file_data=b"", content_trace=ContentTrace(source_type="file"))
+        text = Text(
+            text="ab",
+            entities=[MessageEntity(type="bold", offset=0, length=1)] * 2,
+            content_trace=ContentTrace(source_type="text"),
+        )
+        self.assertEqual(_pack_captions([file, text], max_entities=1), [file, text])
+
+
+class MediaGroupTest(unittest.IsolatedAsyncioTestCase):
+    @staticmethod
+    def code_blocks(count):
+        return "\n\n".join(f"```python\nprint({i})\n```" for i in range(count))
+
+    async def test_consecutive_files_grouped(self):
+        md = "Intro\n\n" + self.code_blocks(3) + "\n\nEnd"
+        results = await process_markdown(md, media_groups=True)
+        self.assertEqual([type(r) for r in results], [Text, MediaGroup, Text])
+        group = results[1]
+        self.assertEqual(group.content_type, ContentType.MEDIA_GROUP)
+        self.assertEqual([f.file_data for f in group.items], [b"print(0)", b"print(1)", b"print(2)"])
+
+    async def test_groups_hold_at_most_ten(self):
+        results = await process_markdown(self.code_blocks(12), media_groups=True)
+        self.assertEqual([type(r) for r in results], [MediaGroup, MediaGroup])
+        self.assertEqual([len(r.items) for r in results], [10, 2])
+
+    async def test_single_file_not_grouped(self):
+        results = await process_markdown("a\n\n```\nx\n```\n\nb", media_groups=True)
+        self.assertEqual([type(r) for r in results], [Text, File, Text])
+
+    async def test_groups_keep_packed_captions(self):
+        md = "```\nx\n```\n\nFirst.\n\n```\ny\n```\n\nSecond."
+        results = await process_markdown(md, pack_captions=True, media_groups=True)
+        self.assertEqual(len(results), 1)
+        self.assertEqual([f.caption_text for f in results[0].items], ["First.", "Second."])
+        self.assertEqual(
+            [r async for r in iter_markdown(md, pack_captions=True, media_groups=True)], results
+        )
+        self.assertEqual(telegramify_sync(md, pack_captions=True, media_groups=True), results)
+
+    def test_files_and_photos_not_mixed(self):
+        trace = ContentTrace(source_type="mermaid")
+        photo = Photo(file_name="a.webp", file_data=b"", content_trace=trace)
+        file = File(file_name="a.txt", file_data=b"", content_trace=trace)
+        grouper = _MediaGrouper()
+        ready = [out for item in (photo, photo, file, photo) for out in grouper.feed(item)]
+        ready.extend(grouper.flush())
+        self.assertEqual([type(r) for r in ready], [MediaGroup, File, Photo])
+        self.assertEqual(ready[0].items, [photo, photo])
+
+
+class MermaidConcurrencyTest(unittest.IsolatedAsyncioTestCase):
+    """Mermaid diagrams render concurrently; mermaid.ink is replaced by a fake."""
+
+    DOC = "\n\n".join(
+        f"Text {i}\n\n```mermaid\ngraph TD\nA{i}-->B\n```" for i in range(4)
+    ) + "\n\nEnd"
+
+    def setUp(self):
+        self.delays = {}
+        self.finished = []
+        self.active = 0
+        self.max_active = 0
+        patcher = mock.patch(
+            "telegramify_markdown.mermaid.support_mermaid", return_value=True
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch(
+            "telegramify_markdown.pipeline._render_mermaid_photo", self.fake_render
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def fake_render(self, seg, profile=None):
+        name = seg.raw_code.split("\n")[1]
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            delay = self.delays.get(name, 0.01)
+            if delay is None:
+                raise ValueError("bad diagram")
+            await asyncio.sleep(delay)
+        finally:
+            self.active -= 1
+        self.finished.append(name)
+        return Photo(
+            file_name=name,
+            file_data=b"",
+            content_trace=ContentTrace(source_type="mermaid"),
+        )
+
+    def names(self, results):
+        return [
+            r.text if isinstance(r, Text) else (type(r).__name__, r.file_name)
+            for r in results
+        ]
+
+    async def test_document_order(self):
+        self.delays = {"A0-->B": 0.05, "A3-->B": 0}
+        results = await process_markdown(self.DOC)
+        self.assertEqual(
+            self.names(results),
+            [
+                "Text 0", ("Photo", "A0-->B"), "Text 1", ("Photo", "A1-->B"),
+                "Text 2", ("Photo", "A2-->B"), "Text 3", ("Photo", "A3-->B"), "End",
+            ],
+        )
+
+    async def test_concurrency_is_bounded(self):
+        await process_markdown(self.DOC, mermaid_concurrency=2)
+        self.assertEqual(self.max_active, 2)
+        self.max_active = 0
+        await process_markdown(self.DOC, mermaid_concurrency=1)
+        self.assertEqual(self.max_active, 1)
+
+    async def test_timeout_falls_back_to_file(self):
+        self.delays = {"A1-->B": 5}
+        results = await process_markdown(self.DOC, mermaid_timeout=0.2)
+        items = [r for r in results if not isinstance(r, Text)]
+        self.assertEqual(
+            [(type(r).__name__, r.file_name) for r in items],
+            [("Photo", "A0-->B"), ("File", "mermaid.txt"), ("Photo", "A2-->B"), ("Photo", "A3-->B")],
+        )
+        self.assertEqual(items[1].file_data, b"graph TD\nA1-->B")
+        self.assertEqual(self.active, 0)
+
+    async def test_failure_falls_back_to_file(self):
+        self.delays = {"A2-->B": None}
+        results = await process_markdown(self.DOC)
+        items = [r for r in results if not isinstance(r, Text)]
+        self.assertEqual(items[2].file_name, "invalid_mermaid.txt")
+        self.assertIsInstance(items[3], Photo)
+
+    async def test_iter_matches_process_markdown(self):
+        expected = self.names(await process_markdown(self.DOC))
+        self.assertEqual(self.names([item async for item in iter_markdown(self.DOC)]), expected)
+        self.assertEqual(self.names([item async for item in telegramify_iter(self.DOC)]), expected)
+
+    async def test_iter_yields_text_before_diagrams_render(self):
+        self.delays = {"A0-->B": 0.2}
+        items = iter_markdown(self.DOC)
+        first = await items.__anext__()
+        self.assertEqual(first.text, "Text 0")
+        self.assertEqual(self.finished, [])
+        rest = [item async for item in items]
+        self.assertEqual(self.names(rest)[0], ("Photo", "A0-->B"))
+        self.assertEqual(len(self.finished), 4)
+
+    async def test_iter_close_cancels_renders(self):
+        self.delays = {f"A{i}-->B": 5 for i in range(4)}
+        items = telegramify_iter(self.DOC)
+        async for item in items:
+            self.assertEqual(item.text, "Text 0")
+            break
+        await items.aclose()
+        self.assertEqual(self.active, 0)
+        self.assertEqual(self.finished, [])
+
+    async def test_sync_renders_on_background_loop(self):
+        self.delays = {"A1-->B": 5}
+        expected = self.names(await process_markdown(self.DOC, mermaid_timeout=0.2))
+        results = await asyncio.to_thread(telegramify_sync, self.DOC, mermaid_timeout=0.2)
+        self.assertEqual(self.names(results), expected)
+
+    async def test_invalid_concurrency(self):
+        with self.assertRaises(ValueError):
+            await process_markdown(self.DOC, mermaid_concurrency=0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+from telegramify_markdown.utf16 import Utf16Index, astral_positions, utf16_len
+
+SAMPLES = [
+    "",
+    "hello",
+    "你好世界",
+    "📌✅🔗",
+    "A📌B你好C",
+    "test 🇺🇸 flag",
+    "📌",
+    "x📌📌y\n🇺🇸",
+]
+
+
+def _reference_offsets(text: str) -> list[int]:
+    offsets = [0]
+    for ch in text:
+        offsets.append(offsets[-1] + (2 if ord(ch) > 0xFFFF else 1))
+    return offsets
+
+
+class Utf16LenTest(unittest.TestCase):
+    def test_matches_encode(self):
+        for s in SAMPLES:
+            with self.subTest(s=s):
+                self.assertEqual(utf16_len(s), len(s.encode("utf-16-le")) // 2)
+
+    def test_lone_surrogate(self):
+        self.assertEqual(utf16_len("a\ud83d"), 2)
+
+
+class AstralPositionsTest(unittest.TestCase):
+    def test_astral_positions(self):
+        self.assertEqual(astral_positions("A📌B📌"), [1, 3])
+        self.assertEqual(astral_positions("ascii"), [])
+
+
+class Utf16IndexTest(unittest.TestCase):
+    def test_round_trip(self):
+        for s in SAMPLES:
+            index = Utf16Index(s)
+            reference = _reference_offsets(s)
+            self.assertEqual(index.utf16_len, reference[-1])
+            for py_index, offset in enumerate(reference):
+                with self.subTest(s=s, py_index=py_index):
+                    self.assertEqual(index.py_to_utf16(py_index), offset)
+                    self.assertEqual(index.utf16_to_py(offset), py_index)
+
+    def test_inside_surrogate_pair(self):
+        index = Utf16Index("A📌B")
+        self.assertIsNone(index.utf16_to_py(2))
+        self.assertEqual(index.utf16_to_py(3), 2)
+
+    def test_out_of_range(self):
+        index = Utf16Index("abc")
+        self.assertIsNone(index.utf16_to_py(4))
+        self.assertIsNone(index.utf16_to_py(-1))
+
+    def test_slice(self):
+        text = "a📌b你📌c🇺🇸"
+        index = Utf16Index(text)
+        for start in range(len(text) + 1):
+            for end in range(start, len(text) + 1):
+                sliced = index.slice(start, end)
+                self.assertEqual(sliced.utf16_len, utf16_len(text[start:end]))
+                self.assertEqual(sliced._astral, Utf16Index(text[start:end])._astral)
+
+    def test_from_astral(self):
+        index = Utf16Index.from_astral([1], 3)
+        self.assertEqual(index.utf16_len, 4)
+        self.assertEqual(index.py_to_utf16(2), 3)
+
+    def test_utf16_to_py_floor(self):
+        for s in SAMPLES:
+            index = Utf16Index(s)
+            reference = _reference_offsets(s)
+            for offset in range(-1, reference[-1] + 2):
+                expected = max((i for i, o in enumerate(reference) if o <= offset), default=0)
+                with self.subTest(s=s, offset=offset):
+                    self.assertEqual(index.utf16_to_py_floor(offset), expected)
+
+    def test_is_bmp(self):
+        self.assertFalse(Utf16Index("a📌b📌c").is_bmp)
+        self.assertTrue(Utf16Index("abc").is_bmp)
+
+
+if __name__ == "__main__":
+    unittest.main()